@@ -0,0 +1,286 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import instrumentation
+from config import PAGE1_PATH
+from data_loading import load_trends_data
+from figures import build_continent_color_map, build_trends_grid
+from page_builders import DEFAULT_SPEED_MS, filter_trends, default_trends_state
+
+try:
+    import imageio_ffmpeg
+except ImportError:
+    imageio_ffmpeg = None
+
+try:
+    from bidi.algorithm import get_display
+except ImportError:
+    get_display = None
+
+# -------------------------
+# Offline export of the page 1 animation (GIF / MP4 / per-frame PNGs)
+# -------------------------
+# Same frames as the page: log GDP vs. sqrt cumulative olim, continent colors, bubble area from the
+# monthly count and the month in the background. Frames are drawn with matplotlib's Agg canvas
+# (no display needed) in a process pool, and encoded there too; the parent only writes the
+# finished frames to the output in order, with only a couple of frames per worker in flight.
+#
+#   python animation_export.py out.gif
+#   python animation_export.py out.mp4 --years 2020 2024 --continents אירופה --fps 12
+#   python animation_export.py frames/            (a folder -> one PNG per month)
+#
+# MP4 needs an ffmpeg binary (on PATH, or from the optional imageio-ffmpeg package).
+# matplotlib before 3.11 lays text out left to right, so there the Hebrew continent names are put in
+# visual order first (python-bidi when installed; the names are plain Hebrew, so reversing them
+# works too). From 3.11 matplotlib shapes right-to-left text itself and they are drawn as they are.
+
+EXPORT_WORKERS = int(os.environ.get("VIZ_EXPORT_WORKERS", "0")) or os.cpu_count() or 1
+EXPORT_WIDTH_PX = 1280
+EXPORT_HEIGHT_PX = 720
+EXPORT_DPI = 100
+EXPORT_WINDOW_PER_WORKER = 2
+
+SIZE_MAX_PX = 60  # same as size_max=60 on the page
+
+_style = None  # set in each worker by _init_worker
+
+
+def _init_worker(style):
+    global _style
+    import matplotlib
+    matplotlib.use("Agg")
+    version = tuple(int(p) for p in matplotlib.__version__.split(".")[:2] if p.isdigit())
+    _style = dict(style, bidi_native=version >= (3, 11))
+
+
+def _visual(text):
+    if _style["bidi_native"]:
+        return text
+    if get_display is not None:
+        return get_display(text)
+    return text[::-1] if any("\u0590" <= ch <= "\u05ff" for ch in text) else text
+
+
+def _draw_frame(frame):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    s = _style
+    fig = Figure(figsize=(s["width"] / s["dpi"], s["height"] / s["dpi"]), dpi=s["dpi"])
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0.07, 0.1, 0.9, 0.8])
+    ax.set_xlim(*s["x_range"])
+    ax.set_ylim(*s["y_range"])
+    ax.set_xlabel("Log(GDP + 1)")
+    ax.set_ylabel("Sqrt(Cumulative Immigrants)")
+    ax.text(0.5, 0.5, frame["month"], transform=ax.transAxes, ha="center", va="center",
+            fontsize=110, color=(0.78, 0.78, 0.78, 0.25), zorder=0)
+
+    # Plotly sizes area-mode markers as diameter = sqrt(size / sizeref) pixels; scatter wants points^2
+    px_to_pt = 72.0 / s["dpi"]
+    areas = (np.sqrt(frame["size"] / s["sizeref"]) * px_to_pt) ** 2
+    for continent, color in s["continents"]:
+        mask = frame["continent"] == continent
+        if mask.any():
+            ax.scatter(frame["x"][mask], frame["y"][mask], s=areas[mask], c=color, alpha=0.9,
+                       edgecolors="darkslategrey", linewidths=1, label=_visual(continent), zorder=2)
+        else:
+            ax.scatter([], [], c=color, label=_visual(continent))
+    ax.legend(loc="lower center", bbox_to_anchor=(0.5, 1.0), ncol=len(s["continents"]), frameon=False)
+
+    canvas.draw()
+    rgba = np.asarray(canvas.buffer_rgba())
+    return rgba[:, :, :3].copy()
+
+
+def _gif_frame_block(rgb, duration_ms):
+    # One self-contained GIF image block (own palette), so frames can be encoded in parallel
+    from PIL import GifImagePlugin, Image
+    frame = Image.fromarray(rgb).quantize(256, dither=Image.Dither.NONE)
+    return b"".join(GifImagePlugin.getdata(frame, duration=duration_ms, include_color_table=True))
+
+
+def _render(task):
+    kind, index, frame, arg = task
+    rgb = _draw_frame(frame)
+    if kind == "gif":
+        return _gif_frame_block(rgb, arg)
+    if kind == "png":
+        from PIL import Image
+        path = os.path.join(arg, f"frame_{index:04d}_{frame['month']}.png")
+        Image.fromarray(rgb).save(path)
+        return path
+    return rgb.tobytes()
+
+
+# -------------------------
+# Writers (fed one encoded frame at a time)
+# -------------------------
+
+class GifWriter:
+    def __init__(self, path, width, height, loop=0):
+        self.f = open(path, "wb")
+        # Logical screen without a global palette + NETSCAPE2.0 loop extension
+        self.f.write(b"GIF89a" + width.to_bytes(2, "little") + height.to_bytes(2, "little") + b"\x00\x00\x00")
+        self.f.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + loop.to_bytes(2, "little") + b"\x00")
+
+    def write(self, block):
+        self.f.write(block)
+
+    def close(self):
+        self.f.write(b";")
+        self.f.close()
+
+
+class FFmpegWriter:
+    def __init__(self, path, width, height, fps):
+        exe = shutil.which("ffmpeg") or (imageio_ffmpeg.get_ffmpeg_exe() if imageio_ffmpeg else None)
+        if exe is None:
+            raise RuntimeError("MP4 export needs ffmpeg on PATH (or `pip install imageio-ffmpeg`)")
+        self.proc = subprocess.Popen(
+            [exe, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+             "-s", f"{width}x{height}", "-r", f"{fps:g}", "-i", "-",
+             "-c:v", "libx264", "-pix_fmt", "yuv420p", "-movflags", "+faststart", path],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, raw):
+        self.proc.stdin.write(raw)
+
+    def close(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.proc.returncode}")
+
+
+class PngFolderWriter:
+    def __init__(self, path):
+        self.paths = []
+
+    def write(self, path):
+        self.paths.append(path)
+
+    def close(self):
+        pass
+
+
+# -------------------------
+# Export
+# -------------------------
+
+def _frames_and_style(grid, all_continents, width, height, dpi):
+    color_map = build_continent_color_map(all_continents)
+    present = set(grid["continent"])
+    style = {
+        "width": width, "height": height, "dpi": dpi,
+        "x_range": (grid["log_gdp"].min() * 0.98, grid["log_gdp"].max() * 1.02),
+        "y_range": (0, grid["sqrt_cumulative"].max() * 1.05),
+        "sizeref": 2.0 * grid["bubble_size"].max() / SIZE_MAX_PX ** 2,
+        "continents": [(c, color_map[c]) for c in all_continents if c in present],
+    }
+
+    def frames():
+        for month, rows in grid.groupby("month_str", sort=True):
+            yield {
+                "month": month,
+                "x": rows["log_gdp"].to_numpy(float), "y": rows["sqrt_cumulative"].to_numpy(float),
+                "size": rows["bubble_size"].to_numpy(float), "continent": rows["continent"].to_numpy(object),
+            }
+
+    return frames(), grid["month_str"].nunique(), style
+
+
+def export_animation(output, year_range=None, continents=None, countries=None, speed_ms=DEFAULT_SPEED_MS,
+                     fps=None, workers=EXPORT_WORKERS, width=EXPORT_WIDTH_PX, height=EXPORT_HEIGHT_PX,
+                     dpi=EXPORT_DPI, path=PAGE1_PATH):
+    # output: *.gif, *.mp4, or a folder for PNGs. Returns a report with the frame rate achieved.
+    df_merged = load_trends_data(path)[0]
+    default_years, all_continents, default_countries, _ = default_trends_state(df_merged)
+    year_range = tuple(year_range or default_years)
+    continents = list(continents or all_continents)
+    countries = list(countries or default_countries)
+
+    timeline, base_filtered = filter_trends(df_merged, year_range, continents)
+    countries = sorted(set(countries) & set(base_filtered["erez_moza"]))
+    grid = build_trends_grid(base_filtered, timeline, countries) if countries else None
+    if grid is None or grid.empty:
+        raise ValueError("no data for the chosen years / continents / countries")
+
+    fps = fps or 1000.0 / speed_ms
+    duration_ms = int(round(1000.0 / fps))
+    frames, n_frames, style = _frames_and_style(grid, all_continents, width, height, dpi)
+
+    if output.lower().endswith(".gif"):
+        kind, arg, writer = "gif", duration_ms, GifWriter(output, width, height)
+    elif output.lower().endswith(".mp4"):
+        kind, arg, writer = "raw", None, FFmpegWriter(output, width, height, fps)
+    else:
+        os.makedirs(output, exist_ok=True)
+        kind, arg, writer = "png", output, PngFolderWriter(output)
+
+    workers = max(1, min(workers, n_frames))
+    window = workers * EXPORT_WINDOW_PER_WORKER
+    start = time.perf_counter()
+    # spawn: forking a threaded server process (Streamlit) is not safe
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(style,)) as pool:
+            pending = deque()
+            for index, frame in enumerate(frames):
+                pending.append(pool.submit(_render, (kind, index, frame, arg)))
+                if len(pending) >= window:
+                    writer.write(pending.popleft().result())
+            while pending:
+                writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - start
+
+    instrumentation.record_timing("export.animation", seconds)
+    return {
+        "output": output, "format": kind if kind != "raw" else "mp4", "frames": n_frames,
+        "workers": workers, "seconds": round(seconds, 3),
+        "frames_per_second": round(n_frames / seconds, 2) if seconds else None,
+        "playback_fps": round(fps, 2), "size": [width, height],
+    }
+
+
+def export_gif_bytes(year_range, continents, countries, speed_ms, path=PAGE1_PATH):
+    # For the page's download button: render to a temporary file and hand back its bytes
+    fd, tmp_path = tempfile.mkstemp(suffix=".gif")
+    os.close(fd)
+    try:
+        report = export_animation(tmp_path, year_range, continents, countries, speed_ms, path=path)
+        with open(tmp_path, "rb") as f:
+            return f.read(), report
+    finally:
+        os.remove(tmp_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the page 1 animation to GIF / MP4 / PNG frames")
+    parser.add_argument("output", help="*.gif, *.mp4 or a folder for per-frame PNGs")
+    parser.add_argument("--years", nargs=2, type=int, metavar=("FROM", "TO"))
+    parser.add_argument("--continents", nargs="+")
+    parser.add_argument("--countries", nargs="+")
+    parser.add_argument("--speed-ms", type=int, default=DEFAULT_SPEED_MS, help="frame duration, as on the page")
+    parser.add_argument("--fps", type=float, help="playback rate (overrides --speed-ms)")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    parser.add_argument("--width", type=int, default=EXPORT_WIDTH_PX)
+    parser.add_argument("--height", type=int, default=EXPORT_HEIGHT_PX)
+    args = parser.parse_args()
+
+    report = export_animation(args.output, args.years, args.continents, args.countries, args.speed_ms,
+                              args.fps, args.workers, args.width, args.height)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,410 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import hot_reload
+import instrumentation
+import warmup
+from config import PATH_GEOJSON, PAGE1_PATH, PAGE2_PATH, PAGE3_PATH, PATH_DISTRICTS, PATH_RAW_OLIM
+from data_loading import load_trends_data, load_city_profiles, load_sankey_data
+from disk_cache import file_fingerprint, CODE_VERSION
+from figure_cache import FigureCache, make_key
+from country_similarity import load_similarity_index, similar_countries, archetype_members, archetype_of
+from waves import load_waves, waves_in_range
+from figures import build_trends_grid
+from page_builders import (
+    filter_trends, load_trends_defaults, SPEED_RANGE_MS, get_trends_figure, get_city_lines_figure, get_page2_map,
+    default_sankey_countries, get_sankey_figure, DEFAULT_MAP_VIEW,
+)
+
+# -------------------------
+# Local HTTP API over the page builders
+# -------------------------
+# Read-only JSON for other tools that embed the dashboards: the figures (plotly figure JSON, the
+# same cached entries the app draws) and the aggregated data behind them.
+#
+#   GET /ready                      -> 200 once the warm-up is done, 503 before (load balancer readiness)
+#   GET /api/v1                     -> the list of endpoints
+#   GET /api/v1/trends/figure       ?years=2015,2024&continents=...&countries=...&speed_ms=100   (50..500)
+#   GET /api/v1/trends/data         ?years=...&continents=...&countries=...   (the animation grid)
+#   GET /api/v1/trends/waves        ?years=...&countries=...&limit=50   (largest detected waves first)
+#   GET /api/v1/cities/data         ?ids=...                                   (city profiles)
+#   GET /api/v1/cities/lines        ?selection=...
+#   GET /api/v1/cities/map          ?selection=...&lat=...&lon=...&zoom=...  (districts when zoomed out)
+#   GET /api/v1/flows/figure        ?countries=...   (order matters: it picks the colors)
+#   GET /api/v1/flows/data          ?countries=...
+#   GET /api/v1/flows/similar       ?country=...&k=5   (similar occupation profiles + archetype)
+#
+# Lists are comma separated (or the parameter repeated); missing ones take the page's defaults.
+# Every response has a strong ETag: the hash of the code (disk_cache.CODE_VERSION), of the dataset
+# files it comes from and of the normalized parameters, so it can be computed (and a conditional
+# GET answered with 304) without building anything. Bodies are gzipped when the client accepts
+# it, and the encoded bodies are kept in a small LRU next to the app's figure cache (which the
+# figures themselves come from). With hot reload, each request uses the dataset version published
+# when it arrived (hot_reload.pinned).
+#
+#   python api_server.py [--host 127.0.0.1] [--port 8765]
+#   VIZ_API=1 -> also serve it from a background thread of the Streamlit process (shares its caches)
+#   VIZ_API_HOST / VIZ_API_PORT  (default 127.0.0.1:8765), VIZ_API_CACHE_MB (default 64)
+
+API_ENABLED = os.environ.get("VIZ_API") == "1"
+API_HOST = os.environ.get("VIZ_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("VIZ_API_PORT", "8765"))
+API_CACHE_MB = float(os.environ.get("VIZ_API_CACHE_MB", "64"))
+API_PREFIX = "/api/v1"
+READY_PATH = "/ready"
+GZIP_LEVEL = 6
+
+logger = logging.getLogger(__name__)
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+_started = False
+_started_lock = threading.Lock()
+
+
+class BadRequest(ValueError):
+    pass
+
+
+# -------------------------
+# Parameters
+# -------------------------
+
+def _list(query, name):
+    values = []
+    for raw in query.get(name, []):
+        values.extend(v.strip() for v in raw.split(",") if v.strip())
+    return values
+
+
+def _int(query, name, default):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[-1])
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+
+
+def _float(query, name, default):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        value = float(values[-1])
+    except ValueError:
+        raise BadRequest(f"{name} must be a number")
+    if not math.isfinite(value):
+        raise BadRequest(f"{name} must be a number")
+    return value
+
+
+def _trends_params(query):
+    # The defaults come from the dataset, but not every request has to derive them (a 304 builds nothing)
+    default_years, all_continents, default_countries, default_speed = load_trends_defaults(PAGE1_PATH)
+    try:
+        years = [int(y) for y in _list(query, "years")] if query.get("years") else list(default_years)
+    except ValueError:
+        years = []
+    if len(years) != 2 or years[0] > years[1]:
+        raise BadRequest("years must be FROM,TO")
+    continents = _list(query, "continents") or all_continents
+    countries = _list(query, "countries") or default_countries
+    speed_ms = _int(query, "speed_ms", default_speed)
+    if not SPEED_RANGE_MS[0] <= speed_ms <= SPEED_RANGE_MS[1]:
+        raise BadRequest(f"speed_ms must be between {SPEED_RANGE_MS[0]} and {SPEED_RANGE_MS[1]}")
+    return {"years": tuple(years), "continents": set(continents), "countries": set(countries),
+            "speed_ms": speed_ms}
+
+
+def _selection_params(query):
+    return {"selection": set(_list(query, "selection"))}
+
+
+def _map_params(query):
+    view = {"lat": _float(query, "lat", DEFAULT_MAP_VIEW["lat"]), "lon": _float(query, "lon", DEFAULT_MAP_VIEW["lon"]),
+            "zoom": _float(query, "zoom", DEFAULT_MAP_VIEW["zoom"])}
+    return {"selection": set(_list(query, "selection")), "map_view": view}
+
+
+def _flows_params(query):
+    countries = _list(query, "countries") or default_sankey_countries(load_sankey_data(PAGE3_PATH))
+    return {"countries": tuple(countries)}
+
+
+# -------------------------
+# Endpoints: path -> (dataset files, params parser, body builder returning JSON text or None)
+# -------------------------
+
+def _records(df):
+    return df.to_json(orient="records", force_ascii=False, date_format="iso")
+
+
+def _trends_data(p):
+    df_merged = load_trends_data(PAGE1_PATH)[0]
+    timeline, base_filtered = filter_trends(df_merged, p["years"], sorted(p["continents"]))
+    countries = sorted(p["countries"] & set(base_filtered["erez_moza"]))
+    if not countries:
+        return "[]"
+    grid = build_trends_grid(base_filtered, timeline, countries)
+    columns = ["month_str", "erez_moza", "continent", "monthly_count", "cumulative", "gdp"]
+    return _records(grid[[c for c in columns if c in grid.columns]].rename(columns={"month_str": "month"}))
+
+
+def _waves_params(query):
+    try:
+        years = [int(y) for y in _list(query, "years")] if query.get("years") else list(load_trends_defaults(PAGE1_PATH)[0])
+    except ValueError:
+        years = []
+    if len(years) != 2 or years[0] > years[1]:
+        raise BadRequest("years must be FROM,TO")
+    limit = _int(query, "limit", 50)
+    if limit < 1:
+        raise BadRequest("limit must be positive")
+    return {"years": tuple(years), "countries": set(_list(query, "countries")), "limit": limit}
+
+
+def _waves(p):
+    waves = waves_in_range(load_waves(PAGE1_PATH), p["years"], p["countries"] or None)
+    return _records(waves.head(p["limit"]))
+
+
+def _cities_data(p):
+    df_profile = load_city_profiles(PAGE2_PATH)
+    if p["ids"]:
+        df_profile = df_profile[df_profile["english_id"].isin(p["ids"])]
+    return _records(df_profile.drop(columns=["madad_jittered"], errors="ignore"))
+
+
+def _flows_data(p):
+    df_sankey = load_sankey_data(PAGE3_PATH)
+    return _records(df_sankey[df_sankey["erez_moza"].isin(p["countries"])])
+
+
+def _similar_params(query):
+    countries = _list(query, "country")
+    if len(countries) != 1:
+        raise BadRequest("country is required (one country)")
+    k = _int(query, "k", 5)
+    if not 1 <= k <= 10:
+        raise BadRequest("k must be between 1 and 10")
+    return {"country": countries[0], "k": k}
+
+
+def _similar(p):
+    index = load_similarity_index(PAGE3_PATH)
+    if p["country"] not in index["countries"]:
+        return None
+    archetype = archetype_of(index, p["country"])
+    return json.dumps({
+        "country": p["country"],
+        "similar": [{"country": c, "similarity": round(score, 4)} for c, score in similar_countries(index, p["country"], p["k"])],
+        "archetype": {"id": archetype, "name": index["archetype_names"][archetype],
+                      "countries": archetype_members(index, archetype)},
+    }, ensure_ascii=False)
+
+
+ENDPOINTS = {
+    "/trends/figure": ([PAGE1_PATH], _trends_params, lambda p: get_trends_figure(
+        p["years"], p["continents"], p["countries"], p["speed_ms"], as_json=True)),
+    "/trends/data": ([PAGE1_PATH], _trends_params, _trends_data),
+    "/trends/waves": ([PAGE1_PATH], _waves_params, _waves),
+    "/cities/data": ([PAGE2_PATH], lambda q: {"ids": set(_list(q, "ids"))}, _cities_data),
+    "/cities/lines": ([PAGE2_PATH], _selection_params, lambda p: get_city_lines_figure(sorted(p["selection"]), as_json=True)),
+    "/cities/map": ([PAGE2_PATH, PATH_GEOJSON, PATH_DISTRICTS, PATH_RAW_OLIM], _map_params, lambda p: get_page2_map(
+        sorted(p["selection"]), p["map_view"], as_json=True)),
+    "/flows/figure": ([PAGE3_PATH], _flows_params, lambda p: get_sankey_figure(p["countries"], as_json=True)),
+    "/flows/data": ([PAGE3_PATH], _flows_params, _flows_data),
+    "/flows/similar": ([PAGE3_PATH], _similar_params, _similar),
+}
+
+
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = FigureCache(API_CACHE_MB * 1024 * 1024, name="api_responses")
+            instrumentation.register_source("api_responses", _response_cache.stats)
+        return _response_cache
+
+
+def compute_etag(route, paths, params, encoding):
+    # Strong validator: same code + same dataset bytes + same normalized parameters + same encoding
+    # -> same body
+    key = make_key(route, CODE_VERSION, file_fingerprint(*paths), params)
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}-{encoding}"' if encoding != "identity" else f'"{digest}"'
+
+
+def render(route, query, gzip_ok):
+    # -> (status, etag, body bytes, content encoding); body None means "not found / nothing to draw"
+    paths, parse, build = ENDPOINTS[route]
+    params = parse(query)
+    encoding = "gzip" if gzip_ok else "identity"
+    etag = compute_etag(route, paths, params, encoding)
+
+    cache = get_response_cache()
+    body = cache.get((etag, encoding))
+    if body is None:
+        with instrumentation.timed(f"api.build{route.replace('/', '.')}"):
+            text = build(params)
+        if text is None:
+            return 404, etag, None, encoding
+        body = text.encode("utf-8")
+        if gzip_ok:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        cache.put((etag, encoding), body)
+    return 200, etag, body, encoding
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [t.strip() for t in header.split(",")]
+
+
+def accepts_gzip(header):
+    # Accept-Encoding with its q-values: "gzip;q=0" (or "*;q=0" without a gzip entry) refuses it
+    qualities = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    return qualities.get("gzip", qualities.get("x-gzip", qualities.get("*", 0.0))) > 0
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "VizAPI/1"
+    protocol_version = "HTTP/1.1"
+    serve_api = True
+
+    def _send(self, status, body=b"", headers=None, head_only=False):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and not head_only:
+            self.wfile.write(body)
+
+    def _send_json_error(self, status, message, head_only=False):
+        body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, {"Content-Type": "application/json; charset=utf-8"}, head_only)
+
+    def _handle(self, head_only):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        if path == READY_PATH:
+            # For load balancers: 200 once the warm-up has finished, 503 until then
+            body = json.dumps(warmup.get_report(), ensure_ascii=False).encode("utf-8")
+            return self._send(200 if warmup.is_ready() else 503, body,
+                              {"Content-Type": "application/json; charset=utf-8", "Cache-Control": "no-store"}, head_only)
+        if not self.serve_api:
+            return self._send_json_error(404, "unknown endpoint", head_only)
+        if path == API_PREFIX:
+            body = json.dumps({"endpoints": [API_PREFIX + r for r in ENDPOINTS]}).encode("utf-8")
+            return self._send(200, body, {"Content-Type": "application/json"}, head_only)
+        route = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else None
+        if route not in ENDPOINTS:
+            return self._send_json_error(404, "unknown endpoint", head_only)
+
+        query = parse_qs(url.query)
+        gzip_ok = accepts_gzip(self.headers.get("Accept-Encoding"))
+        try:
+            paths, parse, _ = ENDPOINTS[route]
+            etag = compute_etag(route, paths, parse(query), "gzip" if gzip_ok else "identity")
+            if etag_matches(self.headers.get("If-None-Match"), etag):
+                instrumentation.incr("api.not_modified")
+                return self._send(304, headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+
+            status, etag, body, encoding = render(route, query, gzip_ok)
+        except BadRequest as e:
+            return self._send_json_error(400, str(e), head_only)
+        except Exception:
+            logger.exception("API request failed: %s", self.path)
+            return self._send_json_error(500, "internal error", head_only)
+
+        if body is None:
+            return self._send_json_error(404, "no data for these parameters", head_only)
+        instrumentation.incr("api.ok")
+        headers = {"Content-Type": "application/json; charset=utf-8", "ETag": etag,
+                   "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if encoding == "gzip":
+            headers["Content-Encoding"] = "gzip"
+        self._send(status, body, headers, head_only)
+
+    def do_GET(self):
+        with hot_reload.pinned():
+            self._handle(head_only=False)
+
+    def do_HEAD(self):
+        with hot_reload.pinned():
+            self._handle(head_only=True)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class ReadinessHandler(ApiHandler):
+    # Only /ready (serve.py without VIZ_API=1)
+    serve_api = False
+
+
+def make_server(host=API_HOST, port=API_PORT, readiness_only=False):
+    server = ThreadingHTTPServer((host, port), ReadinessHandler if readiness_only else ApiHandler)
+    server.daemon_threads = True
+    return server
+
+
+def start_background_server(host=API_HOST, port=API_PORT, readiness_only=False):
+    # Idempotent, like the warm-up: only the first call of the process (serve.py, or else the
+    # first script run) starts it
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    try:
+        server = make_server(host, port, readiness_only)
+    except OSError as e:
+        logger.warning("API server not started on %s:%s: %s", host, port, e)
+        return
+    threading.Thread(target=server.serve_forever, name="api-server", daemon=True).start()
+    logger.info("%s listening on http://%s:%s%s", "Readiness check" if readiness_only else "API server",
+                host, port, READY_PATH if readiness_only else API_PREFIX)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the dashboard figures and data as JSON")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    httpd = make_server(args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}{API_PREFIX}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,17 +1,34 @@
 import pandas as pd
 import streamlit as st
-import plotly.express as px
-import numpy as np
-import plotly.graph_objects as go
-import json
 import matplotlib
-import matplotlib.cm as cm
 matplotlib.use('Agg') # to not open new window when using matplotlib
-import matplotlib.colors as mcolors
-import colorsys # Required for shading
-from PIL import Image
 import os
-from plotly.colors import sample_colorscale
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import instrumentation
+import memory_accounting
+import warmup
+import hot_reload
+import api_server
+import explorer
+from summary import load_summary
+from disk_cache import file_fingerprint
+from image_variants import load_hero_image, column_fraction, picture_html
+from data_loading import load_trends_data, load_city_profiles, load_sankey_data, load_geojson
+from animation_export import export_gif_bytes
+from client_trends import trends_player
+from city_brush import city_brush
+from districts import load_districts, district_view
+from country_selection import load_country_index
+from country_similarity import load_similarity_index, similar_countries, archetype_members, archetype_of
+from waves import load_waves, waves_in_range
+from figures import build_continent_color_map, build_trends_grid, city_draw_order
+from partitions import trends_manifest, load_trends_range, manifest_years
+from page_builders import (
+    DEFAULT_SPEED_MS, SPEED_RANGE_MS, filter_trends, default_trends_countries, get_trends_figure, get_country_map,
+    default_sankey_countries, get_sankey_figure, get_city_lines_figure, get_page2_map, submit_figures,
+    DEFAULT_MAP_VIEW, is_district_view,
+)
 
 # -------------------------
 # Page setup
@@ -21,17 +38,33 @@ from plotly.colors import sample_colorscale
 # Configuration
 # -------------------------
 
-PATH_GEOJSON = "datasets/israel_map.geojson"
+from config import (
+    PATH_GEOJSON, PAGE1_PATH, PAGE2_PATH, PAGE3_PATH, PATH_SUMMARY,
+    PATH_SHIP, PATH_PLANE_ETHIOPIA, PATH_PLANE_MODERN,
+)
+
+# Set VIZ_INSTRUMENTATION=1 to show cache/timing counters in the sidebar
+SHOW_INSTRUMENTATION = os.environ.get("VIZ_INSTRUMENTATION") == "1"
 
-PAGE1_PATH = "datasets/page1_final.csv"
+# Page 1 starts in browser-side filtering mode unless VIZ_CLIENT_TRENDS=0
+CLIENT_TRENDS_DEFAULT = os.environ.get("VIZ_CLIENT_TRENDS", "1") == "1"
 
-PAGE2_PATH = "datasets/page2_final.csv"
+# Set VIZ_WARMUP=1 to precompute datasets and default figures in the background on the first
+# script run, instead of on each page's first visitor. Behind a load balancer use `python serve.py`:
+# it starts the warm-up with the process and serves the readiness check (no-op here then)
+if warmup.WARMUP_ENABLED:
+    warmup.start_background_warmup()
 
-PAGE3_PATH = "datasets/page3_final.csv"
+# Set VIZ_API=1 to also serve the figures / data as JSON (api_server.py) from this process
+if api_server.API_ENABLED:
+    api_server.start_background_server()
 
-PATH_SHIP = "pictures/exodus.png"
-PATH_PLANE_ETHIOPIA = "pictures/ethiopia.png"
-PATH_PLANE_MODERN = "pictures/current.png"
+# Set VIZ_HOT_RELOAD=1 to pick up refreshed datasets without a restart (hot_reload.py). Either
+# way, this run uses one dataset version from here to the end (the st.cache_data wrappers below
+# take it as an argument, so a new version is a new entry)
+if hot_reload.HOT_RELOAD_ENABLED:
+    hot_reload.start_background_watcher()
+hot_reload.pin_run()
 
 # ==============================================================================
 # PAGE 1: IMMIGRATION TRENDS
@@ -119,6 +152,11 @@ st.markdown("""
         text-align: right;
     }
 
+    /* Home page pictures (image_variants.picture_html), drawn like st.image with its caption */
+    .hero-picture { margin: 0 0 1rem 0; }
+    .hero-picture img { width: 100%; height: auto; display: block; }
+    .hero-picture figcaption { text-align: center; font-size: 14px; color: rgba(49, 51, 63, 0.6); margin-top: 0.375rem; }
+
     /* Custom Page Headers */
     .main-header {
         font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif;
@@ -181,23 +219,37 @@ st.sidebar.title("תפריט ראשי")
 
 page = st.sidebar.radio(
     "עבור אל", 
-    ["דף הבית", "מגמות עלייה ממדינות מוצא", "מגמות קליטה לפי יישובים", "תחומי תעסוקה של עולים לפי מדינת מוצא"],
+    ["דף הבית", "מגמות עלייה ממדינות מוצא", "מגמות קליטה לפי יישובים", "תחומי תעסוקה של עולים לפי מדינת מוצא",
+     "סייר נתונים"],
     label_visibility="collapsed",
     key="main_navigation_radio" # <--- This unique key prevents the error
 )
 
-if page == "דף הבית":
-    
-    # Function to safely load images
-    def load_image(path):
-        if os.path.exists(path):
-            return Image.open(path)
-        return None
+# Set VIZ_MEMORY_ACCOUNTING=1 to sample this session's state size (as the previous rerun left it:
+# memory_accounting charges new keys to that rerun's page)
+if memory_accounting.MEMORY_ACCOUNTING_ENABLED:
+    ctx = get_script_run_ctx()
+    memory_accounting.record_session(ctx.session_id if ctx else None, page, st.session_state.to_dict())
 
+# Process-wide counters (shown as of the previous rerun, since this renders before the page)
+if SHOW_INSTRUMENTATION:
+    with st.sidebar.expander("מדדי ביצועים"):
+        st.json(instrumentation.snapshot())
 
-    img_ship = load_image(PATH_SHIP)
-    img_plane_ethiopia = load_image(PATH_PLANE_ETHIOPIA)
-    img_plane_modern = load_image(PATH_PLANE_MODERN)
+if page == "דף הבית":
+    
+    # Pre-resized variants: a <picture> the browser picks the size and format from (served from
+    # ./static), or bytes of the one sized for the column when static serving is off
+    HIST_COLUMNS, MOD_COLUMNS = [1, 1], [2, 3]
+
+    def hero_image(path, fraction, caption):
+        markup = picture_html(path, fraction, caption) if st.get_option("server.enableStaticServing") else None
+        if markup:
+            st.markdown(markup, unsafe_allow_html=True)
+            return
+        img = load_hero_image(path, fraction)
+        if img:
+            st.image(img, caption=caption, use_container_width=True)
 
     # --- Header ---
     st.markdown('<div class="main-header">המסע הביתה</div>', unsafe_allow_html=True)
@@ -207,11 +259,10 @@ if page == "דף הבית":
     # --- Historical Section ---
     st.markdown('<div class="section-title">מורשת היסטורית</div>', unsafe_allow_html=True)
 
-    col_hist_right, col_hist_left = st.columns([1, 1])
+    col_hist_right, col_hist_left = st.columns(HIST_COLUMNS)
 
     with col_hist_left:
-        if img_ship:
-            st.image(img_ship, caption="ההתחלה: הגעה דרך הים (אוניית מעפילים היסטורית)", use_container_width=True)
+        hero_image(PATH_SHIP, column_fraction(HIST_COLUMNS, 1), "ההתחלה: הגעה דרך הים (אוניית מעפילים היסטורית)")
         st.markdown("""
         מאז הקמת המדינה, העלייה היא ליבה הפועם של ישראל. 
         מאוניות המעפילים החשאיות של שנות ה-40, דרך גלי העלייה הגדולים מאירופה וארצות ערב.
@@ -219,8 +270,7 @@ if page == "דף הבית":
         """)
 
     with  col_hist_right:
-        if img_plane_ethiopia:
-            st.image(img_plane_ethiopia, caption="מבצע שלמה: הגעה ברכבת אווירית", use_container_width=True)
+        hero_image(PATH_PLANE_ETHIOPIA, column_fraction(HIST_COLUMNS, 0), "מבצע שלמה: הגעה ברכבת אווירית")
         st.markdown("""
         בשנות ה-80 וה-90, התבצעו מבצעים אוויריים נועזים להעלאת יהודי אתיופיה וברית המועצות לשעבר.
         תמונות אלו הן עדות למחויבות המתמשכת של מדינת ישראל לקיבוץ גלויות.
@@ -229,11 +279,10 @@ if page == "דף הבית":
     # --- Modern Era Section ---
     st.markdown('<div class="section-title">הפרק הנוכחי: העידן המודרני (2015-2024)</div>', unsafe_allow_html=True)
 
-    col_mod_right, col_mod_left = st.columns([2, 3])
+    col_mod_right, col_mod_left = st.columns(MOD_COLUMNS)
 
     with col_mod_right:
-        if img_plane_modern:
-            st.image(img_plane_modern, caption="עלייה מודרנית: עולים חדשים מרוסיה נוחתים בישראל", use_container_width=True)
+        hero_image(PATH_PLANE_MODERN, column_fraction(MOD_COLUMNS, 0), "עלייה מודרנית: עולים חדשים מרוסיה נוחתים בישראל")
 
     with col_mod_left:
         st.markdown("""
@@ -314,13 +363,22 @@ if page == "דף הבית":
     with c_stats_left:
         st.info(" **הצצה לנתונים**")
 
-        # Mock Data Variables (Replace with your logic)
-        total_olim_heb = 360000     
-        top_country_heb = "רוסיה (159,748)"
-        
+        # Precomputed with the datasets (datasets/summary.json); recomputed only if it is stale,
+        # and then once per dataset version, not on every rerun of the home page
+        @st.cache_data(show_spinner=False, max_entries=2)
+        def load_home_summary(version):
+            return load_summary(PATH_SUMMARY, PAGE1_PATH, PAGE2_PATH)
+
+        summary, summary_fresh = load_home_summary(file_fingerprint(PAGE1_PATH, PAGE2_PATH))
+        total_olim_heb = summary["total_olim"]
+        top_country = summary["top_countries"][0]
+        top_country_heb = f"{top_country['name']} ({top_country['olim']:,})"
+        top_cities_heb = "<br>".join(f"{i}. {c['name']} ({c['olim']:,})"
+                                       for i, c in enumerate(summary["top_yeshuvim"][:3], start=1))
+
         st.markdown(f"""
         <div class="metric-container">
-            <div class="metric-label">סה"כ עולים שנותחו (2015-2024)</div>
+            <div class="metric-label">סה"כ עולים שנותחו ({summary['years'][0]}-{summary['years'][1]})</div>
             <div class="metric-value-large">{total_olim_heb:,}</div>
         </div>
         """, unsafe_allow_html=True)
@@ -332,17 +390,18 @@ if page == "דף הבית":
         </div>
         """, unsafe_allow_html=True)
 
-        st.markdown("""
+        st.markdown(f"""
         <div class="metric-container">
             <div class="metric-label">3 הערים עם הכי הרבה עולים</div>
             <div class="metric-value-list">
-                1. תל אביב (44,406)<br>
-                2. נתניה (38,607)<br>
-                3. חיפה (36,264)
+                {top_cities_heb}
             </div>
         </div>
         """, unsafe_allow_html=True)
 
+        if not summary_fresh:
+            st.caption("סיכום הנתונים חושב כעת (קובץ הסיכום אינו תואם לגרסת הנתונים)")
+
 
 
 elif page == "מגמות עלייה ממדינות מוצא":
@@ -354,69 +413,74 @@ elif page == "מגמות עלייה ממדינות מוצא":
         st.title("עלייה לאורך השנים")
         st.caption("")
 
-    @st.cache_data(show_spinner=False)
-    def load_and_process_data(PAGE1_PATH):
+    @st.cache_data(show_spinner=False, max_entries=2)
+    def load_and_process_data(PAGE1_PATH, version):
         try:
-            # We explicitly tell pandas to parse 'date' as dates
-            df = pd.read_csv(PAGE1_PATH, parse_dates=["date"])
-            hebrew_to_english = {}
-            if "Country" in df.columns:
-                temp_map = df[["erez_moza", "Country"]].dropna().drop_duplicates(subset=["erez_moza"])
-                hebrew_to_english = temp_map.set_index("erez_moza")["Country"].to_dict()
+            df, hebrew_to_english, _ = load_trends_data(PAGE1_PATH)
             return df, hebrew_to_english, None
         except Exception as e:
-            return None, None, None, f"Error loading Aggregated Immigration data: {e}"
+            return None, None, f"Error loading Aggregated Immigration data: {e}"
 
 
-    df_merged, hebrew_to_english, error = load_and_process_data(PAGE1_PATH)
+    @st.cache_data(show_spinner=False, max_entries=16)
+    def load_year_range(year_range, PAGE1_PATH, version):
+        return load_trends_range(year_range, PAGE1_PATH)
 
-    if error:
-        st.error(error)
-        st.stop()
+    # Years and continents come from the partition manifest; the rows themselves are read only
+    # for the chosen years (the browser-side chart needs the full history, so it loads everything)
+    manifest = trends_manifest(PAGE1_PATH)
+    min_year, max_year = manifest_years(manifest)
+    all_continents = manifest["values"]["continent"]
 
-    st.markdown("### פילטרים")
-    c1, c2, c3 = st.columns([2, 2, 3])
+    # In browser mode the years/speed/continent controls live inside the chart component and filter
+    # there; the script only reruns when the component saves its state (or the country list changes)
+    client_mode = st.toggle("סינון בדפדפן", value=CLIENT_TRENDS_DEFAULT, key="trends_client_mode")
 
-    min_date = df_merged["date"].min()
-    max_date = df_merged["date"].max()
+    if client_mode:
+        client_state = st.session_state.get("trends_player") or {
+            "year_range": [min_year, max_year],
+            "speed_ms": DEFAULT_SPEED_MS,
+            "continents": all_continents,
+        }
+        year_range = tuple(client_state["year_range"])
+        speed_ms = client_state["speed_ms"]
+        selected_continents = client_state["continents"]
 
-    with c1:
-        year_range = st.slider(
-            "תחום שנים",
-            int(min_date.year),
-            int(max_date.year),
-            (int(min_date.year), int(max_date.year))
-        )
+        df_merged, hebrew_to_english, error = load_and_process_data(PAGE1_PATH, file_fingerprint(PAGE1_PATH))
+        if error:
+            st.error(error)
+            st.stop()
+        df_scope = df_merged
+    else:
+        st.markdown("### פילטרים")
+        c1, c2, c3 = st.columns([2, 2, 3])
+
+        with c1:
+            year_range = st.slider(
+                "תחום שנים",
+                min_year,
+                max_year,
+                (min_year, max_year)
+            )
 
-    with c2:
-        speed_ms = st.slider("מהירות אנימציה (מילישניות)", 50, 500, 100, step=10)
+        with c2:
+            speed_ms = st.slider("מהירות אנימציה (מילישניות)", *SPEED_RANGE_MS, DEFAULT_SPEED_MS, step=10)
 
-    with c3:
-        all_continents = sorted(df_merged["continent"].unique())
-        selected_continents = st.multiselect("יבשות", all_continents, default=all_continents)
+        with c3:
+            selected_continents = st.multiselect("יבשות", all_continents, default=all_continents)
 
-    timeline = pd.date_range(
-        start=f"{year_range[0]}-01-01",
-        end=f"{year_range[1]}-12-01",
-        freq="MS"
-    )
+        df_scope = load_year_range(tuple(year_range), PAGE1_PATH, file_fingerprint(PAGE1_PATH))
 
-    base_filtered = df_merged[
-        (df_merged["date"].isin(timeline)) &
-        (df_merged["continent"].isin(selected_continents))
-    ].copy()
+    timeline, base_filtered = filter_trends(df_scope, year_range, selected_continents)
 
-    if base_filtered.empty:
+    if client_mode:
+        # The checklist offers every country; the browser skips those outside the chosen continents/years
+        country_pool = df_scope
+    elif base_filtered.empty:
         st.warning("לא נמצאו נתוני עלייה.")
         st.stop()
-
-    default_colors = px.colors.qualitative.Plotly
-    color_map = {continent: default_colors[i % len(default_colors)]
-                 for i, continent in enumerate(all_continents)}
-    if "צפון אמריקה" in color_map: color_map["צפון אמריקה"] = "#FFEA00"
-    elif "North America" in color_map: color_map["North America"] = "#FFEA00"
-    if "אוקיאניה" in color_map: color_map["אוקיאניה"] = "#D70040"
-    if "אירופה" in color_map: color_map["אירופה"] = "#4169E1"
+    else:
+        country_pool = base_filtered
 
     col_chart, col_right = st.columns([5, 1.5])
 
@@ -424,237 +488,105 @@ elif page == "מגמות עלייה ממדינות מוצא":
         map_placeholder = st.empty()
         st.markdown("#### בחר מדינות")
 
-        country_stats = base_filtered.groupby("erez_moza")["monthly_count"].sum().sort_values(ascending=False)
-        all_countries_sorted = sorted(base_filtered["erez_moza"].unique())
-        default_top_25 = set(country_stats.index.tolist()[:25])
+        country_index = load_country_index(PAGE1_PATH)
+        pool_mask = country_index.mask_of(country_pool["erez_moza"].unique())
 
-        for country in all_countries_sorted:
-            key = f"chk_{country}"
-            if key not in st.session_state:
-                st.session_state[key] = country in default_top_25
+        # The whole selection is one bitset over the country codes (see country_selection.py)
+        if "trends_selection" not in st.session_state:
+            st.session_state.trends_selection = country_index.mask_of(default_trends_countries(country_pool))
+            st.session_state.trends_editor_version = 0
 
-        search_query = st.text_input("חפש מדינה", "", placeholder="הקלד לסינון...")
-        visible_countries = [c for c in all_countries_sorted if search_query.lower() in c.lower()]
+        def visible_mask():
+            return country_index.search(st.session_state.get("trends_search", "")) & pool_mask
 
-        btn_col1, btn_col2 = st.columns(2)
-        if btn_col1.button("בחר הכל"):
-            for country in visible_countries: st.session_state[f"chk_{country}"] = True
-            st.rerun()
-        if btn_col2.button("הסר הכל"):
-            for country in visible_countries: st.session_state[f"chk_{country}"] = False
-            st.rerun()
-
-        selected_countries = []
-        with st.container(height=350):
-            for country in visible_countries:
-                st.checkbox(country, key=f"chk_{country}")
-
-        for country in all_countries_sorted:
-            if st.session_state.get(f"chk_{country}", False):
-                selected_countries.append(country)
+        def bulk_select(on):
+            # Runs before the script, so the checklist below already shows the result (no st.rerun)
+            if on:
+                st.session_state.trends_selection |= visible_mask()
+            else:
+                st.session_state.trends_selection &= ~visible_mask()
+            st.session_state.trends_editor_version += 1
 
-        if not selected_countries:
-            st.warning("Please select at least one country.")
-            st.stop()
+        st.text_input("חפש מדינה", "", placeholder="הקלד לסינון...", key="trends_search")
+        visible = visible_mask()
 
-        map_data = (
-            base_filtered.groupby(["erez_moza", "continent"], as_index=False)["monthly_count"]
-            .sum()
-            .rename(columns={"monthly_count": "total_immigrants"})
-        )
-        map_data["english_name"] = map_data["erez_moza"].map(hebrew_to_english)
-        map_data["fmt_total"] = map_data["total_immigrants"].apply(lambda x: "{:,.0f}".format(x))
-        map_selected = map_data[map_data["erez_moza"].isin(selected_countries)]
-
-        map_hovertemplate = (
-            "<b>%{customdata[2]}</b><br>" +
-            "<span style='font-size: 10px; color: #666;'>%{customdata[0]}</span><br>" +
-            "<extra></extra>"
+        btn_col1, btn_col2 = st.columns(2)
+        btn_col1.button("בחר הכל", on_click=bulk_select, args=(True,))
+        btn_col2.button("הסר הכל", on_click=bulk_select, args=(False,))
+
+        visible_countries = country_index.names_of(visible)
+        selection = st.session_state.trends_selection
+        checklist = pd.DataFrame({
+            "בחר": [bool(selection >> country_index.codes[c] & 1) for c in visible_countries],
+            "מדינה": visible_countries,
+            "Country": [country_index.english[country_index.codes[c]] for c in visible_countries],
+        })
+        # The editor's key follows the rows it shows: its pending edits are already folded into the
+        # bitset, and must not be replayed onto a different list after a search or bulk change
+        edited = st.data_editor(
+            checklist, key=f"trends_checklist_{st.session_state.trends_editor_version}_{visible}",
+            height=350, hide_index=True, use_container_width=True, disabled=["מדינה", "Country"],
         )
+        checked = country_index.mask_of(edited.loc[edited["בחר"], "מדינה"])
+        st.session_state.trends_selection = (selection & ~visible) | checked
 
-        if not map_data.empty:
-            fig_map = go.Figure()
-            fig_map.update_geos(
-                showland=True, landcolor="#E0E0E0", showcountries=True,
-                countrycolor="white", projection_type="natural earth",
-                showframe=False, showcoastlines=False
-            )
-            base_choropleth = px.choropleth( #TODO
-                map_data, locations="english_name", locationmode="country names",
-                color="continent", color_discrete_map=color_map,
-                category_orders={"continent": all_continents},
-                hover_data=["continent", "fmt_total", "erez_moza"]
-            )
-            for trace in base_choropleth.data:
-                trace.marker.opacity = 0.2
-                trace.showlegend = False
-                trace.hovertemplate = map_hovertemplate
-                fig_map.add_trace(trace)
-
-            if not map_selected.empty:
-                highlight_choropleth = px.choropleth(
-                    map_selected, locations="english_name", locationmode="country names",
-                    color="continent", color_discrete_map=color_map,
-                    category_orders={"continent": all_continents},
-                    hover_data=["continent", "fmt_total", "erez_moza"]
-                )
-                for trace in highlight_choropleth.data:
-                    trace.marker.opacity = 1.0
-                    trace.showlegend = False
-                    trace.hovertemplate = map_hovertemplate
-                    fig_map.add_trace(trace)
-
-            fig_map.update_layout(
-                height=200, margin=dict(l=0, r=0, t=0, b=0),
-                showlegend=False, geo=dict(projection_scale=1.2)
-            )
-            map_placeholder.plotly_chart(fig_map, use_container_width=True)
-
-    base_final = base_filtered[base_filtered["erez_moza"].isin(selected_countries)]
-    grid = pd.MultiIndex.from_product(
-        [timeline, selected_countries], names=["date", "erez_moza"]
-    ).to_frame(index=False)
+        selected_countries = country_index.names_of(st.session_state.trends_selection & pool_mask)
 
-    grid = grid.merge(base_final, on=["date", "erez_moza"], how="left")
-    
-    # Fill missing immigration counts with 0 (months with no immigrants)
-    grid["monthly_count"] = grid["monthly_count"].fillna(0)
-    
-    # Map continent to ensure the grid has it (using the map created from base_filtered)
-    country_continent_map = base_filtered.groupby("erez_moza")["continent"].first()
-    grid["continent"] = grid["erez_moza"].map(country_continent_map)
-
-    grid = grid.dropna(subset=["gdp"])
-
-    if grid.empty:
-        st.error("No overlapping data found.")
-        st.stop()
-
-    grid = grid.sort_values(["erez_moza", "date"])
-    grid["cumulative"] = grid.groupby("erez_moza")["monthly_count"].cumsum()
-    grid["log_gdp"] = np.log1p(grid["gdp"])
-    grid["sqrt_cumulative"] = np.sqrt(grid["cumulative"])
-    grid["bubble_size"] = grid["monthly_count"].clip(lower=1) ** 0.6
-    grid["month_str"] = grid["date"].dt.strftime("%Y-%m")
+        if not selected_countries:
+            st.warning("Please select at least one country.")
+            st.stop()
 
-    grid["fmt_gdp"] = grid["gdp"].apply(lambda x: "${:,.0f}".format(x))
-    grid["fmt_cum"] = grid["cumulative"].apply(lambda x: "{:,.0f}".format(x))
-    grid["fmt_monthly"] = grid["monthly_count"].apply(lambda x: "{:,.0f}".format(x))
+        # Cached base layer + highlight; moving only the speed slider reuses the same figure
+        fig_map = get_country_map(selected_continents, selected_countries, PAGE1_PATH)
+        map_placeholder.plotly_chart(fig_map, use_container_width=True)
+
+    if client_mode:
+        with col_chart:
+            st.subheader("""גרף אינטראקטיבי של עלייה מול תל"ג""")
+            trends_player(selected_countries, build_continent_color_map(all_continents), client_state,
+                          key="trends_player", path=PAGE1_PATH)
+    else:
+        show_waves = st.session_state.get("trends_show_waves", True)
+        fig = get_trends_figure(year_range, selected_continents, selected_countries, speed_ms, PAGE1_PATH,
+                                show_waves=show_waves)
+
+        if fig is None:
+            st.error("No overlapping data found.")
+            st.stop()
 
-    x_min, x_max = grid["log_gdp"].min(), grid["log_gdp"].max()
-    y_max = grid["sqrt_cumulative"].max()
-    x_range = [x_min * 0.98, x_max * 1.02]
-    y_range = [0, y_max * 1.05]
+        with col_chart:
+            st.subheader("""גרף אינטראקטיבי של עלייה מול תל"ג""")
+            st.plotly_chart(fig, use_container_width=True)
+            st.checkbox("סמן גלי עלייה", value=True, key="trends_show_waves",
+                        help="מדינות שבחודש המוצג נמצאות בגל עלייה חריג ביחס ל-12 החודשים שלפניו")
 
     with col_chart:
-        st.subheader("""גרף אינטראקטיבי של עלייה מול תל"ג""")
-        
-        # 1. Create the base chart
-        # We preserve your exact configuration here
-        fig = px.scatter( #TODO
-            grid, x="log_gdp", y="sqrt_cumulative", color="continent",
-            color_discrete_map=color_map, size="bubble_size", size_max=60,
-            animation_frame="month_str", animation_group="erez_moza",
-            hover_name="erez_moza",
-            hover_data={"continent": True, "fmt_cum": True, "fmt_monthly": True, "fmt_gdp": True,
-                        "log_gdp": False, "sqrt_cumulative": False, "bubble_size": False, "month_str": False},
-            labels={"log_gdp": "Log(GDP + 1)", "sqrt_cumulative": "Sqrt(Cumulative Immigrants)", "continent": ""},
-            category_orders={"continent": all_continents}
-        )
-
-        # 2. Define custom hover template
-        my_hover_template = (
-            "<b>%{hovertext}</b><br>" +
-            "<span style='font-size: 10px; color: #666;'>%{customdata[0]}</span><br><br>" +
-            "סך העולים: <b>%{customdata[1]}</b><br>" +
-            "עולים חודשיים: <b>%{customdata[2]}</b><br>" +
-            "תל\"ג (שנתי): <b>%{customdata[3]}</b>" +
-            "<extra></extra>"
-        )
-        
-        # Apply hover template to the existing bubbles (Trace 0) BEFORE we add the text
-        fig.update_traces(hovertemplate=my_hover_template, marker=dict(opacity=0.9, line=dict(width=1, color='DarkSlateGrey')))
-
-        # 3. Calculate Position for Background Text
-        # MOVED: Set to 0.5 (Center) instead of 0.02 (Left)
-        text_x_pos = x_range[0] + (x_range[1] - x_range[0]) * 0.5
-        text_y_pos = y_range[1] * 0.5
-        
-        # 4. Create the Background Text Trace
-        background_text_trace = go.Scatter(
-            x=[text_x_pos],
-            y=[text_y_pos],
-            text=[grid["month_str"].min()],
-            mode="text",
-            textfont=dict(size=160, color="rgba(200, 200, 200, 0.25)"), # Slightly transparent
-            textposition="middle center", # Centers the text on the coordinates
-            hoverinfo="skip", # CRITICAL: Ensures hovering the year doesn't break things
-            showlegend=False
-        )
-
-        # 5. Add trace and Reorder safely to fix ValueError
-        fig.add_trace(background_text_trace)
-        # Move the last trace (text) to the front (index 0) so it is behind bubbles
-        fig.data = fig.data[-1:] + fig.data[:-1]
-
-        # 6. Update all Animation Frames
-        for frame in fig.frames:
-            # Create the text trace for this specific frame
-            frame_text_trace = go.Scatter(
-                x=[text_x_pos],
-                y=[text_y_pos],
-                text=[frame.name],
-                mode="text",
-                textfont=dict(size=160, color="rgba(200, 200, 200, 0.25)"),
-                textposition="middle center",
-                hoverinfo="skip",
-                showlegend=False
-            )
-            # Insert text trace at index 0 for every frame to match fig.data
-            frame.data = (frame_text_trace,) + frame.data
-            
-            # Re-apply hover template to bubbles (now at index 1)
-            for trace in frame.data:
-                if trace.mode != "text":
-                    trace.hovertemplate = my_hover_template
-
-        # 7. Configure Layout
-        fig.update_layout(
-            height=700, 
-            margin=dict(l=20, r=20, t=90, b=130),
-            xaxis=dict(range=x_range, title="""לוגריתם תל"ג"""),
-            yaxis=dict(range=y_range, title="שורש כמות העולים המצטברת"),
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-            hoverlabel=dict(align="right")
-        )
-
-        # 8. Optimization: Enable smooth animation
-        if fig.layout.updatemenus:
-            btn = fig.layout.updatemenus[0].buttons[0]
-            btn.args[1]["frame"]["duration"] = speed_ms
-            btn.args[1]["transition"]["duration"] = max(0, int(speed_ms * 0.5))
-            btn.args[1]["frame"]["redraw"] = False  # Smooth animation
-
-        if fig.layout.sliders:
-            fig.layout.sliders[0].currentvalue = {"visible": False}
-            fig.layout.sliders[0].pad = {"t": 90}
-            for step in fig.layout.sliders[0].steps:
-                step["args"][1]["frame"]["redraw"] = False
-
-        # Static annotation for Legend Title
-        fig.add_annotation(
-            text="<b>יבשות</b>",
-            xref="paper", yref="paper",
-            x=1.0, y=1.05,
-            xanchor="right", yanchor="bottom",
-            showarrow=False,
-            font=dict(size=14)
-        )
-
-        st.plotly_chart(fig, use_container_width=True)
+        # Offline copy of the animation for reports (rendered with matplotlib in a process pool)
+        if st.button("ייצוא אנימציה (GIF)"):
+            with st.spinner("מייצא את האנימציה..."):
+                gif_bytes, export_report = export_gif_bytes(year_range, selected_continents,
+                                                            selected_countries, speed_ms, PAGE1_PATH)
+            st.download_button("הורד GIF", gif_bytes, file_name="aliyah_trends.gif", mime="image/gif")
+            st.caption(f"{export_report['frames']} פריימים, {export_report['frames_per_second']} פריימים לשנייה "
+                       f"({export_report['workers']} תהליכים)")
 
         if st.checkbox("הצג טבלה", value=False):
-            st.dataframe(grid)
+            st.dataframe(build_trends_grid(base_filtered, timeline, selected_countries))
+
+        # Detected once per dataset version for every country (waves.py); sortable by any column
+        st.markdown("#### גלי העלייה הגדולים")
+        waves = waves_in_range(load_waves(PAGE1_PATH), year_range)
+        waves = waves[waves["continent"].isin(selected_continents)]
+        if st.toggle("רק המדינות שנבחרו", value=False, key="waves_selected_only"):
+            waves = waves[waves["erez_moza"].isin(selected_countries)]
+        st.dataframe(
+            waves.rename(columns={
+                "erez_moza": "מדינה", "continent": "יבשת", "start": "התחלה", "end": "סיום", "months": "חודשים",
+                "peak": "שיא", "peak_count": "עולים בשיא", "baseline": "בסיס חודשי", "excess": "עודף עולים",
+                "peak_z": "ציון z בשיא",
+            }),
+            hide_index=True, use_container_width=True, height=300,
+        )
 # ==============================================================================
 # PAGE 2: ISRAEL CITIES MAP (City Profiles)
 # ==============================================================================
@@ -676,7 +608,7 @@ elif page == "מגמות קליטה לפי יישובים":
   # --- MAP VIEW STATE ---
   # Default start view
   if 'map_view' not in st.session_state:
-      st.session_state.map_view = {"lat": 31.6, "lon": 34.85, "zoom": 7.3}
+      st.session_state.map_view = dict(DEFAULT_MAP_VIEW)
 
   # ==============================================================================
   # 2. SELECTION LOGIC
@@ -685,6 +617,18 @@ elif page == "מגמות קליטה לפי יישובים":
   if map_state and "selection" in map_state:
       current_map_points = [p['location'] for p in map_state['selection']['points']]
       if current_map_points != st.session_state.last_map_select:
+          df_district, districts_geojson, polygon_district = load_districts()
+          clicked_districts = [p for p in current_map_points if p in set(df_district['english_id'])]
+          if clicked_districts:
+              # Zoomed-out map: a district click zooms in on it and selects its yeshuvim
+              district = clicked_districts[0]
+              st.session_state.map_view = district_view(districts_geojson, district)
+              st.session_state.selected_cities = [eid for eid, d in polygon_district.items() if d == district]
+              st.session_state.city_selector = st.session_state.selected_cities
+              st.session_state.last_map_select = []
+              del st.session_state["map_plot"]
+              st.rerun()
+
           if len(current_map_points) == 1:
               clicked_id = current_map_points[0]
               if clicked_id in st.session_state.selected_cities:
@@ -698,6 +642,16 @@ elif page == "מגמות קליטה לפי יישובים":
           st.session_state.city_selector = st.session_state.selected_cities
           st.rerun()
 
+  # Range brushing (city_brush.py): one value per brushing gesture, already filtered in the browser
+  if 'city_brush_version' not in st.session_state:
+      st.session_state.city_brush_version = 0
+      st.session_state.last_brush = None
+  brush_state = st.session_state.get(f"city_brush_{st.session_state.city_brush_version}")
+  if brush_state is not None and brush_state != st.session_state.last_brush:
+      st.session_state.last_brush = brush_state
+      st.session_state.selected_cities = list(brush_state["ids"] or [])
+      st.session_state.city_selector = st.session_state.selected_cities
+
   line_state = st.session_state.get("line_plot")
   if line_state and "selection" in line_state:
       points = line_state['selection']['points']
@@ -718,44 +672,21 @@ elif page == "מגמות קליטה לפי יישובים":
   # ==============================================================================
   # 3. DATA LOADING
   # ==============================================================================
-  @st.cache_data
-  def load_data():
+  @st.cache_data(max_entries=2)
+  def load_data(version):
       try:
-          df = pd.read_csv(PAGE2_PATH)
-          unique_ids = df['english_id'].unique()
-          aggregated_rows = []
-          for eid in unique_ids:
-              group = df[df['english_id'] == eid]
-              total_vol = group['total_olim'].sum()
-              rep_name = group.sort_values('total_olim', ascending=False).iloc[0]['hebrew_name']
-              avg_madad = group['madad'].mean() if 'madad' in group.columns else 0
-
-              if total_vol > 0:
-                  def w_avg(col): return (group[col] * group['total_olim']).sum() / total_vol
-                  avg_age, pct_emp, pct_fem = w_avg('avg_age'), w_avg('pct_employed'), w_avg('pct_female')
-              else:
-                  avg_age, pct_emp, pct_fem = group['avg_age'].mean(), group['pct_employed'].mean(), group['pct_female'].mean()
-
-              aggregated_rows.append({
-                  'english_id': eid, 'hebrew_name': rep_name, 'total_olim': total_vol,
-                  'avg_age': avg_age, 'pct_employed': pct_emp, 'pct_female': pct_fem,
-                  'madad': avg_madad, 'score': group['score'].mean()
-              })
-          df_final = pd.DataFrame(aggregated_rows)
-          df_final['log_total_olim'] = np.log10(df_final['total_olim'] + 1)
-
-          np.random.seed(42)
-          jitter_vals = np.random.uniform(-0.25, 0.25, size=len(df_final))
-          df_final['madad_jittered'] = df_final['madad'] + jitter_vals
-          return df_final.sort_values('hebrew_name')
+          return load_city_profiles(PAGE2_PATH)
       except Exception as e:
           st.error(f"Error loading data: {e}")
           st.stop()
 
-  df_profile = load_data()
+  @st.cache_data(max_entries=2)
+  def load_map(version):
+      return load_geojson(PATH_GEOJSON)
+
+  df_profile = load_data(file_fingerprint(PAGE2_PATH))
   try:
-      with open(PATH_GEOJSON, "r", encoding="utf-8") as f:
-          cities_geojson = json.load(f)
+      cities_geojson = load_map(file_fingerprint(PATH_GEOJSON))
   except:
       st.error("Missing map file.")
       st.stop()
@@ -776,6 +707,9 @@ elif page == "מגמות קליטה לפי יישובים":
       for key in ["map_plot", "line_plot"]:
           if key in st.session_state:
               del st.session_state[key]
+      # A new component key clears the brushes drawn in the browser
+      st.session_state.last_brush = None
+      st.session_state.city_brush_version += 1
 
   # --- VIEW CONTROLLER CALLBACK ---
   def set_view(lat, lon, zoom):
@@ -802,162 +736,35 @@ elif page == "מגמות קליטה לפי יישובים":
       st.button("🔄 איפוס", use_container_width=True, on_click=on_reset_click)
   with c_ctrl3:
       st.info("לחצו על אחד מהכפתורים מטה כדי לכוון את המפה לאזור מסוים")
+      brush_mode = st.toggle("סינון לפי טווחים (גררו על הצירים)", key="city_brush_mode")
 
-  current_selection = st.session_state.selected_cities
+  current_selection = list(st.session_state.selected_cities)
   is_all_mode = (len(current_selection) == 0)
 
   # ==============================================================================
-  # 5. CUSTOM PLOT CONFIGURATION
-  # ==============================================================================
-  features = [
-      {'label': 'גיל ממוצע', 'col': 'avg_age', 'plot_col': 'avg_age', 'suffix': ''},
-      {'label': 'מדד', 'col': 'madad', 'plot_col': 'madad_jittered', 'suffix': ''},
-      {'label': '% תעסוקה', 'col': 'pct_employed', 'plot_col': 'pct_employed', 'suffix': '%'},
-      {'label': '% נשים', 'col': 'pct_female', 'plot_col': 'pct_female', 'suffix': '%'},
-  ]
-  ranges = {}
-  for f in features:
-      ranges[f['col']] = {
-          'min_real': df_profile[f['col']].min(), 'max_real': df_profile[f['col']].max(),
-          'min_plot': df_profile[f['plot_col']].min(), 'max_plot': df_profile[f['plot_col']].max()
-      }
-
-  
-  
-  log_min, log_max = df_profile['log_total_olim'].min(), df_profile['log_total_olim'].max()
-
-  def get_dense_color(value, vmin, vmax, opacity=1.0):
-      # 1. Normalize the value (0 to 1)
-      norm_val = (value - vmin) / (vmax - vmin) if vmax > vmin else 0.5
-      
-      # 2. Sample the "Amp" scale at this normalized point
-      # sample_colorscale returns a list of strings, we take the first one
-      color_string = sample_colorscale("dense", [norm_val])[0]
-      
-      # 3. Convert to RGBA to handle opacity
-      # Plotly usually returns 'rgb(r, g, b)' or hex. We handle both.
-      if color_string.startswith("rgb"):
-          return color_string.replace("rgb", "rgba").replace(")", f", {opacity})")
-      elif color_string.startswith("#"):
-          # Convert hex to rgba
-          h = color_string.lstrip('#')
-          r, g, b = tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
-          return f"rgba({r}, {g}, {b}, {opacity})"
-      return color_string
-
-
-  # ==============================================================================
-  # 6. PLOT LOGIC
+  # 5. FIGURES (built concurrently, drawn as soon as each one is ready)
   # ==============================================================================
-  traces, annotations, shapes = [], [], []
-  x_labels = [f['label'] for f in features]
-
-  if is_all_mode:
-      draw_order = df_profile['english_id'].tolist()
-  else:
-      bg_ids = [x for x in df_profile['english_id'] if x not in current_selection]
-      fg_ids = [x for x in df_profile['english_id'] if x in current_selection]
-      draw_order = bg_ids + fg_ids
-
-  st.session_state.previous_draw_order = draw_order
-
-  for eid in draw_order:
-      row = df_profile[df_profile['english_id'] == eid].iloc[0]
-      is_selected = (eid in current_selection) or is_all_mode
-
-      if is_all_mode:
-          # CHANGE HERE: Use get_dense_color instead of get_mpl_color
-          line_color = get_dense_color(row['log_total_olim'], log_min, log_max, opacity=0.35)
-          line_width = 1.5; hover_info = 'text'
-          htemplate = f"<b>{row['hebrew_name']}</b><br>מדד: {row['madad']:.2f}<br>עולים: {int(row['total_olim']):,}<extra></extra>"
-      else:
-          if is_selected:
-              # CHANGE HERE: Use get_dense_color instead of get_mpl_color
-              line_color = get_dense_color(row['log_total_olim'], log_min, log_max, opacity=1.0)
-              line_width = 4.0; hover_info = 'text'
-              htemplate = f"<b>{row['hebrew_name']}</b><br>מדד: {row['madad']:.2f}<br>עולים: {int(row['total_olim']):,}<extra></extra>"
-          else:
-              line_color = 'rgba(200, 200, 200, 0.05)'; line_width = 1.0; hover_info = 'skip'; htemplate = None
-
-      y_vals, hover_texts = [], []
-      for f in features:
-          r = ranges[f['col']]
-          val_plot = row[f['plot_col']]; val_real = row[f['col']]
-          norm = 0.5 if r['max_plot'] == r['min_plot'] else (val_plot - r['min_plot']) / (r['max_plot'] - r['min_plot'])
-          y_vals.append(norm)
-          hover_texts.append(f"{val_real:.1f}{f['suffix']}")
-
-      traces.append(go.Scatter( #TODO
-          x=x_labels, y=y_vals, mode='lines',
-          line=dict(color=line_color, width=line_width),
-          name=row['hebrew_name'], text=hover_texts, hovertemplate=htemplate,
-          showlegend=False, hoverinfo=hover_info
-      ))
-
-  def get_nice_ticks(min_v, max_v):
-      if min_v == max_v: return [min_v]
-      target_ticks = np.linspace(min_v, max_v, 5)
-      nice_ticks = []
-      for t in target_ticks:
-          if abs(t) >= 10: nice_ticks.append(int(round(t)))
-          elif abs(t) >= 1: nice_ticks.append(round(t, 1))
-          else: nice_ticks.append(round(t, 2))
-      return sorted(list(set(nice_ticks)))
-
-  for i, f in enumerate(features):
-      r = ranges[f['col']]
-      shapes.append(dict(type="line", x0=i, x1=i, y0=-0.05, y1=1.05, line=dict(color="gray", width=1.5), xref="x", yref="y"))
-      ticks = get_nice_ticks(r['min_real'], r['max_real'])
-      for t in ticks:
-          if r['max_real'] == r['min_real']: y_pos = 0.5
-          else: y_pos = (t - r['min_plot']) / (r['max_plot'] - r['min_plot'])
-          annotations.append(dict(x=i, y=y_pos, text=f"– {t}{f['suffix']}", showarrow=False, xanchor="left", font=dict(size=12, color="black", weight="bold"), xref='x', yref='y', xshift=2))
-      annotations.append(dict(x=i, y=1.1, text=f"<b>{f['label']}</b>", showarrow=False, font=dict(size=13, color="black"), xref='x', yref='y'))
-
-  fig_lines = go.Figure(data=traces)
-  fig_lines.update_layout(
-      title="השוואת מדדים (ניתן ללחוץ על קו לבחירה)",
-      xaxis=dict(showgrid=False, showticklabels=False, range=[-0.2, len(features)-0.5]),
-      yaxis=dict(showgrid=False, showticklabels=False, range=[-0.1, 1.15]),
-      margin=dict(l=20, r=20, b=20, t=60), height=500, hovermode='closest', annotations=annotations, shapes=shapes, plot_bgcolor='white', dragmode=False
-  )
+  # The line chart's curveNumber indexes this order (see the selection logic above)
+  st.session_state.previous_draw_order = city_draw_order(df_profile, current_selection)
 
-  # ==============================================================================
-  # 7. MAP RENDER
-  # ==============================================================================
-  df_reset = df_profile.reset_index(drop=True)
-  selected_indices = None
-  if not is_all_mode:
-      selected_indices = df_reset.index[df_reset['english_id'].isin(current_selection)].tolist()
-
-  fig_map = go.Figure(go.Choroplethmapbox( 
-      geojson=cities_geojson, locations=df_reset['english_id'], featureidkey="id",
-      z=df_reset['log_total_olim'],
-      colorscale='dense', #trying dense
-      zmin=log_min, zmax=log_max,
-      marker_opacity=1.0,
-      marker_line_width=1, marker_line_color='white',
-      text=df_reset['hebrew_name'], customdata=df_reset['total_olim'],
-      hovertemplate="<b>%{text}</b><br>סה\"כ עולים: %{customdata:,}<extra></extra>",
-      showscale=True, #TODO to show the spectrum
-      colorbar=dict(title="סקאלת עולים", orientation="h", y=-0.15, thickness=15),
-      selectedpoints=selected_indices,
-      selected=dict(marker=dict(opacity=1.0)),
-      unselected=dict(marker=dict(opacity=0.4))
-  ))
-
-  fig_map.update_layout(
-      mapbox_style="carto-positron",
-      # Use Dynamic View State
-      mapbox_center={"lat": st.session_state.map_view["lat"], "lon": st.session_state.map_view["lon"]},
-      mapbox_zoom=st.session_state.map_view["zoom"],
-      margin={"r":0,"t":30,"l":0,"b":0}, height=500, clickmode='event+select', title="מפת עולים"
-  )
+  map_view = dict(st.session_state.map_view)
+  builders = {"city_map": lambda: get_page2_map(current_selection, map_view)}
+  if not brush_mode:
+      builders["city_lines"] = lambda: get_city_lines_figure(current_selection)
+  futures = submit_figures(builders)
 
   # DISPLAY
   c1, c2 = st.columns([1.5, 1])
   with c1:
-      st.plotly_chart(fig_lines, use_container_width=True, on_select="rerun", key="line_plot", selection_mode="points")
+      if brush_mode:
+          # Drawn in the browser from a cached payload: nothing to wait for
+          st.markdown("**השוואת מדדים: גררו טווח על ציר כדי לסנן, לחיצה על הציר מבטלת**")
+          city_brush(st.session_state.last_brush, key=f"city_brush_{st.session_state.city_brush_version}")
+          if st.session_state.last_brush and st.session_state.last_brush["ids"] == []:
+              st.warning("אין יישובים שעונים על כל הטווחים שנבחרו (מוצגים כל היישובים).")
+      else:
+          lines_slot = st.empty()
+          lines_slot.info("טוען את גרף המדדים...")
   with c2:
       # --- 4 ZOOM BUTTONS ---
       b1, b2, b3, b4 = st.columns(4)
@@ -974,10 +781,18 @@ elif page == "מגמות קליטה לפי יישובים":
           # South: Zoomed OUT A LOT and shifted RIGHT (East)
           st.button("כל ישראל", on_click=set_view, args=(31.4, 35.0, 5.8), use_container_width=True)
 
-      st.plotly_chart(fig_map, use_container_width=True, on_select="rerun", key="map_plot", selection_mode="points")
+      if is_district_view(map_view):
+          st.caption("בתצוגה הרחבה המפה מציגה מחוזות: לחצו על מחוז כדי לעבור ליישובים שלו")
+      map_slot = st.empty()
+      map_slot.info("טוען את המפה...")
+
+  # Map first: it is what the page is navigated with
+  map_slot.plotly_chart(futures["city_map"].result(), use_container_width=True, on_select="rerun", key="map_plot", selection_mode="points")
+  if not brush_mode:
+      lines_slot.plotly_chart(futures["city_lines"].result(), use_container_width=True, on_select="rerun", key="line_plot", selection_mode="points")
 
   # ==============================================================================
-  # 8. DYNAMIC DATA TABLE
+  # 6. DYNAMIC DATA TABLE (only for a selection)
   # ==============================================================================
   if not is_all_mode:
       st.divider()
@@ -1031,16 +846,14 @@ elif page == "תחומי תעסוקה של עולים לפי מדינת מוצא
     st.caption("תרשים זרימה המציג את המעבר בין מדינות המוצא לקבוצות מקצועיות (לאחר איחוד קטגוריות).")
 
     # 1. Load Data
-    @st.cache_data
-    def load_sankey_data(path):
-        df = pd.read_csv(path)
-        return df
+    @st.cache_data(max_entries=2)
+    def load_sankey(path, version):
+        return load_sankey_data(path)
 
-    df_sankey = load_sankey_data(PAGE3_PATH) 
+    df_sankey = load_sankey(PAGE3_PATH, file_fingerprint(PAGE3_PATH))
 
     # 2. Controls - Country Selection
-    country_totals = df_sankey.groupby('erez_moza')['count'].sum()
-    top_4_countries = country_totals.nlargest(4).index.tolist()
+    top_4_countries = default_sankey_countries(df_sankey)
     all_countries_available = df_sankey['erez_moza'].unique().tolist()
     
     sorted_options = top_4_countries + [c for c in all_countries_available if c not in top_4_countries]
@@ -1071,6 +884,34 @@ elif page == "תחומי תעסוקה של עולים לפי מדינת מוצא
     with col4:
         st.button("נקה בחירה", on_click=deselect_all, use_container_width=True)
 
+    # --- Similar countries (country_similarity.py: precomputed, the buttons only look up lists) ---
+    similarity_index = load_similarity_index(PAGE3_PATH)
+    MAX_ARCHETYPE_COUNTRIES = 8
+
+    def select_similar():
+        reference = st.session_state['similar_reference']
+        neighbours = similar_countries(similarity_index, reference, st.session_state['similar_k'])
+        st.session_state['country_selector'] = [reference] + [c for c, _ in neighbours]
+
+    def select_archetype():
+        members = archetype_members(similarity_index, st.session_state['archetype_choice'])
+        st.session_state['country_selector'] = members[:MAX_ARCHETYPE_COUNTRIES]
+
+    with st.expander("בחירה לפי פרופיל תעסוקתי דומה"):
+        s_col1, s_col2 = st.columns(2)
+        with s_col1:
+            reference = st.selectbox("מדינות עם פרופיל דומה ל:", sorted_options, key='similar_reference')
+            st.slider("מספר מדינות דומות", 3, 10, 5, key='similar_k')
+            st.button("בחר את המדינות הדומות", on_click=select_similar, use_container_width=True)
+            neighbours = similar_countries(similarity_index, reference, st.session_state['similar_k'])
+            st.caption("דמיון (0-1): " + ", ".join(f"{c} {score:.2f}" for c, score in neighbours))
+        with s_col2:
+            names = similarity_index['archetype_names']
+            st.selectbox("ארכיטיפ תעסוקתי:", list(range(len(names))), key='archetype_choice',
+                         format_func=lambda a: f"{names[a]} ({len(archetype_members(similarity_index, a))} מדינות)")
+            st.button(f"בחר את {MAX_ARCHETYPE_COUNTRIES} הגדולות בארכיטיפ", on_click=select_archetype, use_container_width=True)
+            st.caption(f"{reference} שייכת לארכיטיפ: {names[archetype_of(similarity_index, reference)]}")
+
     selected_countries = st.multiselect(
         "בחר מדינות להצגה:",
         options=sorted_options,
@@ -1081,87 +922,70 @@ elif page == "תחומי תעסוקה של עולים לפי מדינת מוצא
         st.warning("אנא בחר לפחות מדינה אחת להצגה.")
         st.stop()
 
-    # 3. Filter Data
-    flows = df_sankey[df_sankey['erez_moza'].isin(selected_countries)].copy()
-    
-    # 4. Prepare Sankey Data
-    unique_countries = selected_countries
-    unique_subjects = flows['subject'].unique().tolist()
-    all_labels = unique_countries + unique_subjects
-
-    # Formatted Labels
-    styled_labels = []
-    for label in all_labels:
-        styled_labels.append(f"<span style='background-color:rgba(255,255,255,0.8); color:black;'><b>{label}</b></span>")
-
-    label_map = {label: i for i, label in enumerate(all_labels)}
-
-    source_indices = flows['erez_moza'].map(label_map)
-    target_indices = flows['subject'].map(label_map)
-    values = flows['count']
-
-    # 5. Coloring Logic
-    color_palette = px.colors.qualitative.Bold 
-    country_color_map = {
-        country: color_palette[i % len(color_palette)] 
-        for i, country in enumerate(unique_countries)
-    }
-
-    def get_rgba_string(color_val, opacity):
-        if color_val.startswith('rgb'):
-            if 'rgba' in color_val:
-                return color_val 
-            else:
-                return color_val.replace('rgb', 'rgba').replace(')', f', {opacity})')
-        else:
-            try:
-                rgba = mcolors.to_rgba(color_val, alpha=opacity)
-                return f'rgba({int(rgba[0]*255)}, {int(rgba[1]*255)}, {int(rgba[2]*255)}, {rgba[3]})'
-            except:
-                return f'rgba(128, 128, 128, {opacity})'
-
-    node_colors = [country_color_map[label] if label in country_color_map else "lightgrey" for label in all_labels]
-    link_colors = [get_rgba_string(country_color_map[row['erez_moza']], 0.4) for _, row in flows.iterrows()]
-
-    # 6. Create Plot
-    fig = go.Figure(data=[go.Sankey(
-        node=dict(
-            pad=20,
-            thickness=30,
-            line=dict(color="black", width=0.5),
-            label=styled_labels,
-            color=node_colors,
-            # Node Hover: Added <span style='color:black'> to force the number to match the text
-            hovertemplate='<b>%{label}</b><br>כמות: <span style="color:black"><b>%{value:,.0f}</b></span><extra></extra>',
-            align='right' 
-        ),
-        link=dict(
-            source=source_indices,
-            target=target_indices,
-            value=values,
-            color=link_colors,
-            # Link Hover: Added <span style='color:black'> to force the number to match the text
-            hovertemplate=(
-                'מדינת מוצא: <b>%{source.label}</b>' + 
-                '<br>' + 
-                'מקצוע: <b>%{target.label}</b>' + 
-                '<br>' + 
-                'כמות: <span style="color:black"><b>%{value:,.0f}</b></span><extra></extra>'
-            )
-        )
-    )])
-
-    fig.update_layout(
-        title=dict(
-            text="<b>התפלגות מקצועות לפי מדינות מוצא</b>",
-            x=1,            
-            xanchor='right' 
-        ),
-        title_font_size=20,
-        font=dict(family="Arial, sans-serif", size=14, color="black"),
-        plot_bgcolor='white',
-        height=700,
-        margin=dict(l=10, r=10, t=50, b=10),
-    )
+    # 3. Build (or reuse) the Sankey
+    fig = get_sankey_figure(selected_countries, PAGE3_PATH)
 
     st.plotly_chart(fig, use_container_width=True)
+
+
+# ==============================================================================
+# PAGE 4: EXPLORER (ad-hoc queries over the raw olim records)
+# ==============================================================================
+elif page == "סייר נתונים":
+
+    st.markdown("""
+        <style>
+        [data-testid="stMain"] h3, [data-testid="stMain"] p, [data-testid="stMain"] .stCaption,
+        [data-testid="stMain"] label {
+            text-align: right !important;
+            direction: rtl !important;
+        }
+        [data-testid="stMain"] div[data-baseweb="select"] {
+            direction: rtl;
+        }
+        </style>
+    """, unsafe_allow_html=True)
+
+    st.subheader("סייר נתונים: שאילתות חופשיות על רשומות העולים")
+    st.caption("בחרו עד שלושה ממדים לקיבוץ, מדד ומסננים. החישוב רץ על עותק Parquet של הנתונים הגולמיים, והתוצאות נשמרות במטמון.")
+
+    dim_names = list(explorer.DIMENSIONS)
+    c1, c2, c3 = st.columns([3, 2, 3])
+    with c1:
+        group_by = st.multiselect("קבץ לפי", dim_names, default=["erez_moza"], max_selections=3,
+                                  format_func=explorer.DIMENSIONS.get, key="explorer_dims")
+    with c2:
+        measure = st.selectbox("מדד", list(explorer.MEASURES),
+                               format_func=lambda m: explorer.MEASURES[m][0], key="explorer_measure")
+    with c3:
+        years = explorer.distinct_values("year_aliya")
+        year_range = st.slider("שנות עלייה", int(min(years)), int(max(years)),
+                               (int(min(years)), int(max(years))), key="explorer_years")
+
+    filters = {}
+    with st.expander("מסננים"):
+        f_cols = st.columns(2)
+        filter_dims = [d for d in dim_names if d != "year_aliya"]
+        for i, dim in enumerate(filter_dims):
+            with f_cols[i % 2]:
+                filters[dim] = st.multiselect(explorer.DIMENSIONS[dim], explorer.distinct_values(dim),
+                                              key=f"explorer_filter_{dim}")
+
+    result, info = explorer.get_query_result(group_by, measure, year_range, filters)
+
+    if result.empty or result["olim"].sum() == 0:
+        st.warning("אין רשומות שמתאימות למסננים שנבחרו.")
+        st.stop()
+
+    fig = explorer.get_explorer_figure(group_by, measure, year_range, filters)
+    if fig is not None:
+        st.plotly_chart(fig, use_container_width=True)
+
+    source = "מהמטמון" if info["cached"] else f"{info['seconds']:.3f} שניות ({info['engine']})"
+    st.caption(f"{len(result):,} קבוצות, {int(result['olim'].sum()):,} עולים - {source}")
+    if info["truncated"]:
+        st.warning(f"מוצגות {explorer.EXPLORER_MAX_GROUPS:,} הקבוצות הגדולות בלבד; הוסיפו מסננים לצמצום.")
+
+    labels = dict(explorer.DIMENSIONS, value=explorer.MEASURES[measure][0], olim=explorer.MEASURES["olim"][0])
+    shown = result.drop(columns=["olim"]) if measure == "olim" else result
+    st.dataframe(shown.rename(columns=labels), hide_index=True, use_container_width=True)
@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from component_assets import ensure_plotly_js, publish_json
+from config import PAGE2_PATH
+from data_loading import load_city_profiles
+from disk_cache import cached_load, file_fingerprint
+
+# -------------------------
+# Client-side range brushing on page 2 (city brush component)
+# -------------------------
+# Parallel coordinates over every city profile column, drawn and filtered in the browser
+# (components/city_brush). Dragging ranges on the axes doesn't talk to the server; when the user
+# pauses, the ranges and the ids of the matching cities come back as one component value, which
+# the page turns into the selection (map selectedpoints, table) with a single rerun. The city
+# values are published next to the component (component_assets.publish_json) and fetched by the
+# browser once per dataset version; the args of a rerun only carry its URL and version.
+#
+# brush_mask is the same filter in NumPy, and `python city_brush.py --verify` checks both agree.
+
+COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "city_brush")
+CORE_JS = os.path.join(COMPONENT_DIR, "brush_core.js")
+
+# (column, axis label, log axis)
+BRUSH_DIMENSIONS = [
+    ("avg_age", "גיל ממוצע", False),
+    ("madad", "מדד", False),
+    ("score", "ציון חברתי-כלכלי", False),
+    ("pct_employed", "% תעסוקה", False),
+    ("pct_female", "% נשים", False),
+    ("pct_male", "% גברים", False),
+    ("total_olim", "סה\"כ עולים", True),
+]
+
+_component = None
+
+
+def dimension_values(df_profile):
+    # Axis values as the chart shows them: log axes are log10(x + 1)
+    values = {}
+    for column, _, log in BRUSH_DIMENSIONS:
+        v = df_profile[column].to_numpy(float)
+        values[column] = np.log10(v + 1) if log else v
+    return values
+
+
+def _log_ticks(values):
+    top = np.nanmax(values)
+    ticks = [t for t in (1, 10, 100, 1000, 10000, 100000) if np.log10(t + 1) <= top * 1.001]
+    return [float(np.log10(t + 1)) for t in ticks], [f"{t:,}" for t in ticks]
+
+
+def compact_city_payload(df_profile):
+    values = dimension_values(df_profile)
+    dimensions = []
+    for column, label, log in BRUSH_DIMENSIONS:
+        v = values[column]
+        dim = {"key": column, "label": label, "range": [float(np.nanmin(v)), float(np.nanmax(v))],
+               "values": [None if np.isnan(x) else float(x) for x in v]}
+        if log:
+            dim["tickvals"], dim["ticktext"] = _log_ticks(v)
+        dimensions.append(dim)
+
+    color = df_profile["log_total_olim"].to_numpy(float)
+    return {
+        "ids": df_profile["english_id"].tolist(),
+        "dimensions": dimensions,
+        "color": color.tolist(),
+        "color_range": [float(color.min()), float(color.max())],
+    }
+
+
+def load_city_payload(path=PAGE2_PATH):
+    return cached_load("city_brush_payload", [path], lambda: compact_city_payload(load_city_profiles(path)))
+
+
+def publish_city_payload(path=PAGE2_PATH):
+    # -> (URL of the payload inside the component folder, dataset version)
+    version = file_fingerprint(path)
+    return publish_json(COMPONENT_DIR, "city_payload", version, lambda: load_city_payload(path)), version
+
+
+def normalize_ranges(ranges):
+    # {column: [lo, hi] or [[lo, hi], ...]} -> {column: [[lo, hi], ...]} (empty axes dropped)
+    out = {}
+    for column, r in (ranges or {}).items():
+        if not r:
+            continue
+        out[column] = [list(r)] if np.isscalar(r[0]) else [list(i) for i in r]
+    return out
+
+
+def brush_mask(df_profile, ranges):
+    # Intervals on one axis are OR-ed, axes are AND-ed, bounds inclusive, NaN never matches
+    values = dimension_values(df_profile)
+    mask = np.ones(len(df_profile), dtype=bool)
+    for column, intervals in normalize_ranges(ranges).items():
+        v = values[column]
+        axis = np.zeros(len(v), dtype=bool)
+        for lo, hi in intervals:
+            axis |= (v >= lo) & (v <= hi)
+        mask &= axis
+    return mask
+
+
+def brushed_ids(df_profile, ranges):
+    return df_profile["english_id"].to_numpy()[brush_mask(df_profile, ranges)].tolist()
+
+
+def city_brush(state, key, path=PAGE2_PATH):
+    # Returns {"ranges": ..., "ids": [...] or None (no range set)}, or None before the first brush
+    global _component
+    if _component is None:
+        import streamlit.components.v1 as components
+        ensure_plotly_js(COMPONENT_DIR)
+        _component = components.declare_component("city_brush", path=COMPONENT_DIR)
+
+    payload_url, version = publish_city_payload(path)
+    return _component(payload_url=payload_url, data_version=version, state=state, key=key, default=None)
+
+
+# -------------------------
+# Equivalence check against brush_mask
+# -------------------------
+
+def run_js_filter(payload, ranges):
+    node = shutil.which("node")
+    if node is None:
+        raise RuntimeError("node is required to run brush_core.js outside the browser")
+
+    script = (
+        "const core = require(process.argv[1]);"
+        "const input = JSON.parse(require('fs').readFileSync(process.argv[2], 'utf8'));"
+        "process.stdout.write(JSON.stringify(input.cases.map(r => core.filterIds(input.payload, r))));"
+    )
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump({"payload": payload, "cases": ranges}, f)
+        input_path = f.name
+    try:
+        out = subprocess.run([node, "-e", script, CORE_JS, input_path],
+                             check=True, capture_output=True, text=True, encoding="utf-8").stdout
+    finally:
+        os.remove(input_path)
+    return json.loads(out)
+
+
+def random_ranges(df_profile, n, seed=0):
+    # 1-3 axes per case, one or two intervals per axis, inside (and a bit beyond) the data range
+    rng = np.random.default_rng(seed)
+    values = dimension_values(df_profile)
+    cases = []
+    for _ in range(n):
+        case = {}
+        for column in rng.choice([c for c, _, _ in BRUSH_DIMENSIONS], size=rng.integers(1, 4), replace=False):
+            lo, hi = np.nanmin(values[column]), np.nanmax(values[column])
+            pad = 0.05 * (hi - lo)
+            intervals = [sorted(rng.uniform(lo - pad, hi + pad, size=2).tolist()) for _ in range(rng.integers(1, 3))]
+            case[str(column)] = intervals[0] if len(intervals) == 1 else intervals
+        cases.append(case)
+    # Exact bounds on the data values (inclusive edges) and an empty result
+    madad = values["madad"]
+    cases.append({"madad": [float(np.nanmin(madad)), float(np.nanmin(madad))]})
+    cases.append({"avg_age": [-10.0, -5.0]})
+    return cases
+
+
+if __name__ == "__main__":
+    if "--verify" not in sys.argv:
+        print("usage: python city_brush.py --verify")
+        sys.exit(2)
+
+    df_profile = load_city_profiles(PAGE2_PATH)
+    payload = compact_city_payload(df_profile)
+    cases = random_ranges(df_profile, 200)
+    browser = run_js_filter(payload, cases)
+
+    mismatches = [i for i, (ranges, ids) in enumerate(zip(cases, browser)) if ids != brushed_ids(df_profile, ranges)]
+    sizes = [len(ids) for ids in browser]
+    print(f"{len(cases)} cases, {len(df_profile)} cities, matches per case {min(sizes)}..{max(sizes)}")
+    print("OK" if not mismatches else f"FAIL: cases {mismatches[:10]} differ")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from component_assets import ensure_plotly_js, publish_json
+from config import PAGE1_PATH
+from data_loading import load_trends_data
+from disk_cache import cached_load, file_fingerprint
+from figures import build_trends_grid
+from page_builders import filter_trends, default_trends_state
+from waves import load_waves, build_wave_table, wave_cells
+
+# -------------------------
+# Client-side page 1 (trends player component)
+# -------------------------
+# The browser gets the compact dataset once and does the time/continent/country filtering,
+# cumulative sums and frame generation itself (components/trends_player/trends_core.js).
+# Python only renders the component and stores the filter state it sends back.
+#
+# The dataset is a file in the component folder (component_assets.publish_json), fetched by the
+# browser when the dataset version changes; the component args only carry its URL, the version
+# and the selection, so a rerun after a selection change doesn't resend it.
+
+COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "trends_player")
+CORE_JS = os.path.join(COMPONENT_DIR, "trends_core.js")
+
+_component = None
+
+
+def compact_trends_payload(df_merged, waves=None):
+    # Columnar and index-encoded: ~14k rows become four flat number arrays plus three small lookups.
+    # The detected waves (waves.py) ride along as (country index, first month, last month).
+    months = sorted(df_merged["date"].dt.strftime("%Y-%m").unique())
+    countries = sorted(df_merged["erez_moza"].unique())
+    continents = sorted(df_merged["continent"].unique())
+
+    month_idx = pd.Categorical(df_merged["date"].dt.strftime("%Y-%m"), categories=months).codes
+    country_idx = pd.Categorical(df_merged["erez_moza"], categories=countries).codes
+    continent_idx = pd.Categorical(df_merged["continent"], categories=continents).codes
+    gdp = df_merged["gdp"].astype(float)
+
+    return {
+        "months": months,
+        "countries": countries,
+        "continents": continents,
+        "rows": {
+            "month": month_idx.tolist(),
+            "country": country_idx.tolist(),
+            "continent": continent_idx.tolist(),
+            "monthly": df_merged["monthly_count"].fillna(0).astype(float).tolist(),
+            "gdp": [None if np.isnan(v) else v for v in gdp.tolist()],
+        },
+        "waves": {
+            "country": [countries.index(c) for c in waves["erez_moza"]] if waves is not None else [],
+            "start": waves["start"].tolist() if waves is not None else [],
+            "end": waves["end"].tolist() if waves is not None else [],
+        },
+    }
+
+
+def load_trends_payload(path=PAGE1_PATH):
+    return cached_load("trends_payload", [path], lambda: compact_trends_payload(load_trends_data(path)[0], load_waves(path)))
+
+
+def publish_trends_payload(path=PAGE1_PATH):
+    # -> (URL of the payload inside the component folder, dataset version)
+    version = file_fingerprint(path)
+    return publish_json(COMPONENT_DIR, "trends_payload", version, lambda: load_trends_payload(path)), version
+
+
+def trends_player(countries, color_map, state, key, path=PAGE1_PATH):
+    # Returns the last filter state sent back by the browser (None until the first change)
+    global _component
+    if _component is None:
+        import streamlit.components.v1 as components
+        ensure_plotly_js(COMPONENT_DIR)
+        _component = components.declare_component("trends_player", path=COMPONENT_DIR)
+
+    payload_url, version = publish_trends_payload(path)
+    return _component(
+        payload_url=payload_url, data_version=version,
+        countries=list(countries), color_map=color_map, state=state,
+        key=key, default=None
+    )
+
+
+# -------------------------
+# Equivalence check against the server-side grid
+# -------------------------
+
+def run_js_grid(payload, year_range, continents, countries):
+    node = shutil.which("node")
+    if node is None:
+        raise RuntimeError("node is required to run trends_core.js outside the browser")
+
+    script = (
+        "const core = require(process.argv[1]);"
+        "const input = JSON.parse(require('fs').readFileSync(process.argv[2], 'utf8'));"
+        "process.stdout.write(JSON.stringify(core.computeGrid(input.payload, input.year_range, input.continents, input.countries)));"
+    )
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump({"payload": payload, "year_range": list(year_range),
+                   "continents": list(continents), "countries": list(countries)}, f)
+        input_path = f.name
+    try:
+        out = subprocess.run([node, "-e", script, CORE_JS, input_path],
+                             check=True, capture_output=True, text=True, encoding="utf-8").stdout
+    finally:
+        os.remove(input_path)
+    return pd.DataFrame(json.loads(out))
+
+
+def compare_with_server(df_merged, year_range, continents, countries):
+    # Returns the largest absolute difference per column (and raises if the rows don't line up)
+    timeline, base_filtered = filter_trends(df_merged, year_range, continents)
+    countries = sorted(set(countries) & set(base_filtered["erez_moza"]))
+    server = build_trends_grid(base_filtered, timeline, countries).reset_index(drop=True)
+
+    waves = build_wave_table(df_merged)
+    client = run_js_grid(compact_trends_payload(df_merged, waves), year_range, continents, countries)
+    if len(client) != len(server):
+        raise AssertionError(f"row count differs: browser {len(client)} vs server {len(server)}")
+
+    if not (client["country"].tolist() == server["erez_moza"].tolist()
+            and client["month"].tolist() == server["month_str"].tolist()):
+        raise AssertionError("rows are not in the same (country, month) order")
+
+    columns = {"monthly": "monthly_count", "gdp": "gdp", "cumulative": "cumulative",
+               "log_gdp": "log_gdp", "sqrt_cumulative": "sqrt_cumulative", "bubble_size": "bubble_size"}
+    diffs = {c: float(np.max(np.abs(client[c].to_numpy(float) - server[s].to_numpy(float))) if len(server) else 0.0)
+             for c, s in columns.items()}
+
+    # Months marked as part of a wave on the animation (count of rows that disagree)
+    marked = server.merge(wave_cells(waves), on=["erez_moza", "month_str"], how="left", indicator=True)
+    diffs["wave"] = float((client["wave"].to_numpy(bool) != (marked["_merge"] == "both").to_numpy()).sum())
+    return diffs
+
+
+if __name__ == "__main__":
+    if "--verify" not in sys.argv:
+        print("usage: python client_trends.py --verify")
+        sys.exit(2)
+
+    df_merged = load_trends_data(PAGE1_PATH)[0]
+    year_range, all_continents, top_countries, _ = default_trends_state(df_merged)
+    all_countries = sorted(df_merged["erez_moza"].unique())
+    cases = [
+        ("default", year_range, all_continents, top_countries),
+        ("all countries", year_range, all_continents, all_countries),
+        ("narrow range", (2022, 2023), all_continents, all_countries),
+        ("one continent", year_range, all_continents[:1], all_countries),
+    ]
+
+    failed = False
+    for name, years, continents, countries in cases:
+        diffs = compare_with_server(df_merged, years, continents, countries)
+        worst = max(diffs.values())
+        ok = worst < 1e-9
+        failed |= not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: max abs diff {worst:.3g}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,61 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+
+import plotly
+
+# -------------------------
+# Files served from the custom components' folders
+# -------------------------
+# Streamlit serves every file of a component's folder next to its index.html, so the components
+# load them with relative URLs instead of reaching out to the internet or receiving them as
+# component args:
+#   - plotly.min.js, copied from the installed plotly package (works offline / behind firewalls,
+#     and is the same plotly.js the Python side was tested with),
+#   - the static data of a component, written once per dataset version as data/<name>.<version>.json.
+#     The browser fetches it when the version changes, so a rerun only sends the (small) args.
+# Both are generated, not committed (see .gitignore).
+
+PLOTLY_JS = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+DATA_DIR = "data"
+KEEP_VERSIONS = 2  # the previous version stays for reruns still pinned to it (hot_reload.py)
+
+
+def _write_atomic(path, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def ensure_plotly_js(component_dir):
+    target = os.path.join(component_dir, "plotly.min.js")
+    if not os.path.exists(target) or os.path.getsize(target) != os.path.getsize(PLOTLY_JS):
+        with open(PLOTLY_JS, "rb") as src:
+            _write_atomic(target, lambda f: shutil.copyfileobj(src, f))
+    return target
+
+
+def publish_json(component_dir, name, version, build):
+    # -> URL of the file relative to the component's index.html; build() only runs for a new version
+    folder = os.path.join(component_dir, DATA_DIR)
+    filename = f"{name}.{version}.json"
+    target = os.path.join(folder, filename)
+    if not os.path.exists(target):
+        os.makedirs(folder, exist_ok=True)
+        text = json.dumps(build(), ensure_ascii=False, separators=(",", ":"))
+        _write_atomic(target, lambda f: f.write(text.encode("utf-8")))
+
+        older = sorted(glob.glob(os.path.join(folder, f"{name}.*.json")), key=os.path.getmtime, reverse=True)
+        for path in older[KEEP_VERSIONS:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return f"{DATA_DIR}/{filename}"
@@ -0,0 +1,79 @@
+// -------------------------
+// Page 2 range brushing, in the browser
+// -------------------------
+// Filters the compact payload of city_brush.compact_city_payload with the axis ranges dragged on
+// the parallel coordinates, and builds that chart. Mirrors city_brush.brush_mask; no DOM access,
+// so the same file runs under Node for the equivalence check (`python city_brush.py --verify`).
+
+(function (root) {
+  "use strict";
+
+  // ranges: {dimension key: [[lo, hi], ...]} (several intervals on one axis are OR-ed, the axes
+  // are AND-ed). Bounds are inclusive and in the axis' own units (log10 for total_olim).
+  function inRanges(value, intervals) {
+    if (value === null || value !== value) return false;  // missing / NaN never matches
+    for (var k = 0; k < intervals.length; k++) {
+      if (value >= intervals[k][0] && value <= intervals[k][1]) return true;
+    }
+    return false;
+  }
+
+  function normalizeRanges(ranges) {
+    // plotly gives [lo, hi] for one interval and [[lo, hi], ...] for several
+    var out = {};
+    Object.keys(ranges || {}).forEach(function (key) {
+      var r = ranges[key];
+      if (!r || !r.length) return;
+      out[key] = (typeof r[0] === "number") ? [r] : r;
+    });
+    return out;
+  }
+
+  function filterIds(payload, ranges) {
+    ranges = normalizeRanges(ranges);
+    var active = payload.dimensions.filter(function (d) { return ranges[d.key]; });
+    var ids = [];
+    for (var i = 0; i < payload.ids.length; i++) {
+      var keep = true;
+      for (var a = 0; a < active.length && keep; a++) {
+        keep = inRanges(active[a].values[i], ranges[active[a].key]);
+      }
+      if (keep) ids.push(payload.ids[i]);
+    }
+    return ids;
+  }
+
+  function buildFigure(payload, ranges) {
+    ranges = normalizeRanges(ranges);
+    var dimensions = payload.dimensions.map(function (d) {
+      var dim = { label: d.label, values: d.values, range: d.range };
+      if (d.tickvals) { dim.tickvals = d.tickvals; dim.ticktext = d.ticktext; }
+      if (ranges[d.key]) {
+        dim.constraintrange = ranges[d.key].length === 1 ? ranges[d.key][0] : ranges[d.key];
+      }
+      return dim;
+    });
+
+    return {
+      data: [{
+        type: "parcoords",
+        dimensions: dimensions,
+        line: {
+          color: payload.color, colorscale: "Dense", cmin: payload.color_range[0], cmax: payload.color_range[1],
+          showscale: false
+        },
+        labelfont: { size: 13, color: "black" },
+        tickfont: { size: 11 },
+        rangefont: { size: 10, color: "#888" }
+      }],
+      layout: { margin: { l: 50, r: 50, t: 60, b: 20 }, height: 500 }
+    };
+  }
+
+  var api = { normalizeRanges: normalizeRanges, filterIds: filterIds, buildFigure: buildFigure };
+  if (typeof module !== "undefined" && module.exports) {
+    module.exports = api;
+  } else {
+    root.BrushCore = api;
+  }
+})(this);
@@ -0,0 +1,111 @@
+// -------------------------
+// Streamlit component glue for the page 2 range brushing
+// -------------------------
+// Same protocol as the trends player (no build step). The brushing itself is plotly's parcoords;
+// every drag only re-filters here, and once the user stops for SEND_DELAY_MS the ranges and the
+// matching ids go back to Python in a single value update (one rerun for the whole gesture).
+
+(function (root) {
+  "use strict";
+
+  var SEND_DELAY_MS = 600;
+
+  var payload = null;
+  var dataVersion = null;
+  var ranges = {};
+  var sent = null;
+  var sendTimer = null;
+
+  function sendMessage(type, data) {
+    var message = Object.assign({ isStreamlitMessage: true, type: type }, data);
+    window.parent.postMessage(message, "*");
+  }
+
+  function setFrameHeight() {
+    sendMessage("streamlit:setFrameHeight", { height: document.body.scrollHeight });
+  }
+
+  function currentIds() {
+    // null = no range on any axis (the page treats it as "all cities")
+    return Object.keys(ranges).length ? BrushCore.filterIds(payload, ranges) : null;
+  }
+
+  function showCount(ids) {
+    var n = ids === null ? payload.ids.length : ids.length;
+    document.getElementById("count").textContent = n + " / " + payload.ids.length + " יישובים בטווח";
+  }
+
+  function scheduleSend() {
+    clearTimeout(sendTimer);
+    sendTimer = setTimeout(function () {
+      var value = { ranges: ranges, ids: currentIds() };
+      var encoded = JSON.stringify(value);
+      if (encoded === sent) return;
+      sent = encoded;
+      sendMessage("streamlit:setComponentValue", { value: value, dataType: "json" });
+    }, SEND_DELAY_MS);
+  }
+
+  function readRanges(chart) {
+    var out = {};
+    chart.data[0].dimensions.forEach(function (dim, i) {
+      if (dim.constraintrange && dim.constraintrange.length) {
+        out[payload.dimensions[i].key] = dim.constraintrange;
+      }
+    });
+    return BrushCore.normalizeRanges(out);
+  }
+
+  function draw() {
+    if (!payload) return;
+    var chart = document.getElementById("chart");
+    var figure = BrushCore.buildFigure(payload, ranges);
+    Plotly.react(chart, figure.data, figure.layout, { responsive: true, displayModeBar: false })
+      .then(setFrameHeight);
+    if (!chart._brushListening) {
+      chart._brushListening = true;
+      chart.on("plotly_restyle", function () {
+        ranges = readRanges(chart);
+        showCount(currentIds());
+        scheduleSend();
+      });
+    }
+    showCount(currentIds());
+  }
+
+  function onRender(event) {
+    if (!event.data || event.data.type !== "streamlit:render") return;
+    var args = event.data.args;
+
+    // Only a new dataset is fetched and redrawn: reruns caused by our own value keep the brushes
+    // as they are
+    if (args.data_version !== dataVersion) {
+      var version = dataVersion = args.data_version;
+      payload = null;
+      fetch(args.payload_url)
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          if (version !== dataVersion) return;  // a newer version was requested meanwhile
+          payload = data;
+          ranges = BrushCore.normalizeRanges((args.state && args.state.ranges) || {});
+          sent = JSON.stringify({ ranges: ranges, ids: currentIds() });
+          draw();
+        })
+        .catch(function (error) {
+          // Retried on the next render
+          if (version === dataVersion) dataVersion = null;
+          console.error("city payload not loaded", error);
+        });
+    }
+  }
+
+  document.getElementById("clear").addEventListener("click", function () {
+    if (!payload) return;
+    ranges = {};
+    draw();
+    scheduleSend();
+  });
+
+  window.addEventListener("message", onRender);
+  sendMessage("streamlit:componentReady", { apiVersion: 1 });
+})(this);
@@ -0,0 +1,157 @@
+// -------------------------
+// Streamlit component glue for the page 1 trends player
+// -------------------------
+// Speaks the Streamlit component protocol directly (no build step / npm package needed).
+// The dataset is fetched from the component folder (payload_url) once per dataset version;
+// the render args only carry the selection. Filtering and frame generation happen here, and
+// only the filter state is sent back (debounced) so Python can persist it.
+
+(function () {
+  "use strict";
+
+  var SEND_DELAY_MS = 1500;
+
+  var payload = null;
+  var dataVersion = null;
+  var args = null;
+  var drawnWith = null;
+  var state = null;
+  var sendTimer = null;
+
+  function sendMessage(type, data) {
+    var message = Object.assign({ isStreamlitMessage: true, type: type }, data);
+    window.parent.postMessage(message, "*");
+  }
+
+  function setFrameHeight() {
+    sendMessage("streamlit:setFrameHeight", { height: document.body.scrollHeight });
+  }
+
+  function scheduleSend() {
+    clearTimeout(sendTimer);
+    sendTimer = setTimeout(function () {
+      sendMessage("streamlit:setComponentValue", { value: state, dataType: "json" });
+    }, SEND_DELAY_MS);
+  }
+
+  function fillYearSelect(select, years, value) {
+    select.innerHTML = "";
+    years.forEach(function (y) {
+      var option = document.createElement("option");
+      option.value = y;
+      option.textContent = y;
+      select.appendChild(option);
+    });
+    select.value = value;
+  }
+
+  function buildControls() {
+    var years = [];
+    payload.months.forEach(function (m) {
+      var y = parseInt(m.slice(0, 4), 10);
+      if (years.indexOf(y) < 0) years.push(y);
+    });
+
+    fillYearSelect(document.getElementById("year-from"), years, state.year_range[0]);
+    fillYearSelect(document.getElementById("year-to"), years, state.year_range[1]);
+
+    var speed = document.getElementById("speed");
+    speed.value = state.speed_ms;
+    document.getElementById("speed-value").textContent = state.speed_ms;
+
+    var box = document.getElementById("continents");
+    box.innerHTML = "";
+    payload.continents.forEach(function (c) {
+      var label = document.createElement("label");
+      var input = document.createElement("input");
+      input.type = "checkbox";
+      input.value = c;
+      input.checked = state.continents.indexOf(c) >= 0;
+      label.appendChild(input);
+      label.appendChild(document.createTextNode(" " + c));
+      box.appendChild(label);
+    });
+  }
+
+  function readControls() {
+    var from = parseInt(document.getElementById("year-from").value, 10);
+    var to = parseInt(document.getElementById("year-to").value, 10);
+    var continents = [];
+    document.querySelectorAll("#continents input:checked").forEach(function (input) {
+      continents.push(input.value);
+    });
+    state = {
+      year_range: [Math.min(from, to), Math.max(from, to)],
+      speed_ms: parseInt(document.getElementById("speed").value, 10),
+      continents: continents
+    };
+    document.getElementById("speed-value").textContent = state.speed_ms;
+  }
+
+  function draw() {
+    var grid = TrendsCore.computeGrid(payload, state.year_range, state.continents, args.countries);
+    var figure = TrendsCore.buildFigure(grid, payload.continents, args.color_map, state.speed_ms);
+    var chart = document.getElementById("chart");
+    document.getElementById("empty").style.display = figure ? "none" : "block";
+    if (!figure) {
+      Plotly.purge(chart);
+    } else {
+      figure.config = { responsive: true };
+      Plotly.react(chart, figure).then(setFrameHeight);
+    }
+    setFrameHeight();
+  }
+
+  function onControlChange() {
+    if (!payload) return;
+    readControls();
+    draw();
+    scheduleSend();
+  }
+
+  function onRender(event) {
+    if (!event.data || event.data.type !== "streamlit:render") return;
+    args = event.data.args;
+
+    // The (large) dataset is only fetched when its version changes
+    if (args.data_version !== dataVersion) {
+      var version = dataVersion = args.data_version;
+      payload = null;
+      fetch(args.payload_url)
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          if (version !== dataVersion) return;  // a newer version was requested meanwhile
+          payload = data;
+          state = args.state;
+          buildControls();
+          drawnWith = null;
+          update();
+        })
+        .catch(function (error) {
+          // Retried on the next render
+          if (version === dataVersion) dataVersion = null;
+          console.error("trends payload not loaded", error);
+        });
+      return;
+    }
+    update();
+  }
+
+  function update() {
+    if (!payload) return;
+    // Reruns caused by our own state updates re-send the same args: don't restart the animation
+    var inputs = JSON.stringify([dataVersion, args.countries, args.color_map]);
+    if (inputs !== drawnWith) {
+      drawnWith = inputs;
+      draw();
+    }
+  }
+
+  document.getElementById("year-from").addEventListener("change", onControlChange);
+  document.getElementById("year-to").addEventListener("change", onControlChange);
+  document.getElementById("speed").addEventListener("change", onControlChange);
+  document.getElementById("continents").addEventListener("change", onControlChange);
+
+  window.addEventListener("message", onRender);
+  sendMessage("streamlit:componentReady", { apiVersion: 1 });
+})();
@@ -0,0 +1,228 @@
+// -------------------------
+// Page 1 trends computation, in the browser
+// -------------------------
+// Mirrors figures.build_trends_grid / build_trends_figure on the compact payload produced by
+// client_trends.compact_trends_payload. No DOM access here, so the same file runs under Node
+// for the equivalence check (`python client_trends.py --verify`).
+
+(function (root) {
+  "use strict";
+
+  var HOVER_TEMPLATE =
+    "<b>%{hovertext}</b><br>" +
+    "<span style='font-size: 10px; color: #666;'>%{fullData.name}</span><br><br>" +
+    "סך העולים: <b>%{customdata[0]:,.0f}</b><br>" +
+    "עולים חודשיים: <b>%{customdata[1]:,.0f}</b><br>" +
+    "תל\"ג (שנתי): <b>$%{customdata[2]:,.0f}</b>" +
+    "<extra></extra>";
+
+  var BG_TEXT_FONT = { size: 160, color: "rgba(200, 200, 200, 0.25)" };
+  var SIZE_MAX = 60;
+  var WAVE_COLOR = "#D62728";
+
+  // Indexes into payload.months for the requested year range (inclusive)
+  function monthRange(payload, yearRange) {
+    var first = -1, last = -1;
+    for (var m = 0; m < payload.months.length; m++) {
+      var year = parseInt(payload.months[m].slice(0, 4), 10);
+      if (year >= yearRange[0] && year <= yearRange[1]) {
+        if (first < 0) first = m;
+        last = m;
+      }
+    }
+    return [first, last];
+  }
+
+  // country -> [[first month, last month], ...] of its detected waves (waves.py)
+  function waveRanges(payload) {
+    var waves = payload.waves || { country: [] };
+    var ranges = {};
+    for (var i = 0; i < waves.country.length; i++) {
+      var country = payload.countries[waves.country[i]];
+      (ranges[country] = ranges[country] || []).push([waves.start[i], waves.end[i]]);
+    }
+    return ranges;
+  }
+
+  function inWave(ranges, month) {
+    for (var i = 0; ranges && i < ranges.length; i++) {
+      if (month >= ranges[i][0] && month <= ranges[i][1]) return true;
+    }
+    return false;
+  }
+
+  // Per selected country: the rows of the grid (month, monthly, cumulative, gdp), sorted by month
+  function computeGrid(payload, yearRange, continents, countries) {
+    var range = monthRange(payload, yearRange);
+    var continentSet = {};
+    continents.forEach(function (c) { continentSet[c] = true; });
+
+    var selected = {};
+    countries.forEach(function (c) { selected[c] = true; });
+
+    // month x country lookup of (monthly, gdp) for the rows that pass the filters
+    var cells = {};
+    var r = payload.rows;
+    for (var i = 0; i < r.month.length; i++) {
+      var m = r.month[i];
+      if (m < range[0] || m > range[1]) continue;
+      var country = payload.countries[r.country[i]];
+      if (!selected[country]) continue;
+      var continent = payload.continents[r.continent[i]];
+      if (!continentSet[continent]) continue;
+      cells[m + "|" + country] = { monthly: r.monthly[i], gdp: r.gdp[i], continent: continent };
+    }
+
+    var grid = [];
+    var waves = waveRanges(payload);
+    var names = Object.keys(selected).sort();
+    names.forEach(function (country) {
+      var cumulative = 0;
+      for (var m = range[0]; m >= 0 && m <= range[1]; m++) {
+        var cell = cells[m + "|" + country];
+        // Months without a row have no GDP either, and rows without GDP are dropped
+        // before the cumulative sum (same as dropna(subset=["gdp"]) on the server)
+        if (!cell || cell.gdp === null) continue;
+        cumulative += cell.monthly;
+        grid.push({
+          month: payload.months[m], country: country, continent: cell.continent,
+          monthly: cell.monthly, gdp: cell.gdp, cumulative: cumulative,
+          log_gdp: Math.log1p(cell.gdp), sqrt_cumulative: Math.sqrt(cumulative),
+          bubble_size: Math.pow(Math.max(cell.monthly, 1), 0.6),
+          wave: inWave(waves[country], payload.months[m])
+        });
+      }
+    });
+    return grid;
+  }
+
+  function bubbleTrace(rows, continent, color, sizeref) {
+    return {
+      type: "scatter", mode: "markers", name: continent, legendgroup: continent, showlegend: true,
+      x: rows.map(function (d) { return d.log_gdp; }),
+      y: rows.map(function (d) { return d.sqrt_cumulative; }),
+      ids: rows.map(function (d) { return d.country; }),
+      hovertext: rows.map(function (d) { return d.country; }),
+      customdata: rows.map(function (d) { return [d.cumulative, d.monthly, d.gdp]; }),
+      hovertemplate: HOVER_TEMPLATE,
+      marker: {
+        color: color, size: rows.map(function (d) { return d.bubble_size; }),
+        sizemode: "area", sizeref: sizeref, opacity: 0.9,
+        line: { width: 1, color: "DarkSlateGrey" }
+      }
+    };
+  }
+
+  function textTrace(x, y, label) {
+    return {
+      type: "scatter", mode: "text", x: [x], y: [y], text: [label], textfont: BG_TEXT_FONT,
+      textposition: "middle center", hoverinfo: "skip", showlegend: false
+    };
+  }
+
+  // Rings around the bubbles inside a wave (figures._wave_trace); frames only carry the positions
+  function waveTrace(rows, styled) {
+    var marked = rows.filter(function (d) { return d.wave; });
+    var trace = {
+      type: "scatter",
+      x: marked.map(function (d) { return d.log_gdp; }),
+      y: marked.map(function (d) { return d.sqrt_cumulative; }),
+      ids: marked.map(function (d) { return d.country; }),
+      text: marked.map(function (d) { return d.country; })
+    };
+    if (styled) {
+      Object.assign(trace, {
+        mode: "markers+text", textposition: "top center", textfont: { size: 11, color: WAVE_COLOR },
+        marker: { symbol: "circle-open", size: 14, color: WAVE_COLOR, line: { width: 2 } },
+        name: "גל עלייה", hoverinfo: "skip", showlegend: false
+      });
+    }
+    return trace;
+  }
+
+  // Full figure spec (data, layout, frames) for Plotly.react
+  function buildFigure(grid, allContinents, colorMap, speedMs) {
+    if (!grid.length) return null;
+
+    var xs = grid.map(function (d) { return d.log_gdp; });
+    var ys = grid.map(function (d) { return d.sqrt_cumulative; });
+    var sizes = grid.map(function (d) { return d.bubble_size; });
+    var xRange = [Math.min.apply(null, xs) * 0.98, Math.max.apply(null, xs) * 1.02];
+    var yRange = [0, Math.max.apply(null, ys) * 1.05];
+    var sizeref = 2.0 * Math.max.apply(null, sizes) / (SIZE_MAX * SIZE_MAX);
+    var textX = xRange[0] + (xRange[1] - xRange[0]) * 0.5;
+    var textY = yRange[1] * 0.5;
+
+    var months = [];
+    var byMonth = {};
+    grid.forEach(function (d) {
+      if (!byMonth[d.month]) { byMonth[d.month] = []; months.push(d.month); }
+      byMonth[d.month].push(d);
+    });
+    months.sort();
+
+    var present = {};
+    grid.forEach(function (d) { present[d.continent] = true; });
+    var continents = allContinents.filter(function (c) { return present[c]; });
+
+    function tracesFor(month, styled) {
+      var rows = byMonth[month];
+      var traces = [textTrace(textX, textY, month)];
+      continents.forEach(function (c) {
+        traces.push(bubbleTrace(rows.filter(function (d) { return d.continent === c; }), c, colorMap[c], sizeref));
+      });
+      traces.push(waveTrace(rows, styled));
+      return traces;
+    }
+
+    var frames = months.map(function (month) {
+      var data = tracesFor(month, false);
+      // Frames are merged into the existing traces: no need to repeat the hover template
+      data.forEach(function (t) { delete t.hovertemplate; });
+      return { name: month, data: data };
+    });
+
+    var frameArgs = function (duration) {
+      return { frame: { duration: duration, redraw: false }, mode: "immediate", fromcurrent: true,
+               transition: { duration: Math.max(0, Math.floor(duration * 0.5)), easing: "linear" } };
+    };
+
+    var layout = {
+      height: 700,
+      margin: { l: 20, r: 20, t: 90, b: 130 },
+      xaxis: { range: xRange, title: { text: "לוגריתם תל\"ג" } },
+      yaxis: { range: yRange, title: { text: "שורש כמות העולים המצטברת" } },
+      legend: { orientation: "h", yanchor: "bottom", y: 1.02, xanchor: "right", x: 1 },
+      hoverlabel: { align: "right" },
+      annotations: [{ text: "<b>יבשות</b>", xref: "paper", yref: "paper", x: 1.0, y: 1.05,
+                      xanchor: "right", yanchor: "bottom", showarrow: false, font: { size: 14 } }],
+      updatemenus: [{
+        type: "buttons", direction: "left", x: 0.1, y: 0, xanchor: "right", yanchor: "top",
+        pad: { r: 10, t: 70 }, showactive: false,
+        buttons: [
+          { label: "&#9654;", method: "animate", args: [null, frameArgs(speedMs)] },
+          { label: "&#9724;", method: "animate",
+            args: [[null], { frame: { duration: 0, redraw: false }, mode: "immediate", transition: { duration: 0 } }] }
+        ]
+      }],
+      sliders: [{
+        active: 0, x: 0.1, y: 0, xanchor: "left", yanchor: "top", len: 0.9,
+        pad: { b: 10, t: 90 }, currentvalue: { visible: false },
+        steps: months.map(function (month) {
+          return { label: month, method: "animate",
+                   args: [[month], { frame: { duration: 0, redraw: false }, mode: "immediate",
+                                     transition: { duration: 0, easing: "linear" } }] };
+        })
+      }]
+    };
+
+    return { data: tracesFor(months[0], true), layout: layout, frames: frames };
+  }
+
+  var api = { monthRange: monthRange, computeGrid: computeGrid, buildFigure: buildFigure };
+  if (typeof module !== "undefined" && module.exports) {
+    module.exports = api;
+  } else {
+    root.TrendsCore = api;
+  }
+})(this);
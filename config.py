@@ -0,0 +1,40 @@
+# -------------------------
+# Configuration
+# -------------------------
+# Paths are relative to the project root (where `streamlit run app.py` is started)
+
+PATH_GEOJSON = "datasets/israel_map.geojson"
+
+PAGE1_PATH = "datasets/page1_final.csv"
+
+PAGE2_PATH = "datasets/page2_final.csv"
+
+PAGE3_PATH = "datasets/page3_final.csv"
+
+# Headline numbers for the home page, written with the datasets (summary.py)
+PATH_SUMMARY = "datasets/summary.json"
+
+# Page 2 rolled up to districts (machoz) with dissolved district outlines (districts.py)
+PATH_DISTRICTS = "datasets/districts.json"
+
+# Hebrew country name (erez_moza) -> ISO-3 code, for the page 1 country map
+PATH_COUNTRY_ISO3 = "datasets/country_iso3.csv"
+
+# Raw olim records (one row per oleh), the source of the three page datasets
+PATH_RAW_OLIM = "preprocessing/olim_2015-2024_preprocessed.zip"
+
+# Year-partitioned Parquet copies (generated by partitions.py, rebuilt when the source changes)
+PAGE1_PARTITIONS = "datasets/partitions/page1"
+OLIM_PARTITIONS = "datasets/partitions/olim"
+
+# Running sums kept by ingest.py so new months can be added without a full rebuild
+INGEST_STATE_DIR = "datasets/ingest_state"
+
+PATH_SHIP = "pictures/exodus.png"
+PATH_PLANE_ETHIOPIA = "pictures/ethiopia.png"
+PATH_PLANE_MODERN = "pictures/current.png"
+
+# Resized WebP / JPEG copies of the pictures above (generated by image_variants.py). Streamlit
+# serves ./static at app/static/ (server.enableStaticServing, .streamlit/config.toml)
+HERO_VARIANTS_DIR = "static/hero"
+HERO_VARIANTS_URL = "app/static/hero"
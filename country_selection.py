@@ -0,0 +1,103 @@
+import re
+import unicodedata
+
+import pandas as pd
+
+from config import PAGE1_PATH, PATH_COUNTRY_ISO3
+from data_loading import load_trends_data
+from disk_cache import cached_load
+
+# -------------------------
+# Page 1 country checklist: selection bitset + search index
+# -------------------------
+# Every country gets a fixed code (its position in the sorted list of all countries), and a set
+# of countries is one Python int with bit `code` set. The selection is a single session-state
+# value instead of one key per country, and select all / clear is one OR / AND-NOT.
+#
+# Search goes through a precomputed index of the normalized Hebrew and English names:
+# every substring of up to INDEX_GRAM characters maps to the bitset of the countries containing
+# it. Short queries are a single lookup; longer ones AND the masks of their grams and only
+# check the remaining candidates.
+
+INDEX_GRAM = 3
+
+_NIQQUD = re.compile(r"[֑-ׇ]")
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_name(text):
+    # Case, accents, niqqud, punctuation and spacing don't matter for the search
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _NIQQUD.sub("", text).replace("'", "").replace('"', "").replace("״", "").replace("׳", "")
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+class CountryIndex:
+    def __init__(self, countries, english_names=None):
+        english_names = english_names or {}
+        self.countries = sorted(countries)
+        self.codes = {c: i for i, c in enumerate(self.countries)}
+        self.english = [english_names.get(c, "") or "" for c in self.countries]
+        self.all_mask = (1 << len(self.countries)) - 1
+
+        # One searchable string per country: "<hebrew> | <english>" (the separator never matches)
+        self.keys = [f"{normalize_name(c)}|{normalize_name(e)}" for c, e in zip(self.countries, self.english)]
+        self.grams = {}
+        for code, key in enumerate(self.keys):
+            bit = 1 << code
+            for part in key.split("|"):
+                for n in range(1, INDEX_GRAM + 1):
+                    for start in range(len(part) - n + 1):
+                        gram = part[start:start + n]
+                        self.grams[gram] = self.grams.get(gram, 0) | bit
+
+    # --- bitset helpers ---
+
+    def mask_of(self, names):
+        mask = 0
+        for name in names:
+            code = self.codes.get(name)
+            if code is not None:
+                mask |= 1 << code
+        return mask
+
+    def names_of(self, mask):
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self.countries[low.bit_length() - 1])
+            mask ^= low
+        return names
+
+    # --- search ---
+
+    def search(self, query):
+        q = normalize_name(query)
+        if not q:
+            return self.all_mask
+        if len(q) <= INDEX_GRAM:
+            return self.grams.get(q, 0)
+
+        mask = self.all_mask
+        for start in range(len(q) - INDEX_GRAM + 1):
+            mask &= self.grams.get(q[start:start + INDEX_GRAM], 0)
+            if not mask:
+                return 0
+        # The grams only narrow it down: confirm the whole query on the few candidates left
+        return self.mask_of(c for c in self.names_of(mask) if q in self.keys[self.codes[c]])
+
+
+def build_country_index(df_merged, hebrew_to_english, iso3_path=PATH_COUNTRY_ISO3):
+    # The GDP data has no English name for some countries: fill those from the ISO-3 table
+    english = pd.read_csv(iso3_path).dropna(subset=["Country"]).set_index("erez_moza")["Country"].to_dict()
+    english.update({k: v for k, v in hebrew_to_english.items() if v})
+    return CountryIndex(df_merged["erez_moza"].unique(), english)
+
+
+def load_country_index(path=PAGE1_PATH, iso3_path=PATH_COUNTRY_ISO3):
+    def load():
+        df_merged, hebrew_to_english, _ = load_trends_data(path, iso3_path)
+        return build_country_index(df_merged, hebrew_to_english, iso3_path)
+
+    return cached_load("country_index", [path, iso3_path], load)
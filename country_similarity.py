@@ -0,0 +1,171 @@
+import sys
+
+import numpy as np
+
+from config import PAGE3_PATH
+from data_loading import load_sankey_data
+from disk_cache import cached_load
+
+# -------------------------
+# Page 3: countries with a similar occupation profile
+# -------------------------
+# Each country of origin becomes its distribution over the occupation groups of page3_final.csv
+# (a country × subject matrix, rows summing to 1). Half the countries have fewer than ~40 olim,
+# so every row is smoothed towards the overall distribution with the weight of PRIOR_OLIM olim:
+# a country with 3 olim looks mostly average instead of 100% one profession.
+#
+# Everything is computed once per version of the file, as whole-matrix operations:
+#   - all-pairs similarity, 1 - the Jensen-Shannon distance (base 2, so 0..1) or the cosine,
+#   - the TOP_K nearest neighbours of every country, among the countries with at least
+#     MIN_NEIGHBOUR_OLIM olim (the smoothed tiny ones all sit near the average and would crowd
+#     every list),
+#   - N_ARCHETYPES occupational archetypes: k-means on the square roots of the profiles (where
+#     the Euclidean distance is the Hellinger distance), weighted by the square root of the
+#     number of olim, named after the occupations their centre has the most of relative to
+#     the overall distribution.
+# The page's pickers then only look up lists, so filling the country selector is instant.
+
+PRIOR_OLIM = 10
+TOP_K = 10
+MIN_NEIGHBOUR_OLIM = 30
+N_ARCHETYPES = 5
+KMEANS_RESTARTS = 8
+KMEANS_ITERATIONS = 100
+
+
+def profile_matrix(df_sankey, prior_olim=PRIOR_OLIM):
+    # -> (countries, subjects, smoothed shares [n_countries, n_subjects], olim per country)
+    counts = df_sankey.pivot_table(index="erez_moza", columns="subject", values="count", aggfunc="sum", fill_value=0)
+    counts = counts.sort_index()
+    matrix = counts.to_numpy(float)
+    totals = matrix.sum(axis=1)
+    overall = matrix.sum(axis=0) / matrix.sum()
+    shares = (matrix + prior_olim * overall) / (totals + prior_olim)[:, None]
+    return counts.index.tolist(), counts.columns.tolist(), shares, totals
+
+
+def _entropy(p, axis=-1):
+    # In bits; 0 * log 0 = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -np.where(p > 0, p * np.log2(p), 0.0).sum(axis=axis)
+
+
+def js_similarity(shares):
+    # 1 - sqrt(JSD) for every pair at once: JSD(P, Q) = H((P + Q) / 2) - (H(P) + H(Q)) / 2
+    mixture = (shares[:, None, :] + shares[None, :, :]) / 2
+    own = _entropy(shares)
+    divergence = _entropy(mixture) - (own[:, None] + own[None, :]) / 2
+    return 1 - np.sqrt(np.clip(divergence, 0, 1))
+
+
+def cosine_similarity(shares):
+    unit = shares / np.linalg.norm(shares, axis=1, keepdims=True)
+    return np.clip(unit @ unit.T, -1, 1)
+
+
+SIMILARITY_METRICS = {"js": js_similarity, "cosine": cosine_similarity}
+
+
+def top_neighbours(similarity, k=TOP_K, eligible=None):
+    # Indices of the k most similar other countries of each row (among the eligible columns),
+    # most similar first
+    masked = similarity.copy()
+    np.fill_diagonal(masked, -np.inf)
+    if eligible is not None:
+        masked[:, ~eligible] = -np.inf
+    k = min(k, len(masked) - 1, int(np.isfinite(masked).sum(axis=1).min()))
+    part = np.argpartition(-masked, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(masked, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+def kmeans(points, weights, k, restarts=KMEANS_RESTARTS, iterations=KMEANS_ITERATIONS, seed=0):
+    # Weighted k-means with k-means++ seeding; the best of a few restarts (lowest weighted inertia)
+    rng = np.random.default_rng(seed)
+    k = min(k, len(points))
+    best = None
+    for _ in range(restarts):
+        centers = points[[rng.choice(len(points), p=weights / weights.sum())]]
+        while len(centers) < k:
+            d2 = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).min(axis=1) * weights
+            centers = np.vstack([centers, points[rng.choice(len(points), p=d2 / d2.sum())]])
+
+        for _ in range(iterations):
+            d2 = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+            labels = d2.argmin(axis=1)
+            onehot = np.eye(k)[labels] * weights[:, None]
+            mass = onehot.sum(axis=0)
+            moved = np.where(mass[:, None] > 0, (onehot.T @ points) / np.maximum(mass, 1e-12)[:, None], centers)
+            if np.allclose(moved, centers):
+                break
+            centers = moved
+
+        inertia = float((d2[np.arange(len(points)), labels] * weights).sum())
+        if best is None or inertia < best[0]:
+            best = (inertia, labels, centers)
+    return best[1], best[2]
+
+
+def archetype_names(centers, subjects, overall, n_subjects=2):
+    # "A + B": the occupations with the highest share relative to the overall distribution
+    names = []
+    for center in centers ** 2:
+        lift = center / overall
+        names.append(" + ".join(subjects[i] for i in np.argsort(-lift)[:n_subjects]))
+    return names
+
+
+def build_similarity_index(df_sankey, metric="js", k=TOP_K, n_archetypes=N_ARCHETYPES):
+    countries, subjects, shares, totals = profile_matrix(df_sankey)
+    similarity = SIMILARITY_METRICS[metric](shares)
+    neighbours = top_neighbours(similarity, k, eligible=totals >= MIN_NEIGHBOUR_OLIM)
+
+    overall = (shares * totals[:, None]).sum(axis=0) / totals.sum()
+    labels, centers = kmeans(np.sqrt(shares), np.sqrt(totals), n_archetypes)
+    order = np.argsort(-np.bincount(labels, weights=totals, minlength=len(centers)), kind="stable")
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    labels, centers = remap[labels], centers[order]
+
+    return {
+        "metric": metric, "countries": countries, "subjects": subjects,
+        "shares": shares, "totals": totals, "similarity": similarity, "neighbours": neighbours,
+        "archetype": labels, "archetype_names": archetype_names(centers, subjects, overall),
+    }
+
+
+def load_similarity_index(path=PAGE3_PATH, metric="js"):
+    return cached_load(f"country_similarity_{metric}", [path],
+                       lambda: build_similarity_index(load_sankey_data(path), metric))
+
+
+def similar_countries(index, country, k=TOP_K):
+    # [(country, similarity)], most similar first; [] for an unknown country
+    if country not in index["countries"]:
+        return []
+    i = index["countries"].index(country)
+    return [(index["countries"][j], float(index["similarity"][i, j])) for j in index["neighbours"][i][:k]]
+
+
+def archetype_members(index, archetype):
+    # Countries of one archetype, by number of olim
+    members = np.flatnonzero(index["archetype"] == archetype)
+    members = members[np.argsort(-index["totals"][members], kind="stable")]
+    return [index["countries"][i] for i in members]
+
+
+def archetype_of(index, country):
+    return int(index["archetype"][index["countries"].index(country)])
+
+
+if __name__ == "__main__":
+    metric = "cosine" if "--cosine" in sys.argv else "js"
+    index = load_similarity_index(metric=metric)
+    names = [a for a in sys.argv[1:] if not a.startswith("--")]
+    for a, name in enumerate(index["archetype_names"]):
+        members = archetype_members(index, a)
+        print(f"archetype {a}: {name} ({len(members)} countries) - {', '.join(members[:8])}")
+    for country in names:
+        print(f"\n{country}:")
+        for other, score in similar_countries(index, country):
+            print(f"  {other}: {score:.3f}")
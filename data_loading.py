@@ -0,0 +1,102 @@
+import json
+
+import pandas as pd
+import numpy as np
+
+from config import PATH_COUNTRY_ISO3, PATH_RAW_OLIM
+from disk_cache import cached_load
+
+# -------------------------
+# Pure dataset loaders (no Streamlit calls)
+# -------------------------
+# app.py wraps these with st.cache_data for the in-process cache; cached_load adds the
+# cross-replica disk cache, keyed on the file contents.
+
+def load_trends_data(path, iso3_path=PATH_COUNTRY_ISO3):
+    def load():
+        # We explicitly tell pandas to parse 'date' as dates
+        df = pd.read_csv(path, parse_dates=["date"])
+        hebrew_to_english = {}
+        if "Country" in df.columns:
+            temp_map = df[["erez_moza", "Country"]].dropna().drop_duplicates(subset=["erez_moza"])
+            hebrew_to_english = temp_map.set_index("erez_moza")["Country"].to_dict()
+
+        # ISO-3 codes let the map skip the browser-side lookup of free-text country names
+        # (and cover the countries that have no English name in the GDP data)
+        iso3 = pd.read_csv(iso3_path).dropna(subset=["iso3"])
+        hebrew_to_iso3 = iso3.set_index("erez_moza")["iso3"].to_dict()
+        return df, hebrew_to_english, hebrew_to_iso3
+
+    return cached_load("trends_data", [path, iso3_path], load)
+
+
+def aggregate_city_profiles(df):
+    # Several yeshuvim share one map polygon (english_id): merge them with olim-weighted means
+    unique_ids = df['english_id'].unique()
+    aggregated_rows = []
+    for eid in unique_ids:
+        group = df[df['english_id'] == eid]
+        total_vol = group['total_olim'].sum()
+        rep_name = group.sort_values('total_olim', ascending=False).iloc[0]['hebrew_name']
+        avg_madad = group['madad'].mean() if 'madad' in group.columns else 0
+
+        if total_vol > 0:
+            def w_avg(col): return (group[col] * group['total_olim']).sum() / total_vol
+            avg_age, pct_emp, pct_fem = w_avg('avg_age'), w_avg('pct_employed'), w_avg('pct_female')
+            pct_male = w_avg('pct_male')
+        else:
+            avg_age, pct_emp, pct_fem = group['avg_age'].mean(), group['pct_employed'].mean(), group['pct_female'].mean()
+            pct_male = group['pct_male'].mean()
+
+        aggregated_rows.append({
+            'english_id': eid, 'hebrew_name': rep_name, 'total_olim': total_vol,
+            'avg_age': avg_age, 'pct_employed': pct_emp, 'pct_female': pct_fem, 'pct_male': pct_male,
+            'madad': avg_madad, 'score': group['score'].mean()
+        })
+    df_final = pd.DataFrame(aggregated_rows)
+    df_final['log_total_olim'] = np.log10(df_final['total_olim'] + 1)
+
+    np.random.seed(42)
+    jitter_vals = np.random.uniform(-0.25, 0.25, size=len(df_final))
+    df_final['madad_jittered'] = df_final['madad'] + jitter_vals
+    return df_final.sort_values('hebrew_name')
+
+
+def load_city_profiles(path):
+    return cached_load("city_profiles", [path], lambda: aggregate_city_profiles(pd.read_csv(path)))
+
+
+def load_sankey_data(path):
+    return cached_load("sankey_data", [path], lambda: pd.read_csv(path))
+
+
+def load_geojson(path):
+    def load():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    return cached_load("geojson", [path], load)
+
+
+def clean_raw_olim(df):
+    # Same cleaning as preprocessing/create_final_datasets.ipynb: trimmed country names, numeric
+    # year/month and a month-start "date"; rows without a valid month are dropped
+    df = df.copy()
+    df["erez_moza"] = df["erez_moza"].astype(str).str.strip()
+    df["year_aliya"] = pd.to_numeric(df["year_aliya"], errors="coerce")
+    df["month_aliya"] = pd.to_numeric(df["month_aliya"], errors="coerce")
+    df = df.dropna(subset=["year_aliya", "month_aliya"])
+    df["date"] = pd.to_datetime(
+        df["year_aliya"].astype(int).astype(str) + "-" + df["month_aliya"].astype(int).astype(str) + "-01",
+        errors="coerce"
+    )
+    return df.dropna(subset=["date"])
+
+
+def read_raw_olim(path):
+    # The raw export is a (zipped) csv with a BOM
+    return clean_raw_olim(pd.read_csv(path, encoding="utf-8-sig"))
+
+
+def load_raw_olim(path=PATH_RAW_OLIM):
+    return cached_load("raw_olim", [path], lambda: read_raw_olim(path))
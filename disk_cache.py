@@ -0,0 +1,275 @@
+import contextvars
+import hashlib
+import importlib.metadata
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+
+import instrumentation
+
+# -------------------------
+# Persistent cache shared between replicas
+# -------------------------
+# Replicas on the same host (or on a shared volume) point VIZ_DISK_CACHE at the same location:
+#   VIZ_DISK_CACHE=sqlite:/shared/viz_cache.sqlite
+#   VIZ_DISK_CACHE=dir:/shared/viz_cache
+# Keys always include the content hash of the dataset files they were derived from,
+# so refreshing a dataset invalidates every dependent entry without any explicit purge.
+# They also include CODE_VERSION: a hash of the app's modules and of the library versions the
+# entries are pickled / serialized with, so a deploy that changes how an entry is built (or a
+# replica on another pandas) doesn't read what the old code stored.
+
+DISK_CACHE_SPEC = os.environ.get("VIZ_DISK_CACHE", "")
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+# Dataset versions pinned for the current script run / API request by hot_reload.py:
+# absolute path -> file hash. Contextvars, so each session's thread sees its own pin.
+_pinned = contextvars.ContextVar("pinned_file_hashes", default=None)
+_LOADED_VERSIONS = 2  # the previous version stays loaded for the reruns still pinned to it
+
+
+class DatasetChanged(RuntimeError):
+    # A pinned dataset version is needed but the file on disk already holds another one
+    pass
+
+
+def file_hash(path):
+    # Content hash of one file as it is on disk now. Re-hashing is skipped while (mtime, size) is unchanged.
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _fingerprints_lock:
+        cached = _fingerprints.get(path)
+    if cached is None or cached[0] != stamp:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        cached = (stamp, digest.hexdigest())
+        with _fingerprints_lock:
+            _fingerprints[path] = cached
+    return cached[1]
+
+
+def pin_file_hashes(hashes):
+    # hashes: path -> file_hash (None unpins). Returns the token for unpin_file_hashes.
+    if hashes is not None:
+        hashes = {os.path.abspath(path): h for path, h in hashes.items()}
+    return _pinned.set(hashes)
+
+
+def unpin_file_hashes(token):
+    _pinned.reset(token)
+
+
+def pinned_hash(path):
+    pinned = _pinned.get()
+    return pinned.get(os.path.abspath(path)) if pinned else None
+
+
+def check_pinned(paths):
+    # Raises DatasetChanged when a pinned file no longer has the pinned content
+    for path in paths:
+        pinned = pinned_hash(path)
+        if pinned is not None and file_hash(path) != pinned:
+            raise DatasetChanged(f"{path} changed after this run pinned its version")
+
+
+def file_fingerprint(*paths):
+    # Content hash of one or more files (the pinned version for the files hot_reload.py watches)
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update((pinned_hash(path) or file_hash(path)).encode("ascii"))
+    return digest.hexdigest()[:16]
+
+
+def code_version(project_dir=PROJECT_DIR, libraries=("pandas", "numpy", "pyarrow", "plotly")):
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(project_dir)):
+        if name.endswith(".py"):
+            with open(os.path.join(project_dir, name), "rb") as f:
+                digest.update(name.encode("utf-8") + b"\0" + f.read())
+    for library in libraries:
+        try:
+            version = importlib.metadata.version(library)
+        except importlib.metadata.PackageNotFoundError:
+            version = None
+        digest.update(f"{library}={version}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+CODE_VERSION = code_version()
+
+
+def hash_key(key):
+    # Keys are tuples of plain values (see figure_cache.make_key); repr is stable for those
+    return hashlib.sha256(repr((CODE_VERSION, key)).encode("utf-8")).hexdigest()
+
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, created REAL)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")  # readers in other processes don't block the writer
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO entries (key, value, created) VALUES (?, ?, ?)",
+                     (key, sqlite3.Binary(value), time.time()))
+        conn.commit()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM entries")
+        conn.commit()
+
+
+class DirectoryBackend:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so other replicas never read a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                os.remove(os.path.join(dirpath, name))
+
+
+class DiskCache:
+    def __init__(self, backend, name="disk_cache"):
+        self.backend = backend
+        self.name = name
+
+    def _read(self, key):
+        try:
+            return self.backend.get(hash_key(key))
+        except (OSError, sqlite3.Error):
+            return None  # a broken cache must never break the page
+
+    def get(self, key):
+        value = self._read(key)
+        instrumentation.incr(f"{self.name}.{'hit' if value is not None else 'miss'}")
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(hash_key(key), value)
+        except (OSError, sqlite3.Error):
+            instrumentation.incr(f"{self.name}.write_error")
+
+    def get_object(self, key):
+        obj = None
+        value = self._read(key)
+        if value is not None:
+            try:
+                obj = pickle.loads(value)
+            except Exception:
+                # Truncated, or pickled by code this process can't load: a miss, and it gets rebuilt
+                instrumentation.incr(f"{self.name}.read_error")
+        instrumentation.incr(f"{self.name}.{'hit' if obj is not None else 'miss'}")
+        return obj
+
+    def set_object(self, key, obj):
+        self.set(key, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def create_backend(spec):
+    if not spec:
+        return None
+    kind, _, location = spec.partition(":")
+    if kind == "sqlite":
+        return SQLiteBackend(location)
+    if kind == "dir":
+        return DirectoryBackend(location)
+    raise ValueError(f"Unknown VIZ_DISK_CACHE backend: {spec!r} (expected sqlite:<file> or dir:<folder>)")
+
+
+_disk_cache = None
+_disk_cache_ready = False
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache():
+    # Returns None when no persistent cache is configured
+    global _disk_cache, _disk_cache_ready
+    with _disk_cache_lock:
+        if not _disk_cache_ready:
+            backend = create_backend(DISK_CACHE_SPEC)
+            _disk_cache = DiskCache(backend) if backend is not None else None
+            _disk_cache_ready = True
+        return _disk_cache
+
+
+_loaded = {}  # (name, paths) -> {fingerprint: result}, the latest versions of each dataset in this process
+_loaded_lock = threading.Lock()
+
+
+def cached_load(name, paths, load_fn):
+    # Load-through helper for the dataset loaders: first this process, then another replica's
+    # result for the same file contents, and only then the real load
+    fingerprint = file_fingerprint(*paths)
+    slot = (name, tuple(paths))
+    with _loaded_lock:
+        versions = _loaded.get(slot, {})
+        if fingerprint in versions:
+            return versions[fingerprint]
+
+    disk_cache = get_disk_cache()
+    key = (name, fingerprint)
+    result = disk_cache.get_object(key) if disk_cache is not None else None
+    if result is None:
+        # load_fn reads the files as they are now: only valid if that is still the pinned version
+        check_pinned(paths)
+        with instrumentation.timed(f"load.{name}"):
+            result = load_fn()
+        check_pinned(paths)
+        if disk_cache is not None:
+            disk_cache.set_object(key, result)
+
+    with _loaded_lock:
+        versions = _loaded.setdefault(slot, {})
+        versions.pop(fingerprint, None)
+        versions[fingerprint] = result
+        while len(versions) > _LOADED_VERSIONS:
+            del versions[next(iter(versions))]
+    return result
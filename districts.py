@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from config import PAGE2_PATH, PATH_GEOJSON, PATH_RAW_OLIM, PATH_DISTRICTS
+from data_loading import aggregate_city_profiles, load_geojson, load_raw_olim
+from disk_cache import cached_load, file_fingerprint
+
+# -------------------------
+# District (machoz) rollup of page 2
+# -------------------------
+# At the wide zoom presets most yeshuv polygons are smaller than a pixel, so below
+# DISTRICT_MAX_ZOOM the page 2 map draws one shape per district instead.
+#
+# Each map polygon (english_id) goes to the district where most of its olim were recorded (the
+# raw records have "machoz" per oleh; page2_final doesn't). The olim per (yeshuv, machoz) come
+# from the raw file, or from ingest.py's running counts when it writes the sidecar after a new
+# month, so an append doesn't re-read the whole raw history. The district profile is the same
+# olim-weighted merge load_data uses for the polygons (aggregate_city_profiles), and the district
+# shapes are the member polygons of the geojson dissolved into one outline: the polygons share
+# their borders vertex for vertex, so an edge used by two members of a district is inside it and
+# the edges used once form its outline. The outlines are simplified (Douglas-Peucker) since they
+# are only drawn zoomed out.
+#
+# All of it is computed once into a sidecar (`python districts.py`, also written by ingest.py);
+# like summary.json, a sidecar whose "dataset_checksum" doesn't match the current files is
+# recomputed on load.
+
+DISTRICTS_VERSION = 1
+
+# Zoom levels below this draw districts (VIZ_DISTRICT_ZOOM). The "כל ישראל" and "דרום" presets
+# (5.8 / 6.7) are below the default, the start view (7.3) and the others are above it.
+DISTRICT_MAX_ZOOM = float(os.environ.get("VIZ_DISTRICT_ZOOM", "7.0"))
+
+# Outline tolerance in degrees (~200 m; a pixel is about 1 km at zoom 7). Holes smaller than
+# MIN_HOLE_AREA (deg², ~1 km²) are filled: they are gaps between neighbouring polygons, or small
+# yeshuvim without data, that would only show up as specks at these zoom levels.
+SIMPLIFY_TOLERANCE = 0.002
+MIN_HOLE_AREA = 1e-4
+COORD_DECIMALS = 6
+
+logger = logging.getLogger(__name__)
+
+
+def dataset_checksum(page2_path=PAGE2_PATH, geojson_path=PATH_GEOJSON, raw_path=PATH_RAW_OLIM):
+    return file_fingerprint(page2_path, geojson_path, raw_path)
+
+
+# -------------------------
+# Polygon -> district
+# -------------------------
+
+def yeshuv_machoz_counts(records):
+    # (yeshuv_klita, machoz) -> olim
+    return records.groupby(["yeshuv_klita", "machoz"]).size().rename("olim")
+
+
+def yeshuv_districts(machoz_counts):
+    # A few yeshuvim appear under more than one machoz: take the one with the most olim
+    counts = machoz_counts.rename("n").reset_index()
+    counts = counts.sort_values(["yeshuv_klita", "n"], ascending=[True, False], kind="stable")
+    return counts.drop_duplicates(subset=["yeshuv_klita"]).set_index("yeshuv_klita")["machoz"]
+
+
+def polygon_districts(df_page2, yeshuv_machoz):
+    # english_id -> machoz, weighted by the olim of the yeshuvim drawn with that polygon
+    rows = df_page2.assign(machoz=df_page2["hebrew_name"].map(yeshuv_machoz)).dropna(subset=["machoz"])
+    weights = rows.groupby(["english_id", "machoz"])["total_olim"].sum().rename("n").reset_index()
+    weights = weights.sort_values(["english_id", "n"], ascending=[True, False], kind="stable")
+    assignment = weights.drop_duplicates(subset=["english_id"]).set_index("english_id")["machoz"].to_dict()
+
+    missing = sorted(set(df_page2["english_id"]) - set(assignment))
+    if missing:
+        logger.warning("No district for %d map polygons (not in the raw records): %s", len(missing), missing[:10])
+    return assignment
+
+
+def aggregate_district_profiles(df_page2, assignment):
+    # Same merge as the polygons, one level up: the rows of a district's polygons, olim-weighted
+    df = df_page2[df_page2["english_id"].isin(assignment)]
+    n_polygons = df.groupby(df["english_id"].map(assignment))["english_id"].nunique()
+    df_district = aggregate_city_profiles(df.assign(english_id=df["english_id"].map(assignment)))
+    df_district["hebrew_name"] = df_district["english_id"]
+    df_district["n_polygons"] = df_district["english_id"].map(n_polygons).astype(int)
+    return df_district.drop(columns=["madad_jittered"]).sort_values("total_olim", ascending=False)
+
+
+# -------------------------
+# Dissolving the polygons
+# -------------------------
+
+def _signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+
+def _polygons(geometry):
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    return []
+
+
+def _boundary_edges(geometries):
+    # Directed edges of the outline of the union: exteriors turned counter-clockwise and holes
+    # clockwise, so the edges shared by two members (one in each direction) cancel out
+    counts = defaultdict(int)
+    directed = []
+    for geometry in geometries:
+        for polygon in _polygons(geometry):
+            for i, coords in enumerate(polygon):
+                ring = np.round(np.asarray(coords, dtype=float)[:, :2], COORD_DECIMALS)
+                if len(ring) < 4:
+                    continue
+                if (_signed_area(ring) > 0) != (i == 0):
+                    ring = ring[::-1]
+                points = [tuple(p) for p in ring]
+                for a, b in zip(points[:-1], points[1:]):
+                    if a != b:
+                        directed.append((a, b))
+                        counts[(a, b) if a < b else (b, a)] += 1
+    return [(a, b) for a, b in directed if counts[(a, b) if a < b else (b, a)] == 1]
+
+
+def _chain_rings(edges):
+    outgoing = defaultdict(list)
+    for a, b in edges:
+        outgoing[a].append(b)
+
+    rings = []
+    for start in list(outgoing):
+        while outgoing[start]:
+            ring = [start]
+            point = start
+            while outgoing[point]:
+                point = outgoing[point].pop()
+                ring.append(point)
+                if point == start:
+                    break
+            if len(ring) >= 4:
+                if ring[-1] != ring[0]:
+                    ring.append(ring[0])
+                rings.append(np.array(ring))
+    return rings
+
+
+def simplify_ring(ring, tolerance=SIMPLIFY_TOLERANCE):
+    # Douglas-Peucker on a closed ring, split at the vertex farthest from the first one
+    far = int(np.argmax(((ring - ring[0]) ** 2).sum(axis=1)))
+    if far == 0:
+        return ring[:1]
+
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[[0, far, len(ring) - 1]] = True
+    stack = [(0, far), (far, len(ring) - 1)]
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo < 2:
+            continue
+        a, b = ring[lo], ring[hi]
+        d = b - a
+        segment = ring[lo + 1:hi] - a
+        norm = np.hypot(d[0], d[1])
+        if norm == 0:
+            dist = np.hypot(segment[:, 0], segment[:, 1])
+        else:
+            dist = np.abs(d[0] * segment[:, 1] - d[1] * segment[:, 0]) / norm
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            keep[lo + 1 + i] = True
+            stack.extend([(lo, lo + 1 + i), (lo + 1 + i, hi)])
+    return ring[keep]
+
+
+def _contains(ring, point):
+    # Even-odd rule
+    x, y = ring[:, 0], ring[:, 1]
+    x0, y0, x1, y1 = x[:-1], y[:-1], x[1:], y[1:]
+    crosses = (y0 > point[1]) != (y1 > point[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = x0 + (point[1] - y0) * (x1 - x0) / (y1 - y0)
+    return bool(np.count_nonzero(crosses & (point[0] < x_at)) % 2)
+
+
+def dissolve(geometries, tolerance=SIMPLIFY_TOLERANCE, min_hole_area=MIN_HOLE_AREA):
+    # -> MultiPolygon geometry of the union, without the slivers and small holes
+    outers, holes = [], []
+    for ring in _chain_rings(_boundary_edges(geometries)):
+        ring = simplify_ring(ring, tolerance)
+        area = _signed_area(ring) if len(ring) >= 4 else 0.0
+        if area >= tolerance ** 2:
+            outers.append(ring)
+        elif area <= -min_hole_area:
+            holes.append(ring)
+
+    polygons = [[outer] for outer in outers]
+    for hole in holes:
+        containing = [i for i, outer in enumerate(outers) if _contains(outer, hole[0])]
+        if containing:
+            smallest = min(containing, key=lambda i: _signed_area(outers[i]))
+            polygons[smallest].append(hole)
+
+    coordinates = [[np.round(ring, COORD_DECIMALS).tolist() for ring in polygon] for polygon in polygons]
+    return {"type": "MultiPolygon", "coordinates": coordinates}
+
+
+def _bounds(geometry):
+    points = np.array([p for polygon in geometry["coordinates"] for p in polygon[0]])
+    (lon_min, lat_min), (lon_max, lat_max) = points.min(axis=0), points.max(axis=0)
+    return [float(lon_min), float(lat_min), float(lon_max), float(lat_max)]
+
+
+# -------------------------
+# Sidecar
+# -------------------------
+
+def build_districts(page2_path=PAGE2_PATH, geojson_path=PATH_GEOJSON, raw_path=PATH_RAW_OLIM, machoz_counts=None):
+    # machoz_counts: yeshuv_machoz_counts of all the records (read from the raw file when not given)
+    df_page2 = pd.read_csv(page2_path)
+    geometries = {feature.get("id"): feature["geometry"] for feature in load_geojson(geojson_path)["features"]}
+    if machoz_counts is None:
+        machoz_counts = yeshuv_machoz_counts(load_raw_olim(raw_path))
+    assignment = polygon_districts(df_page2, yeshuv_districts(machoz_counts))
+    # Only what the yeshuv map draws too (a few ids, e.g. "no_jurisdiction", have no polygon)
+    assignment = {eid: district for eid, district in assignment.items() if eid in geometries}
+    df_district = aggregate_district_profiles(df_page2, assignment)
+
+    members = defaultdict(list)
+    for eid, district in assignment.items():
+        members[district].append(geometries[eid])
+
+    features = []
+    for district in df_district["english_id"]:
+        geometry = dissolve(members[district])
+        features.append({"type": "Feature", "id": district, "properties": {"bounds": _bounds(geometry)},
+                         "geometry": geometry})
+
+    return {
+        "version": DISTRICTS_VERSION,
+        "dataset_checksum": dataset_checksum(page2_path, geojson_path, raw_path),
+        "polygon_district": assignment,
+        "profiles": json.loads(df_district.to_json(orient="records", force_ascii=False)),
+        "geojson": {"type": "FeatureCollection", "features": features},
+    }
+
+
+def write_districts(path=PATH_DISTRICTS, page2_path=PAGE2_PATH, geojson_path=PATH_GEOJSON, raw_path=PATH_RAW_OLIM,
+                    machoz_counts=None):
+    districts = build_districts(page2_path, geojson_path, raw_path, machoz_counts)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(districts, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    return districts
+
+
+def read_districts(path=PATH_DISTRICTS):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        districts = json.load(f)
+    return districts if districts.get("version") == DISTRICTS_VERSION else None
+
+
+def load_districts(path=PATH_DISTRICTS, page2_path=PAGE2_PATH, geojson_path=PATH_GEOJSON, raw_path=PATH_RAW_OLIM):
+    # -> (district profiles DataFrame, dissolved geojson, english_id -> district)
+    def load():
+        districts = read_districts(path)
+        if districts is None or districts["dataset_checksum"] != dataset_checksum(page2_path, geojson_path, raw_path):
+            logger.warning("District sidecar %s is %s; computing it from the datasets",
+                           path, "missing" if districts is None else "stale")
+            districts = build_districts(page2_path, geojson_path, raw_path)
+        df_district = pd.DataFrame(districts["profiles"])
+        df_district["log_total_olim"] = np.log10(df_district["total_olim"] + 1)
+        return df_district, districts["geojson"], districts["polygon_district"]
+
+    return cached_load("districts", [path, page2_path, geojson_path, raw_path], load)
+
+
+def district_view(geojson, district, max_zoom=10.0):
+    # A map_view centered on a district, zoomed in past DISTRICT_MAX_ZOOM so its yeshuvim are drawn
+    for feature in geojson["features"]:
+        if feature["id"] == district:
+            lon_min, lat_min, lon_max, lat_max = feature["properties"]["bounds"]
+            # Fit the larger side into the ~500px map (360 degrees span 512px at zoom 0)
+            span = max(lon_max - lon_min, (lat_max - lat_min) * 1.2, 1e-3)
+            zoom = min(max(np.log2(360 / span * 500 / 512) - 0.3, DISTRICT_MAX_ZOOM + 0.2), max_zoom)
+            return {"lat": round((lat_min + lat_max) / 2, 4), "lon": round((lon_min + lon_max) / 2, 4),
+                    "zoom": round(float(zoom), 2)}
+    return None
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        districts = read_districts()
+        fresh = districts is not None and districts["dataset_checksum"] == dataset_checksum()
+        print("up to date" if fresh else "stale or missing: run `python districts.py`")
+        sys.exit(0 if fresh else 1)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    districts = write_districts()
+    size = os.path.getsize(PATH_DISTRICTS)
+    print(f"{len(districts['profiles'])} districts, {len(districts['polygon_district'])} polygons -> {PATH_DISTRICTS} ({size / 1024:.0f} KB)")
@@ -0,0 +1,205 @@
+import os
+import pickle
+import threading
+import time
+
+import pandas as pd
+
+import instrumentation
+from config import PATH_RAW_OLIM, OLIM_PARTITIONS
+from disk_cache import get_disk_cache
+from figure_cache import FigureCache, get_figure_cache, make_key
+from figures import build_explorer_figure
+from partitions import olim_manifest, olim_version, manifest_version, partition_paths, manifest_years
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# -------------------------
+# Ad-hoc explorer over the raw olim records
+# -------------------------
+# The raw records are queried in process by DuckDB over their year-partitioned Parquet copy
+# (partitions.py): only the years in the query's range and the columns it touches are read, and
+# the work is bounded by the engine's memory limit and thread count rather than by the size of
+# the history. Without duckdb the same queries run on pandas. The partitions also hold the
+# months ingest.py added after the raw file, so results are cached on the partitions' version.
+#
+#   VIZ_EXPLORER_MEMORY_MB   -> DuckDB memory limit, shared by all running queries (default 512)
+#   VIZ_EXPLORER_THREADS     -> DuckDB worker threads (default 2)
+#   VIZ_EXPLORER_CACHE_MB    -> memory for cached query results (default 64)
+
+EXPLORER_MEMORY_MB = int(os.environ.get("VIZ_EXPLORER_MEMORY_MB", "512"))
+EXPLORER_THREADS = int(os.environ.get("VIZ_EXPLORER_THREADS", "2"))
+EXPLORER_CACHE_MB = float(os.environ.get("VIZ_EXPLORER_CACHE_MB", "64"))
+EXPLORER_MAX_GROUPS = 2000
+
+DIMENSIONS = {
+    "erez_moza": "ארץ מוצא",
+    "machoz": "מחוז",
+    "yeshuv_klita": "יישוב קליטה",
+    "gender": "מגדר",
+    "age_range": "קבוצת גיל",
+    "subject": "תחום עיסוק",
+    "year_aliya": "שנת עלייה",
+    "month_aliya": "חודש עלייה",
+}
+TIME_DIMENSIONS = ["year_aliya", "month_aliya"]
+
+# name -> (label, SQL over one group, pandas over one group); the employment / gender rules are
+# the ones page 2 was built with (ingest.py)
+MEASURES = {
+    "olim": ("מספר עולים", "COUNT(*)", lambda g: len(g)),
+    "avg_age": ("גיל ממוצע", "AVG(age)", lambda g: g["age"].mean()),
+    "pct_female": ("אחוז נשים", "100.0 * AVG(CASE WHEN gender = 'נקבה' THEN 1 ELSE 0 END)",
+                   lambda g: 100.0 * (g["gender"] == "נקבה").mean()),
+    "pct_employed": ("אחוז מועסקים", "100.0 * AVG(CASE WHEN subject IN ('לא עבד', 'לא צויין') THEN 0 ELSE 1 END)",
+                     lambda g: 100.0 * (~g["subject"].isin(["לא עבד", "לא צויין"])).mean()),
+}
+
+_db = None
+_db_lock = threading.Lock()
+_distinct = {}
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+# -------------------------
+# Engines
+# -------------------------
+
+def _cursor():
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = duckdb.connect(":memory:")
+            _db.execute(f"SET memory_limit = '{EXPLORER_MEMORY_MB}MB'")
+            _db.execute(f"SET threads = {EXPLORER_THREADS}")
+        # One cursor per query: they run concurrently but share the database's memory limit
+        return _db.cursor()
+
+
+def _where(year_range, filters):
+    clauses, params = ["year_aliya BETWEEN ? AND ?"], [int(year_range[0]), int(year_range[1])]
+    for column, values in filters.items():
+        clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+    return " AND ".join(clauses), params
+
+
+# Both engines return the `limit` largest groups (most olim, ties by the dimension values), so
+# a cut keeps the same groups whatever the measure; run_query then orders them by the measure.
+
+def _query_duckdb(paths, dims, measure, year_range, filters, limit):
+    where, params = _where(year_range, filters)
+    select = ", ".join(dims + [f"{MEASURES[measure][1]} AS value", "COUNT(*) AS olim"])
+    source = "read_parquet([{}])".format(", ".join("'{}'".format(p.replace("'", "''")) for p in paths))
+    sql = (f"SELECT {select} FROM {source} WHERE {where} "
+           f"{'GROUP BY ' + ', '.join(dims) if dims else ''} "
+           f"ORDER BY {', '.join(['olim DESC'] + dims)} LIMIT {int(limit)}")
+    return _cursor().execute(sql, params).df()
+
+
+def _query_pandas(paths, dims, measure, year_range, filters, limit):
+    needed = sorted(set(dims) | set(filters) | {"year_aliya", "age", "gender", "subject"})
+    pa_filters = [(column, "in", list(values)) for column, values in filters.items()] or None
+    df = pd.concat([pd.read_parquet(p, columns=needed, filters=pa_filters) for p in paths], ignore_index=True)
+    fn = MEASURES[measure][2]
+    if not dims:
+        result = pd.DataFrame({"value": [fn(df) if len(df) else None], "olim": [len(df)]})
+    else:
+        groups = df.groupby(dims, sort=False, dropna=False)  # NULL keys are a group, as in SQL
+        # The measures' columns are selected explicitly so they stay in the groups when one of
+        # them is also a dimension (gender, subject)
+        result = groups[["age", "gender", "subject"]].apply(fn).rename("value").to_frame()
+        result["olim"] = groups.size()
+        result = result.reset_index()
+    result = result.sort_values(["olim"] + dims, ascending=[False] + [True] * len(dims), kind="stable")
+    return result.head(limit).reset_index(drop=True)
+
+
+def _normalize(dims, filters):
+    dims = [d for d in dims if d in DIMENSIONS]
+    filters = {c: sorted(v) for c, v in (filters or {}).items() if c in DIMENSIONS and v}
+    return dims, filters
+
+
+def run_query(dims, measure, year_range, filters=None, max_groups=EXPLORER_MAX_GROUPS,
+              raw_path=PATH_RAW_OLIM, root=OLIM_PARTITIONS):
+    # Returns (result DataFrame, info) - info says whether the groups were cut at max_groups
+    dims, filters = _normalize(dims, filters)
+    if measure not in MEASURES:
+        raise ValueError(f"unknown measure: {measure}")
+    paths = partition_paths(root, olim_manifest(raw_path, root), year_range)
+    engine = "duckdb" if duckdb is not None else "pandas"
+    if not paths:
+        return pd.DataFrame(columns=dims + ["value", "olim"]), {"truncated": False, "seconds": 0.0, "engine": engine}
+
+    query = _query_duckdb if duckdb is not None else _query_pandas
+    start = time.perf_counter()
+    result = query(paths, dims, measure, year_range, filters, max_groups + 1)
+    seconds = time.perf_counter() - start
+    instrumentation.record_timing("explorer.query", seconds)
+
+    truncated = len(result) > max_groups
+    result = result.head(max_groups).sort_values("value", ascending=False, kind="stable").reset_index(drop=True)
+    return result, {"truncated": truncated, "seconds": round(seconds, 4), "engine": engine}
+
+
+def get_result_cache():
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = FigureCache(EXPLORER_CACHE_MB * 1024 * 1024, name="explorer_results",
+                                        disk_cache=get_disk_cache())
+            instrumentation.register_source("explorer_results", _result_cache.stats)
+        return _result_cache
+
+
+def get_query_result(dims, measure, year_range, filters=None, raw_path=PATH_RAW_OLIM, root=OLIM_PARTITIONS):
+    # Cached on the records' version and the normalized query (filter order does not matter)
+    dims, filters = _normalize(dims, filters)
+    key = make_key("explorer", olim_version(raw_path, root), dims, measure, tuple(year_range), filters)
+    cache = get_result_cache()
+
+    payload = cache.get(key)
+    if payload is None and cache.disk_cache is not None:
+        payload = cache.disk_cache.get(key)
+        if payload is not None:
+            cache.put(key, payload)
+    if payload is not None:
+        result, info = pickle.loads(payload)
+        return result, dict(info, cached=True)
+
+    result, info = run_query(dims, measure, year_range, filters, raw_path=raw_path, root=root)
+    payload = pickle.dumps((result, info), protocol=pickle.HIGHEST_PROTOCOL)
+    cache.put(key, payload)
+    if cache.disk_cache is not None:
+        cache.disk_cache.set(key, payload)
+    return result, dict(info, cached=False)
+
+
+def get_explorer_figure(dims, measure, year_range, filters=None, raw_path=PATH_RAW_OLIM, root=OLIM_PARTITIONS):
+    dims, filters = _normalize(dims, filters)
+    key = make_key("explorer_figure", olim_version(raw_path, root), dims, measure, tuple(year_range), filters)
+
+    def build():
+        result, _ = get_query_result(dims, measure, year_range, filters, raw_path, root)
+        if result.empty:
+            return None
+        labels = dict(DIMENSIONS, value=MEASURES[measure][0], olim=MEASURES["olim"][0])
+        return build_explorer_figure(result, dims, labels)
+
+    return get_figure_cache().get_or_build(key, build)
+
+
+def distinct_values(column, raw_path=PATH_RAW_OLIM, root=OLIM_PARTITIONS):
+    # Options for the filter widgets (one column read per dataset version)
+    manifest = olim_manifest(raw_path, root)
+    key = (manifest_version(manifest), column)
+    if key not in _distinct:
+        paths = partition_paths(root, manifest, manifest_years(manifest))
+        values = pd.concat([pd.read_parquet(p, columns=[column])[column] for p in paths]).dropna().unique()
+        _distinct[key] = sorted(values.tolist())
+    return _distinct[key]
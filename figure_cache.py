@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import instrumentation
+from disk_cache import get_disk_cache
+from serialization import figure_to_json, figure_from_json
+
+# -------------------------
+# Configuration
+# -------------------------
+# Size is measured on the serialized figure JSON, which is what we actually keep in memory.
+
+FIGURE_CACHE_MAX_MB = float(os.environ.get("VIZ_FIGURE_CACHE_MB", "256"))
+FIGURE_CACHE_TTL_S = float(os.environ.get("VIZ_FIGURE_CACHE_TTL_S", "0")) or None
+
+
+def make_key(name, *parts):
+    # Normalize the filter state so equivalent requests hit the same entry:
+    # lists/sets become tuples and sets are sorted (their order carries no meaning)
+    def norm(value):
+        if isinstance(value, (set, frozenset)):
+            return tuple(sorted(norm(v) for v in value))
+        if isinstance(value, (list, tuple)):
+            return tuple(norm(v) for v in value)
+        if isinstance(value, dict):
+            return tuple(sorted((k, norm(v)) for k, v in value.items()))
+        if hasattr(value, "item"):  # numpy scalars
+            return value.item()
+        return value
+
+    return (name,) + tuple(norm(p) for p in parts)
+
+
+class FigureCache:
+    """Bounded LRU cache of built figures, stored as figure JSON.
+
+    When a disk_cache is given it acts as a second level shared with the other replicas.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds=None, name="figures", disk_cache=None):
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self.disk_cache = disk_cache
+        self._entries = OrderedDict()  # key -> (payload, size, created_at)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        payload, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[2] > self.ttl_seconds:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                instrumentation.incr(f"{self.name}.miss")
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            instrumentation.incr(f"{self.name}.hit")
+            return entry[0]
+
+    def put(self, key, payload):
+        size = len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (payload, size, time.monotonic())
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def get_or_build(self, key, build_fn, as_json=False):
+        # build_fn returns a plotly figure, or None when there is nothing to draw (None is never cached).
+        # as_json=True returns the cached figure JSON itself (for the HTTP API), without a round trip
+        # through plotly objects.
+        payload = self.get(key)
+        if payload is None and self.disk_cache is not None:
+            stored = self.disk_cache.get(key)
+            if stored is not None:
+                payload = stored.decode("utf-8")
+                self.put(key, payload)
+        if payload is not None:
+            return payload if as_json else figure_from_json(payload)
+
+        with instrumentation.timed(f"{self.name}.build"):
+            fig = build_fn()
+        if fig is None:
+            return None
+
+        payload = figure_to_json(fig, key[0])
+        self.put(key, payload)
+        if self.disk_cache is not None:
+            self.disk_cache.set(key, payload.encode("utf-8"))
+        # A fresh copy on a miss too: callers may mutate what they get without touching the cached entry
+        return payload if as_json else figure_from_json(payload)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_figure_cache = None
+_figure_cache_lock = threading.Lock()
+
+
+def get_figure_cache():
+    # One cache per server process, shared by every session (modules survive Streamlit reruns)
+    global _figure_cache
+    with _figure_cache_lock:
+        if _figure_cache is None:
+            _figure_cache = FigureCache(FIGURE_CACHE_MAX_MB * 1024 * 1024, FIGURE_CACHE_TTL_S,
+                                        disk_cache=get_disk_cache())
+            instrumentation.register_source("figure_cache", _figure_cache.stats)
+        return _figure_cache
@@ -0,0 +1,545 @@
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import matplotlib.colors as mcolors
+from plotly.colors import sample_colorscale
+
+# -------------------------
+# Pure figure builders (no Streamlit calls) so results can be cached and reused
+# -------------------------
+
+# ==============================================================================
+# PAGE 1: IMMIGRATION TRENDS
+# ==============================================================================
+
+def build_continent_color_map(all_continents):
+    default_colors = px.colors.qualitative.Plotly
+    color_map = {continent: default_colors[i % len(default_colors)]
+                 for i, continent in enumerate(all_continents)}
+    if "צפון אמריקה" in color_map: color_map["צפון אמריקה"] = "#FFEA00"
+    elif "North America" in color_map: color_map["North America"] = "#FFEA00"
+    if "אוקיאניה" in color_map: color_map["אוקיאניה"] = "#D70040"
+    if "אירופה" in color_map: color_map["אירופה"] = "#4169E1"
+    return color_map
+
+
+def build_trends_grid(base_filtered, timeline, selected_countries):
+    base_final = base_filtered[base_filtered["erez_moza"].isin(selected_countries)]
+    grid = pd.MultiIndex.from_product(
+        [timeline, selected_countries], names=["date", "erez_moza"]
+    ).to_frame(index=False)
+
+    grid = grid.merge(base_final, on=["date", "erez_moza"], how="left")
+
+    # Fill missing immigration counts with 0 (months with no immigrants)
+    grid["monthly_count"] = grid["monthly_count"].fillna(0)
+
+    # Map continent to ensure the grid has it (using the map created from base_filtered)
+    country_continent_map = base_filtered.groupby("erez_moza")["continent"].first()
+    grid["continent"] = grid["erez_moza"].map(country_continent_map)
+
+    grid = grid.dropna(subset=["gdp"])
+    if grid.empty:
+        return grid
+
+    grid = grid.sort_values(["erez_moza", "date"])
+    grid["cumulative"] = grid.groupby("erez_moza")["monthly_count"].cumsum()
+    grid["log_gdp"] = np.log1p(grid["gdp"])
+    grid["sqrt_cumulative"] = np.sqrt(grid["cumulative"])
+    grid["bubble_size"] = grid["monthly_count"].clip(lower=1) ** 0.6
+    grid["month_str"] = grid["date"].dt.strftime("%Y-%m")
+    return grid
+
+
+WAVE_COLOR = "#D62728"
+
+
+def _wave_trace(rows, styled):
+    # Rings around the bubbles of the countries inside a detected wave that month (see waves.py).
+    # Frames are merged into the trace, so only the first one carries the styling.
+    trace = go.Scatter(x=rows["log_gdp"], y=rows["sqrt_cumulative"], ids=rows["erez_moza"], text=rows["erez_moza"])
+    if styled:
+        trace.update(
+            mode="markers+text", textposition="top center", textfont=dict(size=11, color=WAVE_COLOR),
+            marker=dict(symbol="circle-open", size=14, color=WAVE_COLOR, line=dict(width=2)),
+            name="גל עלייה", hoverinfo="skip", showlegend=False
+        )
+    return trace
+
+
+def build_trends_figure(grid, color_map, all_continents, speed_ms, wave_cells=None):
+    # wave_cells: (erez_moza, month_str) rows to mark as part of a wave, or None for no wave layer
+    x_min, x_max = grid["log_gdp"].min(), grid["log_gdp"].max()
+    y_max = grid["sqrt_cumulative"].max()
+    x_range = [x_min * 0.98, x_max * 1.02]
+    y_range = [0, y_max * 1.05]
+
+    # 1. Create the base chart
+    fig = px.scatter(
+        grid, x="log_gdp", y="sqrt_cumulative", color="continent",
+        color_discrete_map=color_map, size="bubble_size", size_max=60,
+        animation_frame="month_str", animation_group="erez_moza",
+        hover_name="erez_moza",
+        # Keep customdata purely numeric so it ships as a typed array; numbers are formatted client-side
+        hover_data={"cumulative": True, "monthly_count": True, "gdp": True, "continent": False,
+                    "log_gdp": False, "sqrt_cumulative": False, "bubble_size": False, "month_str": False},
+        labels={"log_gdp": "Log(GDP + 1)", "sqrt_cumulative": "Sqrt(Cumulative Immigrants)", "continent": ""},
+        category_orders={"continent": all_continents}
+    )
+
+    # 2. Define custom hover template (one trace per continent, so the trace name is the continent)
+    my_hover_template = (
+        "<b>%{hovertext}</b><br>" +
+        "<span style='font-size: 10px; color: #666;'>%{fullData.name}</span><br><br>" +
+        "סך העולים: <b>%{customdata[0]:,.0f}</b><br>" +
+        "עולים חודשיים: <b>%{customdata[1]:,.0f}</b><br>" +
+        "תל\"ג (שנתי): <b>$%{customdata[2]:,.0f}</b>" +
+        "<extra></extra>"
+    )
+
+    # Apply hover template to the existing bubbles (Trace 0) BEFORE we add the text
+    fig.update_traces(hovertemplate=my_hover_template, marker=dict(opacity=0.9, line=dict(width=1, color='DarkSlateGrey')))
+
+    # px also appends the hidden hover columns (strings included) to customdata, which turns it into an
+    # object array; keep only the three numeric columns the template uses so it serializes as a typed array
+    for trace in list(fig.data) + [t for frame in fig.frames for t in frame.data]:
+        trace.customdata = np.asarray(trace.customdata[:, :3], dtype=float)
+
+    # 3. Calculate Position for Background Text (center of the plot)
+    text_x_pos = x_range[0] + (x_range[1] - x_range[0]) * 0.5
+    text_y_pos = y_range[1] * 0.5
+
+    # 4. Create the Background Text Trace
+    background_text_trace = go.Scatter(
+        x=[text_x_pos],
+        y=[text_y_pos],
+        text=[grid["month_str"].min()],
+        mode="text",
+        textfont=dict(size=160, color="rgba(200, 200, 200, 0.25)"), # Slightly transparent
+        textposition="middle center", # Centers the text on the coordinates
+        hoverinfo="skip", # CRITICAL: Ensures hovering the year doesn't break things
+        showlegend=False
+    )
+
+    # 5. Add trace and Reorder safely to fix ValueError
+    fig.add_trace(background_text_trace)
+    # Move the last trace (text) to the front (index 0) so it is behind bubbles
+    fig.data = fig.data[-1:] + fig.data[:-1]
+
+    # 6. Update all Animation Frames
+    for frame in fig.frames:
+        # Create the text trace for this specific frame
+        frame_text_trace = go.Scatter(
+            x=[text_x_pos],
+            y=[text_y_pos],
+            text=[frame.name],
+            mode="text",
+            textfont=dict(size=160, color="rgba(200, 200, 200, 0.25)"),
+            textposition="middle center",
+            hoverinfo="skip",
+            showlegend=False
+        )
+        # Insert text trace at index 0 for every frame to match fig.data
+        frame.data = (frame_text_trace,) + frame.data
+
+        # Frames are merged into the existing traces, so the bubbles keep the hover template
+        # (and marker styling) of fig.data - no need to ship the same string in every frame
+        for trace in frame.data:
+            if trace.mode != "text":
+                trace.hovertemplate = None
+
+    # Wave markers: one more trace, last in the figure and in every frame
+    if wave_cells is not None:
+        marked = grid.merge(wave_cells, on=["erez_moza", "month_str"])
+        by_month = dict(tuple(marked.groupby("month_str")))
+        empty = marked.iloc[:0]
+        fig.add_trace(_wave_trace(by_month.get(grid["month_str"].min(), empty), styled=True))
+        for frame in fig.frames:
+            frame.data = frame.data + (_wave_trace(by_month.get(frame.name, empty), styled=False),)
+
+    # 7. Configure Layout
+    fig.update_layout(
+        height=700,
+        margin=dict(l=20, r=20, t=90, b=130),
+        xaxis=dict(range=x_range, title="""לוגריתם תל"ג"""),
+        yaxis=dict(range=y_range, title="שורש כמות העולים המצטברת"),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        hoverlabel=dict(align="right")
+    )
+
+    # 8. Optimization: Enable smooth animation
+    if fig.layout.updatemenus:
+        btn = fig.layout.updatemenus[0].buttons[0]
+        btn.args[1]["frame"]["duration"] = speed_ms
+        btn.args[1]["transition"]["duration"] = max(0, int(speed_ms * 0.5))
+        btn.args[1]["frame"]["redraw"] = False  # Smooth animation
+
+    if fig.layout.sliders:
+        fig.layout.sliders[0].currentvalue = {"visible": False}
+        fig.layout.sliders[0].pad = {"t": 90}
+        for step in fig.layout.sliders[0].steps:
+            step["args"][1]["frame"]["redraw"] = False
+
+    # Static annotation for Legend Title
+    fig.add_annotation(
+        text="<b>יבשות</b>",
+        xref="paper", yref="paper",
+        x=1.0, y=1.05,
+        xanchor="right", yanchor="bottom",
+        showarrow=False,
+        font=dict(size=14)
+    )
+    return fig
+
+
+COUNTRY_MAP_HOVERTEMPLATE = (
+    "<b>%{text}</b><br>" +
+    "<span style='font-size: 10px; color: #666;'>%{fullData.name}</span><br>" +
+    "<extra></extra>"
+)
+
+
+def _continent_choropleths(countries, color_map, all_continents, opacity):
+    # One single-color trace per continent (what px.choropleth(color="continent") produced)
+    traces = []
+    for continent in all_continents:
+        part = countries[countries["continent"] == continent]
+        if part.empty:
+            continue
+        color = color_map[continent]
+        traces.append(go.Choropleth(
+            locations=part["iso3"], locationmode="ISO-3",
+            z=np.ones(len(part)), colorscale=[[0, color], [1, color]], showscale=False,
+            marker=dict(opacity=opacity, line=dict(color="white", width=0.5)),
+            text=part["erez_moza"], name=continent,
+            hovertemplate=COUNTRY_MAP_HOVERTEMPLATE, showlegend=False
+        ))
+    return traces
+
+
+def build_country_base_map(countries, color_map, all_continents):
+    # countries: one row per country (erez_moza, continent, iso3). Built once per dataset version;
+    # the continent filter only toggles the visibility of these traces.
+    fig = go.Figure(data=_continent_choropleths(countries, color_map, all_continents, opacity=0.2))
+    fig.update_geos(
+        showland=True, landcolor="#E0E0E0", showcountries=True,
+        countrycolor="white", projection_type="natural earth",
+        showframe=False, showcoastlines=False
+    )
+    fig.update_layout(
+        height=200, margin=dict(l=0, r=0, t=0, b=0),
+        showlegend=False, geo=dict(projection_scale=1.2)
+    )
+    return fig
+
+
+def add_country_highlight(fig, selected, color_map, all_continents, visible_continents):
+    for trace in fig.data:
+        trace.visible = trace.name in visible_continents
+    fig.add_traces(_continent_choropleths(selected, color_map, all_continents, opacity=1.0))
+    return fig
+
+
+# ==============================================================================
+# PAGE 2: CITY PROFILES
+# ==============================================================================
+
+CITY_FEATURES = [
+    {'label': 'גיל ממוצע', 'col': 'avg_age', 'plot_col': 'avg_age', 'suffix': ''},
+    {'label': 'מדד', 'col': 'madad', 'plot_col': 'madad_jittered', 'suffix': ''},
+    {'label': '% תעסוקה', 'col': 'pct_employed', 'plot_col': 'pct_employed', 'suffix': '%'},
+    {'label': '% נשים', 'col': 'pct_female', 'plot_col': 'pct_female', 'suffix': '%'},
+]
+
+
+def get_dense_color(value, vmin, vmax, opacity=1.0):
+    # Sample the "dense" scale at the normalized value, as rgba (for the line opacity)
+    norm_val = (value - vmin) / (vmax - vmin) if vmax > vmin else 0.5
+    color_string = sample_colorscale("dense", [norm_val])[0]
+    if color_string.startswith("rgb"):
+        return color_string.replace("rgb", "rgba").replace(")", f", {opacity})")
+    elif color_string.startswith("#"):
+        h = color_string.lstrip('#')
+        r, g, b = tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
+        return f"rgba({r}, {g}, {b}, {opacity})"
+    return color_string
+
+
+def get_nice_ticks(min_v, max_v):
+    if min_v == max_v: return [min_v]
+    target_ticks = np.linspace(min_v, max_v, 5)
+    nice_ticks = []
+    for t in target_ticks:
+        if abs(t) >= 10: nice_ticks.append(int(round(t)))
+        elif abs(t) >= 1: nice_ticks.append(round(t, 1))
+        else: nice_ticks.append(round(t, 2))
+    return sorted(list(set(nice_ticks)))
+
+
+def city_draw_order(df_profile, current_selection):
+    # Selected cities are drawn last (on top); the line chart's curveNumber indexes this list
+    if not current_selection:
+        return df_profile['english_id'].tolist()
+    selected = set(current_selection)
+    bg_ids = [x for x in df_profile['english_id'] if x not in selected]
+    fg_ids = [x for x in df_profile['english_id'] if x in selected]
+    return bg_ids + fg_ids
+
+
+def build_city_lines_figure(df_profile, current_selection, features=CITY_FEATURES):
+    is_all_mode = (len(current_selection) == 0)
+    selected = set(current_selection)
+    ranges = {}
+    for f in features:
+        ranges[f['col']] = {
+            'min_real': df_profile[f['col']].min(), 'max_real': df_profile[f['col']].max(),
+            'min_plot': df_profile[f['plot_col']].min(), 'max_plot': df_profile[f['plot_col']].max()
+        }
+    log_min, log_max = df_profile['log_total_olim'].min(), df_profile['log_total_olim'].max()
+
+    traces, annotations, shapes = [], [], []
+    x_labels = [f['label'] for f in features]
+    rows = df_profile.drop_duplicates(subset=['english_id']).set_index('english_id', drop=False)
+
+    for eid in city_draw_order(df_profile, current_selection):
+        row = rows.loc[eid]
+        is_selected = (eid in selected) or is_all_mode
+
+        if is_all_mode:
+            line_color = get_dense_color(row['log_total_olim'], log_min, log_max, opacity=0.35)
+            line_width = 1.5; hover_info = 'text'
+            htemplate = f"<b>{row['hebrew_name']}</b><br>מדד: {row['madad']:.2f}<br>עולים: {int(row['total_olim']):,}<extra></extra>"
+        else:
+            if is_selected:
+                line_color = get_dense_color(row['log_total_olim'], log_min, log_max, opacity=1.0)
+                line_width = 4.0; hover_info = 'text'
+                htemplate = f"<b>{row['hebrew_name']}</b><br>מדד: {row['madad']:.2f}<br>עולים: {int(row['total_olim']):,}<extra></extra>"
+            else:
+                line_color = 'rgba(200, 200, 200, 0.05)'; line_width = 1.0; hover_info = 'skip'; htemplate = None
+
+        y_vals, hover_texts = [], []
+        for f in features:
+            r = ranges[f['col']]
+            val_plot = row[f['plot_col']]; val_real = row[f['col']]
+            norm = 0.5 if r['max_plot'] == r['min_plot'] else (val_plot - r['min_plot']) / (r['max_plot'] - r['min_plot'])
+            y_vals.append(norm)
+            hover_texts.append(f"{val_real:.1f}{f['suffix']}")
+
+        traces.append(go.Scatter(
+            x=x_labels, y=y_vals, mode='lines',
+            line=dict(color=line_color, width=line_width),
+            name=row['hebrew_name'], text=hover_texts, hovertemplate=htemplate,
+            showlegend=False, hoverinfo=hover_info
+        ))
+
+    for i, f in enumerate(features):
+        r = ranges[f['col']]
+        shapes.append(dict(type="line", x0=i, x1=i, y0=-0.05, y1=1.05, line=dict(color="gray", width=1.5), xref="x", yref="y"))
+        ticks = get_nice_ticks(r['min_real'], r['max_real'])
+        for t in ticks:
+            if r['max_real'] == r['min_real']: y_pos = 0.5
+            else: y_pos = (t - r['min_plot']) / (r['max_plot'] - r['min_plot'])
+            annotations.append(dict(x=i, y=y_pos, text=f"– {t}{f['suffix']}", showarrow=False, xanchor="left", font=dict(size=12, color="black", weight="bold"), xref='x', yref='y', xshift=2))
+        annotations.append(dict(x=i, y=1.1, text=f"<b>{f['label']}</b>", showarrow=False, font=dict(size=13, color="black"), xref='x', yref='y'))
+
+    fig_lines = go.Figure(data=traces)
+    fig_lines.update_layout(
+        title="השוואת מדדים (ניתן ללחוץ על קו לבחירה)",
+        xaxis=dict(showgrid=False, showticklabels=False, range=[-0.2, len(features)-0.5]),
+        yaxis=dict(showgrid=False, showticklabels=False, range=[-0.1, 1.15]),
+        margin=dict(l=20, r=20, b=20, t=60), height=500, hovermode='closest', annotations=annotations, shapes=shapes, plot_bgcolor='white', dragmode=False
+    )
+    return fig_lines
+
+
+def build_city_base_map(df_profile, cities_geojson):
+    # Every yeshuv colored by log olim; the selection and the view are applied per request
+    df_reset = df_profile.reset_index(drop=True)
+    fig_map = go.Figure(go.Choroplethmapbox(
+        geojson=cities_geojson, locations=df_reset['english_id'], featureidkey="id",
+        z=df_reset['log_total_olim'],
+        colorscale='dense',
+        zmin=df_reset['log_total_olim'].min(), zmax=df_reset['log_total_olim'].max(),
+        marker_opacity=1.0,
+        marker_line_width=1, marker_line_color='white',
+        text=df_reset['hebrew_name'], customdata=df_reset['total_olim'],
+        hovertemplate="<b>%{text}</b><br>סה\"כ עולים: %{customdata:,}<extra></extra>",
+        showscale=True,
+        colorbar=dict(title="סקאלת עולים", orientation="h", y=-0.15, thickness=15),
+        selected=dict(marker=dict(opacity=1.0)),
+        unselected=dict(marker=dict(opacity=0.4))
+    ))
+    fig_map.update_layout(
+        mapbox_style="carto-positron",
+        margin={"r":0,"t":30,"l":0,"b":0}, height=500, clickmode='event+select', title="מפת עולים"
+    )
+    return fig_map
+
+
+def apply_city_map_state(fig_map, df_profile, current_selection, map_view):
+    df_reset = df_profile.reset_index(drop=True)
+    selected_indices = None
+    if current_selection:
+        selected_indices = df_reset.index[df_reset['english_id'].isin(current_selection)].tolist()
+    fig_map.update_traces(selectedpoints=selected_indices)
+    fig_map.update_layout(
+        mapbox_center={"lat": map_view["lat"], "lon": map_view["lon"]},
+        mapbox_zoom=map_view["zoom"],
+    )
+    return fig_map
+
+
+def build_district_map(df_district, districts_geojson, map_view):
+    # The zoomed-out map: one dissolved shape per district (districts.py), clicking one drills down
+    df_reset = df_district.reset_index(drop=True)
+    customdata = df_reset[['total_olim', 'avg_age', 'pct_employed', 'n_polygons']].to_numpy()
+    fig_map = go.Figure(go.Choroplethmapbox(
+        geojson=districts_geojson, locations=df_reset['english_id'], featureidkey="id",
+        z=df_reset['log_total_olim'],
+        colorscale='dense',
+        zmin=df_reset['log_total_olim'].min() - 0.1, zmax=df_reset['log_total_olim'].max(),
+        marker_opacity=0.9,
+        marker_line_width=1.5, marker_line_color='white',
+        text=df_reset['hebrew_name'], customdata=customdata,
+        hovertemplate="<b>%{text}</b><br>סה\"כ עולים: %{customdata[0]:,}<br>גיל ממוצע: %{customdata[1]:.1f}"
+                      "<br>% תעסוקה: %{customdata[2]:.1f}%<br>%{customdata[3]} יישובים (לחצו לפירוט)<extra></extra>",
+        showscale=False,
+    ))
+    fig_map.update_layout(
+        mapbox_style="carto-positron",
+        mapbox_center={"lat": map_view["lat"], "lon": map_view["lon"]}, mapbox_zoom=map_view["zoom"],
+        margin={"r":0,"t":30,"l":0,"b":0}, height=500, clickmode='event+select', title="מפת עולים לפי מחוז"
+    )
+    return fig_map
+
+
+# ==============================================================================
+# PAGE 3: PROFESSIONAL FLOW (SANKEY)
+# ==============================================================================
+
+def get_rgba_string(color_val, opacity):
+    if color_val.startswith('rgb'):
+        if 'rgba' in color_val:
+            return color_val
+        else:
+            return color_val.replace('rgb', 'rgba').replace(')', f', {opacity})')
+    else:
+        try:
+            rgba = mcolors.to_rgba(color_val, alpha=opacity)
+            return f'rgba({int(rgba[0]*255)}, {int(rgba[1]*255)}, {int(rgba[2]*255)}, {rgba[3]})'
+        except:
+            return f'rgba(128, 128, 128, {opacity})'
+
+
+def build_sankey_figure(df_sankey, selected_countries):
+    # 1. Filter Data
+    flows = df_sankey[df_sankey['erez_moza'].isin(selected_countries)].copy()
+
+    # 2. Prepare Sankey Data
+    unique_countries = list(selected_countries)
+    unique_subjects = flows['subject'].unique().tolist()
+    all_labels = unique_countries + unique_subjects
+
+    # Formatted Labels
+    styled_labels = []
+    for label in all_labels:
+        styled_labels.append(f"<span style='background-color:rgba(255,255,255,0.8); color:black;'><b>{label}</b></span>")
+
+    label_map = {label: i for i, label in enumerate(all_labels)}
+
+    source_indices = flows['erez_moza'].map(label_map)
+    target_indices = flows['subject'].map(label_map)
+    values = flows['count']
+
+    # 3. Coloring Logic
+    color_palette = px.colors.qualitative.Bold
+    country_color_map = {
+        country: color_palette[i % len(color_palette)]
+        for i, country in enumerate(unique_countries)
+    }
+
+    node_colors = [country_color_map[label] if label in country_color_map else "lightgrey" for label in all_labels]
+    link_colors = [get_rgba_string(country_color_map[row['erez_moza']], 0.4) for _, row in flows.iterrows()]
+
+    # 4. Create Plot
+    fig = go.Figure(data=[go.Sankey(
+        node=dict(
+            pad=20,
+            thickness=30,
+            line=dict(color="black", width=0.5),
+            label=styled_labels,
+            color=node_colors,
+            # Node Hover: Added <span style='color:black'> to force the number to match the text
+            hovertemplate='<b>%{label}</b><br>כמות: <span style="color:black"><b>%{value:,.0f}</b></span><extra></extra>',
+            align='right'
+        ),
+        link=dict(
+            source=source_indices,
+            target=target_indices,
+            value=values,
+            color=link_colors,
+            # Link Hover: Added <span style='color:black'> to force the number to match the text
+            hovertemplate=(
+                'מדינת מוצא: <b>%{source.label}</b>' +
+                '<br>' +
+                'מקצוע: <b>%{target.label}</b>' +
+                '<br>' +
+                'כמות: <span style="color:black"><b>%{value:,.0f}</b></span><extra></extra>'
+            )
+        )
+    )])
+
+    fig.update_layout(
+        title=dict(
+            text="<b>התפלגות מקצועות לפי מדינות מוצא</b>",
+            x=1,
+            xanchor='right'
+        ),
+        title_font_size=20,
+        font=dict(family="Arial, sans-serif", size=14, color="black"),
+        plot_bgcolor='white',
+        height=700,
+        margin=dict(l=10, r=10, t=50, b=10),
+    )
+    return fig
+
+
+# ==============================================================================
+# PAGE 4: EXPLORER (ad-hoc aggregations of the raw records)
+# ==============================================================================
+
+def build_explorer_figure(result, dims, labels):
+    # result: one row per group with the dims, "value" and "olim" (group size).
+    # 1st dim -> x axis, 2nd -> color, 3rd -> facets; year/month on the x axis make it a line chart
+    df = result.copy()
+    dims = list(dims)
+    if "year_aliya" in dims and "month_aliya" in dims:
+        # Both time columns together read as one monthly axis
+        df["period"] = df["year_aliya"].astype(int).astype(str) + "-" + df["month_aliya"].astype(int).map("{:02d}".format)
+        dims = ["period"] + [d for d in dims if d not in ("year_aliya", "month_aliya")]
+        labels = dict(labels, period="חודש")
+
+    hover_data = {"olim": ":,.0f"}
+    if not dims:
+        return px.bar(df.assign(all="הכל"), x="all", y="value", labels=labels, hover_data=hover_data)
+
+    x, color, facet = (dims + [None, None])[:3]
+    is_time = x in ("period", "year_aliya", "month_aliya")
+    if is_time:
+        df = df.sort_values(x)
+    for d in (color, facet):
+        if d is not None:
+            df[d] = df[d].astype(str)
+
+    kwargs = dict(x=x, y="value", color=color, facet_col=facet, facet_col_wrap=3 if facet else 0,
+                  labels=labels, hover_data=hover_data)
+    if is_time:
+        fig = px.line(df, markers=True, **kwargs)
+    else:
+        fig = px.bar(df, barmode="group", **kwargs)
+        fig.update_xaxes(categoryorder="total descending")
+
+    fig.update_layout(height=600 if facet else 500, legend=dict(orientation="h", y=1.08, x=1, xanchor="right"),
+                      hoverlabel=dict(align="right"))
+    return fig
@@ -0,0 +1,284 @@
+import contextvars
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import instrumentation
+from config import PAGE1_PATH, PAGE2_PATH, PAGE3_PATH, PATH_GEOJSON
+from disk_cache import file_hash, pin_file_hashes, unpin_file_hashes, DatasetChanged
+
+# -------------------------
+# Hot reload of the datasets
+# -------------------------
+# Refreshing the files under datasets/ used to need a restart of every Streamlit process. With
+# VIZ_HOT_RELOAD=1 a background thread polls the watched files instead. A change is picked up
+# once the files have stopped changing for one poll (a copy in progress is never read). The
+# watcher then builds the new version's datasets, indexes and default figures (the warm-up
+# tasks) in the background and only then publishes it.
+#
+# A version is the content hash of every watched file. Every script run (and API request) pins
+# the version published when it started (disk_cache.pin_file_hashes): all its cache keys use
+# those hashes, so a rerun that was in flight during the swap keeps getting the old version's
+# objects (kept in memory next to the new ones, see cached_load / partitions). Swapping is a
+# single assignment, so a run sees the old version or the new one, never a mix. If a run needs
+# something of its version that was never built and the file has moved on, it gets
+# DatasetChanged rather than the new content.
+#
+# A version whose build fails (e.g. a broken csv) is not published; the app keeps serving the
+# previous one until the files change again.
+#
+#   VIZ_HOT_RELOAD=1           -> start the watcher on the first script run of the process
+#   VIZ_HOT_RELOAD_POLL_S      -> seconds between polls (default 5)
+#
+# `python hot_reload.py --verify` runs the whole cycle on temporary files.
+
+HOT_RELOAD_ENABLED = os.environ.get("VIZ_HOT_RELOAD") == "1"
+POLL_SECONDS = float(os.environ.get("VIZ_HOT_RELOAD_POLL_S", "5"))
+WATCHED_PATHS = (PAGE1_PATH, PAGE2_PATH, PAGE3_PATH, PATH_GEOJSON)
+
+logger = logging.getLogger(__name__)
+
+_watcher = None
+_started_lock = threading.Lock()
+
+
+def _stamps(paths):
+    # (mtime, size) of each file; None while a file is missing (being replaced)
+    stamps = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps[path] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamps[path] = None
+    return stamps
+
+
+def rebuild_caches():
+    # The warm-up tasks, run with the new version pinned (see warmup.run_tasks)
+    import warmup
+    failed = [t for t in warmup.run_tasks(label="reload") if not t["ok"]]
+    if failed:
+        raise RuntimeError("; ".join(f"{t['task']}: {t['error']}" for t in failed))
+
+
+class DatasetWatcher:
+    def __init__(self, paths=WATCHED_PATHS, rebuild=rebuild_caches, poll_seconds=POLL_SECONDS):
+        self.paths = list(paths)
+        self.rebuild = rebuild
+        self.poll_seconds = poll_seconds
+        self.version = None  # {"number", "hashes": path -> file hash, "stamps", "published_at"}
+        self._candidate = None  # stamps that differed on the previous poll, waiting to settle
+        self._failed = set()  # hash sets whose build failed, not retried until the files change again
+        self._stop = threading.Event()
+        self.swaps = 0
+        self.failures = 0
+        self.last_build_seconds = None
+
+    def publish_current(self):
+        # The version the process starts with: the files as they are now
+        self.version = {"number": 1, "hashes": {p: file_hash(p) for p in self.paths},
+                        "stamps": _stamps(self.paths), "published_at": time.time()}
+        return self.version
+
+    def build(self, hashes):
+        token = pin_file_hashes(hashes)
+        start = time.perf_counter()
+        try:
+            self.rebuild()
+        finally:
+            unpin_file_hashes(token)
+            self.last_build_seconds = round(time.perf_counter() - start, 3)
+
+    def poll(self):
+        # One step of the watcher; returns True when it published a new version
+        stamps = _stamps(self.paths)
+        if stamps == self.version["stamps"]:
+            self._candidate = None
+            return False
+        if stamps != self._candidate or None in stamps.values():
+            self._candidate = stamps
+            return False
+        self._candidate = None
+
+        hashes = {p: file_hash(p) for p in self.paths}
+        if hashes == self.version["hashes"]:
+            self.version = dict(self.version, stamps=stamps)  # touched, same content
+            return False
+        failed_key = tuple(sorted(hashes.items()))
+        if failed_key in self._failed:
+            return False
+
+        try:
+            self.build(hashes)
+        except Exception:
+            self._failed.add(failed_key)
+            self.failures += 1
+            logger.exception("Dataset version %s not published: its build failed", self.version["number"] + 1)
+            return False
+
+        # Changed again while building: the next polls pick up the newer files
+        if _stamps(self.paths) != stamps:
+            return False
+        self.version = {"number": self.version["number"] + 1, "hashes": hashes, "stamps": stamps,
+                        "published_at": time.time()}
+        self.swaps += 1
+        instrumentation.incr("hot_reload.swaps")
+        logger.info("Dataset version %s published (built in %.3fs)", self.version["number"], self.last_build_seconds)
+        return True
+
+    def run(self):
+        # Build the starting version too, so the in-flight reruns of a swap find all of it in memory
+        try:
+            self.build(self.version["hashes"])
+        except Exception:
+            logger.exception("Building the starting dataset version failed")
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Dataset watcher poll failed")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        version = self.version or {}
+        return {"version": version.get("number"), "published_at": version.get("published_at"),
+                "swaps": self.swaps, "failed_builds": self.failures, "last_build_seconds": self.last_build_seconds}
+
+
+def start_background_watcher(paths=WATCHED_PATHS, poll_seconds=POLL_SECONDS):
+    # Idempotent, like the warm-up: only the first script run of the process starts it
+    global _watcher
+    with _started_lock:
+        if _watcher is not None:
+            return _watcher
+        watcher = DatasetWatcher(paths, poll_seconds=poll_seconds)
+        watcher.publish_current()
+        _watcher = watcher
+    instrumentation.register_source("hot_reload", watcher.stats)
+    threading.Thread(target=watcher.run, name="hot-reload", daemon=True).start()
+    return watcher
+
+
+def current_version():
+    watcher = _watcher
+    return watcher.version if watcher is not None else None
+
+
+def pin_run():
+    # Called at the top of every script run: the whole run (and the figure threads it starts)
+    # uses the version published at this moment. Without the watcher nothing is pinned.
+    version = current_version()
+    pin_file_hashes(version["hashes"] if version is not None else None)
+    return version
+
+
+@contextmanager
+def pinned():
+    version = current_version()
+    token = pin_file_hashes(version["hashes"] if version is not None else None)
+    try:
+        yield version
+    finally:
+        unpin_file_hashes(token)
+
+
+# -------------------------
+# Check on temporary files
+# -------------------------
+
+def _in_version(version, fn):
+    # fn run the way a script run pinned to `version` runs it
+    def run():
+        pin_file_hashes(version["hashes"])
+        return fn()
+    return contextvars.Context().run(run)
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def verify():
+    import pandas as pd
+    from disk_cache import cached_load
+    from partitions import ensure_partitioned, load_year_range
+
+    root = tempfile.mkdtemp(prefix="hot_reload_")
+    try:
+        page_a, page_b = os.path.join(root, "a.csv"), os.path.join(root, "b.csv")
+        parts = os.path.join(root, "parts")
+        read = lambda path: pd.read_csv(path, parse_dates=["date"])
+
+        def load_a():
+            return cached_load("verify_a", [page_a], lambda: read(page_a))
+
+        def load_b():
+            return cached_load("verify_b", [page_b], lambda: read(page_b))
+
+        def snapshot():
+            # What a page would show: one value per file plus the partitioned rows of one year
+            manifest = ensure_partitioned(page_a, parts, lambda: read(page_a), lambda df: df["date"].dt.year)
+            year = load_year_range(parts, manifest, (2020, 2020))
+            return int(load_a()["n"].sum()), int(load_b()["n"].sum()), int(year["n"].sum())
+
+        def write_version(n):
+            _write(page_a, f"date,n\n2020-01-01,{n}\n2021-01-01,{n}\n")
+            _write(page_b, f"date,n\n2020-01-01,{10 * n}\n")
+
+        write_version(1)
+        watcher = DatasetWatcher([page_a, page_b], rebuild=snapshot, poll_seconds=0)
+        v1 = watcher.publish_current()
+        watcher.build(v1["hashes"])
+        checks = [("starting version", _in_version(v1, snapshot) == (2, 10, 1))]
+
+        # New files: not live until they settle (one unchanged poll) and are built
+        time.sleep(0.01)
+        write_version(2)
+        first_poll = watcher.poll()
+        checks.append(("waits for the files to settle", not first_poll and watcher.version is v1))
+        checks.append(("in-flight run keeps the old version", _in_version(v1, snapshot) == (2, 10, 1)))
+        checks.append(("published after settling", watcher.poll() and watcher.version["number"] == 2))
+        v2 = watcher.version
+        checks.append(("new runs see the new version", _in_version(v2, snapshot) == (4, 20, 2)))
+        checks.append(("old run still consistent after the swap", _in_version(v1, snapshot) == (2, 10, 1)))
+
+        # Something the old version never built, now that the file has moved on
+        try:
+            _in_version(v1, lambda: cached_load("verify_late", [page_a], lambda: read(page_a)))
+            checks.append(("late load of an old version is refused", False))
+        except DatasetChanged:
+            checks.append(("late load of an old version is refused", True))
+
+        # A broken file is not published and not retried until it changes again
+        time.sleep(0.01)
+        _write(page_b, "date,n\n2020-01-01,not a number\n")
+        broken = watcher.poll() or watcher.poll()
+        checks.append(("broken version not published", not broken and watcher.version is v2 and watcher.failures == 1))
+        checks.append(("broken version not retried", not watcher.poll() and watcher.failures == 1))
+        time.sleep(0.01)
+        write_version(3)
+        watcher.poll()
+        checks.append(("fixed files published", watcher.poll() and _in_version(watcher.version, snapshot) == (6, 30, 3)))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    for name, ok in checks:
+        print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    return all(ok for _, ok in checks)
+
+
+if __name__ == "__main__":
+    if "--verify" not in sys.argv:
+        print("usage: python hot_reload.py --verify")
+        sys.exit(2)
+    logging.basicConfig(level=logging.CRITICAL)
+    sys.exit(0 if verify() else 1)
@@ -0,0 +1,200 @@
+import argparse
+import html
+import json
+import os
+import threading
+
+from config import PATH_SHIP, PATH_PLANE_ETHIOPIA, PATH_PLANE_MODERN, HERO_VARIANTS_DIR, HERO_VARIANTS_URL
+from disk_cache import file_fingerprint
+
+# -------------------------
+# Pre-resized variants of the home page pictures
+# -------------------------
+# The pictures are stored as full-size RGBA PNGs (~200 KB each). `python image_variants.py` writes,
+# for each of them, one WebP and one JPEG per width bucket into static/hero/:
+#
+#   exodus-320.webp, exodus-320.jpg, exodus-480.webp, ..., exodus-584.jpg (the original width)
+#
+# plus _manifest.json with the source hashes and the sizes. Buckets wider than the original are
+# not made (no upscaling); the original width is always one of the buckets.
+#
+# The page draws them with a <picture> (picture_html): a WebP <source> and a JPEG <img>, each with
+# every width in its srcset, and "sizes" saying how wide the column is. The browser knows its
+# viewport and pixel ratio, so it picks the bucket (a phone, where the columns stack, gets a
+# narrow one) and the format, and fetches the file from Streamlit's static serving.
+#
+# When static serving is off (or a picture has no / stale variants) the page falls back to
+# st.image with bytes (load_hero_image). The server doesn't know the viewport there, so the bucket
+# is picked from the column's share of the page times an assumed content width and pixel ratio:
+#
+#   VIZ_HERO_CONTENT_WIDTH_PX -> width of the page's content area (default 1200, layout="wide")
+#   VIZ_HERO_DPR              -> device pixel ratio to serve for (default 1)
+#   VIZ_HERO_FORMAT           -> jpeg (default) or webp
+#
+# st.image passes JPEG (and PNG) bytes through as they are, but decodes and re-encodes anything
+# else on every rerun, so that fallback serves the JPEG variants by default. Without variants the
+# loader falls back to the original file.
+
+HERO_IMAGES = [PATH_SHIP, PATH_PLANE_ETHIOPIA, PATH_PLANE_MODERN]
+HERO_WIDTHS = (320, 480, 640, 960)
+HERO_CONTENT_WIDTH_PX = int(os.environ.get("VIZ_HERO_CONTENT_WIDTH_PX", "1200"))
+HERO_DPR = float(os.environ.get("VIZ_HERO_DPR", "1"))
+HERO_FORMAT = os.environ.get("VIZ_HERO_FORMAT", "jpeg").lower()
+STACKED_BELOW_PX = 640  # st.columns stack (each one full width) on narrower screens
+
+FORMATS = {
+    "webp": ("webp", "WEBP", {"quality": 82, "method": 6}),
+    "jpeg": ("jpg", "JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+MANIFEST_NAME = "_manifest.json"
+
+_lock = threading.Lock()
+_manifest = {}  # variants dir -> (manifest mtime, manifest)
+_bytes = {}     # (file, fingerprint) -> bytes
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def bucket_widths(original_width, widths=HERO_WIDTHS):
+    return sorted({w for w in widths if w < original_width} | {original_width})
+
+
+def build_variants(paths=HERO_IMAGES, out_dir=HERO_VARIANTS_DIR, widths=HERO_WIDTHS):
+    from PIL import Image
+
+    os.makedirs(out_dir, exist_ok=True)
+    images = {}
+    for path in paths:
+        with Image.open(path) as src:
+            src.load()
+            # JPEG has no alpha: flatten on white (the page background)
+            rgb = src.convert("RGB") if src.mode != "RGBA" else \
+                Image.alpha_composite(Image.new("RGBA", src.size, "white"), src).convert("RGB")
+
+        variants = []
+        for width in bucket_widths(rgb.width, widths):
+            height = round(rgb.height * width / rgb.width)
+            resized = rgb if width == rgb.width else rgb.resize((width, height), Image.LANCZOS)
+            for fmt, (ext, pil_format, options) in FORMATS.items():
+                name = f"{_stem(path)}-{width}.{ext}"
+                target = os.path.join(out_dir, name)
+                tmp = f"{target}.tmp"
+                resized.save(tmp, pil_format, **options)
+                os.replace(tmp, target)
+                variants.append({"format": fmt, "width": width, "height": height, "file": name,
+                                 "bytes": os.path.getsize(target)})
+
+        images[_stem(path)] = {"source": path, "source_fingerprint": file_fingerprint(path),
+                               "width": rgb.width, "height": rgb.height, "source_bytes": os.path.getsize(path),
+                               "variants": variants}
+
+    manifest = {"widths": list(widths), "images": images}
+    tmp = os.path.join(out_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST_NAME))
+    with _lock:
+        _manifest.pop(out_dir, None)
+    return manifest
+
+
+def read_manifest(out_dir=HERO_VARIANTS_DIR):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _manifest.get(out_dir)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    with _lock:
+        _manifest[out_dir] = (mtime, manifest)
+    return manifest
+
+
+def column_fraction(weights, index):
+    # st.columns([2, 3]) -> the first column gets 2/5 of the row
+    return weights[index] / float(sum(weights))
+
+
+def variants_of(path, fmt, out_dir=HERO_VARIANTS_DIR):
+    # The picture's variants in one format, narrowest first. None when there are none for this
+    # picture or they were made from a different file.
+    manifest = read_manifest(out_dir)
+    entry = manifest and manifest["images"].get(_stem(path))
+    if not entry or entry["source_fingerprint"] != file_fingerprint(path):
+        return None
+    variants = sorted((v for v in entry["variants"] if v["format"] == fmt), key=lambda v: v["width"])
+    return variants or None
+
+
+def picture_html(path, fraction, caption, out_dir=HERO_VARIANTS_DIR, base_url=HERO_VARIANTS_URL):
+    # <picture> for st.markdown(unsafe_allow_html=True), or None without (current) variants
+    webp, jpeg = variants_of(path, "webp", out_dir), variants_of(path, "jpeg", out_dir)
+    if not webp or not jpeg:
+        return None
+
+    def srcset(variants):
+        return ", ".join(f"{base_url}/{v['file']} {v['width']}w" for v in variants)
+
+    sizes = f"(max-width: {STACKED_BELOW_PX}px) 100vw, {fraction * 100:.0f}vw"
+    fallback = jpeg[-1]
+    caption = html.escape(caption)
+    return (
+        f'<figure class="hero-picture"><picture>'
+        f'<source type="image/webp" srcset="{srcset(webp)}" sizes="{sizes}">'
+        f'<img src="{base_url}/{fallback["file"]}" srcset="{srcset(jpeg)}" sizes="{sizes}" '
+        f'width="{fallback["width"]}" height="{fallback["height"]}" alt="{caption}" decoding="async">'
+        f'</picture><figcaption>{caption}</figcaption></figure>'
+    )
+
+
+def pick_variant(path, fraction, fmt=HERO_FORMAT, content_width=HERO_CONTENT_WIDTH_PX, dpr=HERO_DPR,
+                 out_dir=HERO_VARIANTS_DIR):
+    # The smallest bucket at least as wide as the column will draw it (or the widest one there is).
+    # None when there are no variants for this picture or they were made from a different file.
+    variants = variants_of(path, fmt, out_dir)
+    if not variants:
+        return None
+    needed = fraction * content_width * dpr
+    return next((v for v in variants if v["width"] >= needed), variants[-1])
+
+
+def _read(path):
+    key = (path, file_fingerprint(path))
+    with _lock:
+        data = _bytes.get(key)
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+        with _lock:
+            _bytes[key] = data
+    return data
+
+
+def load_hero_image(path, fraction, fmt=HERO_FORMAT, out_dir=HERO_VARIANTS_DIR):
+    # Bytes for st.image, read once per process: the matching variant, else the original picture
+    # (None when the picture is missing)
+    variant = pick_variant(path, fraction, fmt, out_dir=out_dir)
+    if variant is not None:
+        return _read(os.path.join(out_dir, variant["file"]))
+    if os.path.exists(path):
+        return _read(path)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write resized WebP / JPEG variants of the home page pictures")
+    parser.add_argument("--out", default=HERO_VARIANTS_DIR)
+    parser.add_argument("--widths", nargs="+", type=int, default=list(HERO_WIDTHS))
+    args = parser.parse_args()
+
+    manifest = build_variants(out_dir=args.out, widths=tuple(args.widths))
+    for stem, entry in manifest["images"].items():
+        print(f"{entry['source']}: {entry['width']}x{entry['height']}, {entry['source_bytes'] / 1024:.0f} KB")
+        for v in entry["variants"]:
+            print(f"  {v['file']}: {v['bytes'] / 1024:.0f} KB")
@@ -0,0 +1,522 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import pandas as pd
+
+from config import PAGE1_PATH, PAGE2_PATH, PAGE3_PATH, PATH_RAW_OLIM, INGEST_STATE_DIR
+from data_loading import read_raw_olim
+from disk_cache import file_fingerprint
+from summary import write_summary
+from districts import write_districts, yeshuv_machoz_counts
+from partitions import append_olim_records, append_trends_rows
+from page_builders import filter_trends
+from figures import build_trends_grid
+
+# -------------------------
+# Incremental ingestion of new olim records
+# -------------------------
+# The three page datasets are aggregates of the raw olim records (see
+# preprocessing/create_final_datasets.ipynb). Instead of rerunning the notebooks over the whole
+# history every month, we keep the aggregates' running sums in INGEST_STATE_DIR:
+#
+#   monthly_counts.csv          (date, erez_moza, continent) -> olim            page 1
+#   yeshuv_sums.csv             yeshuv -> rows, ages counted, age sum,          page 2
+#                               employed, female  (means are sum / weight, so
+#                               they can be updated, unlike the rounded means)
+#   country_subject_counts.csv  (erez_moza, subject) -> olim                    page 3
+#   yeshuv_machoz_counts.csv    (yeshuv_klita, machoz) -> olim                  page 2 districts
+#
+# plus the inputs the notebooks merged in, taken once from the current page files (monthly GDP and
+# English country names, yeshuv -> map id / score / madad). The GDP there ends with the last month
+# of page1, and the trends animation only shows months with GDP: a batch of later months needs
+# their GDP too (append --gdp, a csv of date, erez_moza, gdp like page1's), or it is refused.
+# A new batch only has to be grouped
+# itself and added to these tables, so the work grows with the batch and the number of distinct
+# keys, not with the years of history behind it.
+#
+# Writing follows the same rule. A batch of months after the last one in page1_final.csv only
+# adds rows for those months: they are appended to the file (and to the year partitions of it,
+# partitions.py), so page1 is grouped by month at its end rather than sorted by country throughout.
+# page2/3 have one row per yeshuv / (country, subject) and are rewritten from the running sums.
+# The records themselves go to the year partitions of the raw olim file, which the explorer reads.
+# Late records for months already in page1, or a batch bringing a country page1 didn't have yet
+# (its GDP-only rows from earlier months appear too), rewrite page1 in full, and so does a page1
+# that isn't the file the state last wrote (changed by hand, or a failed append).
+#
+# The pages are written before the state: if writing them fails, the state hasn't moved and the
+# same batch can be appended again. The state itself is written to a new folder that replaces the
+# old one.
+#
+#   python ingest.py init                 -> build the state from the full raw file (once)
+#   python ingest.py append new.csv [--gdp gdp.csv]
+#                                         -> add a batch of raw records to page1/2/3_final.csv
+#   python ingest.py verify [--months 6]  -> replay the last months one by one and compare with a
+#                                            full rebuild (exit code 1 on any difference)
+
+NOT_EMPLOYED_SUBJECTS = ["לא עבד", "לא צויין"]
+FEMALE = "נקבה"
+
+SUBJECT_MAPPING = {
+    "מדעים מדויקים": "טכנולוגיה והנדסה",
+    "מקצועות המחשב": "טכנולוגיה והנדסה",
+    "חקלאות ובעלי חיים": "מדעי החיים",
+}
+EXCLUDED_SUBJECTS = ["בלטי מקצועי", "בלתי מקצועי", "לא עבד", "לא צויין", "עצמאי", "מדעי החיים"]
+
+PAGE1_COLUMNS = ["date", "erez_moza", "continent", "monthly_count", "gdp", "Country"]
+PAGE2_COLUMNS = ["english_id", "hebrew_name", "total_olim", "avg_age", "pct_employed", "pct_female",
+                 "pct_male", "score", "madad"]
+
+COUNT_KEYS = ["date", "erez_moza", "continent"]
+SUBJECT_KEYS = ["erez_moza", "subject"]
+SUM_COLUMNS = ["rows", "age_count", "age_sum", "employed", "female"]
+MACHOZ_KEYS = ["yeshuv_klita", "machoz"]
+
+
+class IngestError(Exception):
+    pass
+
+
+# -------------------------
+# Aggregations of a batch of records
+# -------------------------
+
+def monthly_counts(records):
+    return records.groupby(COUNT_KEYS).size().rename("monthly_count")
+
+
+def yeshuv_sums(records):
+    flags = records.assign(
+        employed=(~records["subject"].isin(NOT_EMPLOYED_SUBJECTS)).astype(int),
+        female=(records["gender"] == FEMALE).astype(int),
+    )
+    return flags.groupby("yeshuv_klita").agg(
+        rows=("employed", "size"), age_count=("age", "count"), age_sum=("age", "sum"),
+        employed=("employed", "sum"), female=("female", "sum"),
+    )
+
+
+def country_subject_counts(records):
+    subjects = records["subject"].replace(SUBJECT_MAPPING)
+    kept = records.assign(subject=subjects)[~subjects.isin(EXCLUDED_SUBJECTS)]
+    return kept.groupby(SUBJECT_KEYS).size().rename("count")
+
+
+def _add(total, delta):
+    # Aligned on the keys; keys seen for the first time are appended
+    if total is None:
+        return delta.copy()
+    dtypes = total.dtypes.to_dict() if isinstance(total, pd.DataFrame) else total.dtype
+    return total.add(delta, fill_value=0).astype(dtypes)
+
+
+# -------------------------
+# From aggregates to the page datasets
+# -------------------------
+
+def profiles_from_sums(sums):
+    # Same numbers as the notebook's groupby(...).agg(mean) followed by *100 and round(1)
+    df = pd.DataFrame({"yeshuv_klita": sums.index})
+    df["total_olim"] = sums["age_count"].to_numpy()
+    df["avg_age"] = (sums["age_sum"] / sums["age_count"]).round(1).to_numpy()
+    df["pct_employed"] = (sums["employed"] / sums["rows"] * 100).round(1).to_numpy()
+    df["pct_female"] = (sums["female"] / sums["rows"] * 100).round(1).to_numpy()
+    df["pct_male"] = (100 - df["pct_female"]).round(1)
+    return df
+
+
+def render_page1(counts, meta):
+    olim = counts.reset_index()
+    merged = pd.merge(olim, meta["gdp"], on=["date", "erez_moza"], how="outer")
+    merged["monthly_count"] = merged["monthly_count"].fillna(0).astype(float)
+    merged = pd.merge(merged, meta["names"], on="erez_moza", how="left")
+    # GDP-only months get the country's continent from its olim rows
+    merged["continent"] = merged.groupby("erez_moza")["continent"].transform(lambda x: x.ffill().bfill())
+    merged = merged.dropna(subset=["date", "continent"])
+    # The GDP series is interpolated past the last month of olim data: stop at that month
+    merged = merged[merged["date"] <= olim["date"].max()]
+    return merged.sort_values(["erez_moza", "date"], kind="stable")[PAGE1_COLUMNS].reset_index(drop=True)
+
+
+def render_page1_after(counts, meta, after):
+    # The rows render_page1 gives for the months after `after`, or None when the rows of earlier
+    # months change too (a country with no olim until now)
+    olim = counts.reset_index()
+    new = olim[olim["date"] > after]
+    if not set(new["erez_moza"]) <= set(olim.loc[olim["date"] <= after, "erez_moza"]):
+        return None
+    gdp = meta["gdp"][(meta["gdp"]["date"] > after) & (meta["gdp"]["date"] <= olim["date"].max())]
+    merged = pd.merge(new, gdp, on=["date", "erez_moza"], how="outer")
+    merged["monthly_count"] = merged["monthly_count"].fillna(0).astype(float)
+    merged = pd.merge(merged, meta["names"], on="erez_moza", how="left")
+    # Each country has one continent in the records, the one ffill/bfill gives its GDP-only months
+    continents = olim.drop_duplicates(subset=["erez_moza"], keep="last").set_index("erez_moza")["continent"]
+    merged["continent"] = merged["erez_moza"].map(continents)
+    merged = merged.dropna(subset=["continent"])
+    return merged.sort_values(["date", "erez_moza"], kind="stable")[PAGE1_COLUMNS].reset_index(drop=True)
+
+
+def render_page2(profiles, meta):
+    # inner: yeshuvim without a map polygon are left out, as in the notebook
+    df = profiles.merge(meta["yeshuvim"], left_on="yeshuv_klita", right_on="hebrew_name", how="inner")
+    return df[PAGE2_COLUMNS].reset_index(drop=True)
+
+
+def render_page3(subject_counts):
+    return subject_counts.sort_index().reset_index()
+
+
+# -------------------------
+# Full rebuild (the notebook path), for init and verification
+# -------------------------
+
+def full_rebuild(records, meta):
+    emp = (~records["subject"].isin(NOT_EMPLOYED_SUBJECTS)).astype(int)
+    fem = (records["gender"] == FEMALE).astype(int)
+    agg = records.assign(is_employed=emp, is_female=fem).groupby("yeshuv_klita").agg(
+        total_olim=("age", "count"), avg_age=("age", "mean"),
+        pct_employed=("is_employed", "mean"), pct_female=("is_female", "mean"),
+    ).reset_index()
+    agg["pct_employed"] = (agg["pct_employed"] * 100).round(1)
+    agg["pct_female"] = (agg["pct_female"] * 100).round(1)
+    agg["pct_male"] = (100 - agg["pct_female"]).round(1)
+    agg["avg_age"] = agg["avg_age"].round(1)
+
+    return (render_page1(monthly_counts(records), meta),
+            render_page2(agg, meta),
+            render_page3(country_subject_counts(records)))
+
+
+# -------------------------
+# Merged-in inputs (GDP, names, yeshuv ids/scores)
+# -------------------------
+
+def extract_metadata(page1_path=PAGE1_PATH, page2_path=PAGE2_PATH):
+    # The notebooks' gdp.csv / mapped_yeshuvim.csv / isr_data.csv are not in the repo; the current
+    # page files carry everything they contributed
+    # round_trip: the GDP values are written back as they were read, digit for digit
+    page1 = pd.read_csv(page1_path, parse_dates=["date"], float_precision="round_trip")
+    page2 = pd.read_csv(page2_path)
+    return {
+        "gdp": page1.dropna(subset=["gdp"])[["date", "erez_moza", "gdp"]].reset_index(drop=True),
+        "names": page1[["erez_moza", "Country"]].dropna().drop_duplicates(subset=["erez_moza"]).reset_index(drop=True),
+        "yeshuvim": page2[["hebrew_name", "english_id", "score", "madad"]].reset_index(drop=True),
+    }
+
+
+def read_gdp(path):
+    gdp = pd.read_csv(path, parse_dates=["date"], float_precision="round_trip")
+    missing = {"date", "erez_moza", "gdp"} - set(gdp.columns)
+    if missing:
+        raise IngestError(f"{path} has no {', '.join(sorted(missing))} column (expected date, erez_moza, gdp)")
+    return gdp.dropna(subset=["gdp"])[["date", "erez_moza", "gdp"]].reset_index(drop=True)
+
+
+def missing_gdp(meta, records, after):
+    # Months of the batch after `after` in which countries with olim lack the GDP they had in the
+    # last month before -> {"YYYY-MM": [countries]}
+    gdp = meta["gdp"]
+    reference = gdp.loc[gdp["date"] <= after, "date"].max()
+    with_gdp = set(gdp.loc[gdp["date"] == reference, "erez_moza"])
+    have = set(zip(gdp["date"], gdp["erez_moza"]))
+    olim = monthly_counts(records).reset_index()
+    olim = olim[(olim["date"] > after) & olim["erez_moza"].isin(with_gdp)]
+    gaps = {}
+    for date, country in sorted(set(zip(olim["date"], olim["erez_moza"]))):
+        if (date, country) not in have:
+            gaps.setdefault(date.strftime("%Y-%m"), []).append(country)
+    return gaps
+
+
+# -------------------------
+# State
+# -------------------------
+
+class IngestState:
+    def __init__(self, meta, counts=None, sums=None, subjects=None, machoz=None, months=(), page1_fingerprint=None):
+        self.meta = meta
+        self.counts = counts
+        self.sums = sums
+        self.subjects = subjects
+        self.machoz = machoz
+        self.months = set(months)
+        # Hash of the page1 file these sums were last written to (appending needs that file)
+        self.page1_fingerprint = page1_fingerprint
+
+    @classmethod
+    def from_records(cls, records, meta):
+        state = cls(meta)
+        state.apply(records)
+        return state
+
+    def apply(self, records, allow_overlap=False):
+        batch_months = set(records["date"].dt.strftime("%Y-%m"))
+        overlap = batch_months & self.months
+        if overlap and not allow_overlap:
+            raise IngestError(f"months already ingested: {', '.join(sorted(overlap))} (use --allow-overlap for late records)")
+
+        self.counts = _add(self.counts, monthly_counts(records))
+        self.sums = _add(self.sums, yeshuv_sums(records))
+        self.subjects = _add(self.subjects, country_subject_counts(records))
+        self.machoz = _add(self.machoz, yeshuv_machoz_counts(records))
+        self.months |= batch_months
+        return sorted(batch_months)
+
+    def last_month(self):
+        return self.counts.index.get_level_values("date").max()
+
+    def add_gdp(self, gdp):
+        # New months (or corrected values) of the monthly GDP page1 merges in
+        merged = pd.concat([self.meta["gdp"], gdp], ignore_index=True)
+        merged = merged.drop_duplicates(subset=["date", "erez_moza"], keep="last")
+        self.meta = dict(self.meta, gdp=merged.sort_values(["erez_moza", "date"], kind="stable").reset_index(drop=True))
+
+    def tables(self):
+        return (render_page1(self.counts.sort_index(), self.meta),
+                render_page2(profiles_from_sums(self.sums.sort_index()), self.meta),
+                render_page3(self.subjects))
+
+    # --- persistence ---
+
+    def save(self, state_dir=INGEST_STATE_DIR):
+        # All files or none: they go to a new folder that then takes the old one's place
+        new_dir, old_dir = f"{state_dir}.new", f"{state_dir}.old"
+        shutil.rmtree(new_dir, ignore_errors=True)
+        os.makedirs(new_dir)
+        _write_csv(self.counts.reset_index(), os.path.join(new_dir, "monthly_counts.csv"))
+        _write_csv(self.sums.reset_index(), os.path.join(new_dir, "yeshuv_sums.csv"))
+        _write_csv(self.subjects.reset_index(), os.path.join(new_dir, "country_subject_counts.csv"))
+        _write_csv(self.machoz.reset_index(), os.path.join(new_dir, "yeshuv_machoz_counts.csv"))
+        for name, df in self.meta.items():
+            _write_csv(df, os.path.join(new_dir, f"meta_{name}.csv"))
+        with open(os.path.join(new_dir, "state.json"), "w", encoding="utf-8") as f:
+            json.dump({"months": sorted(self.months), "page1_fingerprint": self.page1_fingerprint}, f, indent=2)
+
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(state_dir):
+            os.rename(state_dir, old_dir)
+        os.rename(new_dir, state_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, state_dir=INGEST_STATE_DIR):
+        if not os.path.exists(state_dir) and os.path.exists(f"{state_dir}.old"):
+            # A save stopped between its two renames: the previous state is complete
+            os.rename(f"{state_dir}.old", state_dir)
+        if not os.path.exists(os.path.join(state_dir, "state.json")):
+            raise IngestError(f"no ingest state in {state_dir}: run `python ingest.py init` first")
+
+        def read(name, **kwargs):
+            return pd.read_csv(os.path.join(state_dir, name), **kwargs)
+
+        meta = {
+            "gdp": read("meta_gdp.csv", parse_dates=["date"], float_precision="round_trip"),
+            "names": read("meta_names.csv"),
+            "yeshuvim": read("meta_yeshuvim.csv"),
+        }
+        counts = read("monthly_counts.csv", parse_dates=["date"]).set_index(COUNT_KEYS)["monthly_count"]
+        sums = read("yeshuv_sums.csv").set_index("yeshuv_klita")[SUM_COLUMNS]
+        subjects = read("country_subject_counts.csv").set_index(SUBJECT_KEYS)["count"]
+        if not os.path.exists(os.path.join(state_dir, "yeshuv_machoz_counts.csv")):
+            raise IngestError(f"the ingest state in {state_dir} has no district counts: run `python ingest.py init` again")
+        machoz = read("yeshuv_machoz_counts.csv").set_index(MACHOZ_KEYS)["olim"]
+        with open(os.path.join(state_dir, "state.json"), encoding="utf-8") as f:
+            saved = json.load(f)
+        return cls(meta, counts, sums, subjects, machoz, saved["months"], saved.get("page1_fingerprint"))
+
+
+def _write_csv(df, path, **kwargs):
+    # Write next to the target and swap, so the app (and its file hashes) never sees half a file
+    tmp = f"{path}.tmp"
+    df.to_csv(tmp, index=False, **kwargs)
+    os.replace(tmp, path)
+
+
+def _append_csv(df, path):
+    # Same swap as _write_csv: the rows are added to a copy of the file, so no parsing or
+    # rendering of the existing rows, but readers still see the old or the new file
+    tmp = f"{path}.tmp"
+    shutil.copyfile(path, tmp)
+    df.to_csv(tmp, mode="a", header=False, index=False)
+    os.replace(tmp, path)
+
+
+def _page1_csv(page1):
+    return page1.assign(date=page1["date"].dt.strftime("%Y-%m-%d"))
+
+
+def write_pages(state, after=None, paths=(PAGE1_PATH, PAGE2_PATH, PAGE3_PATH)):
+    # after: the last month of page1 before the batch (None: rewrite it). Returns how page1 was written.
+    page1_path, page2_path, page3_path = paths
+    previous = file_fingerprint(page1_path)
+    if previous != state.page1_fingerprint:
+        after = None
+    rows = render_page1_after(state.counts, state.meta, after) if after is not None else None
+    if rows is not None:
+        _append_csv(_page1_csv(rows), page1_path)
+    else:
+        _write_csv(_page1_csv(render_page1(state.counts.sort_index(), state.meta)), page1_path)
+    page2 = render_page2(profiles_from_sums(state.sums.sort_index()), state.meta)
+    _write_csv(page2, page2_path)
+    _write_csv(render_page3(state.subjects), page3_path)
+
+    # The home page numbers and the page 2 district rollup go with this version of the files
+    # (the districts from the state's yeshuv/machoz counts, not the raw file the batches never reach)
+    write_summary(page1_path=page1_path, page2_path=page2_path, tables=(state.counts.reset_index(), page2))
+    write_districts(page2_path=page2_path, machoz_counts=state.machoz)
+    state.page1_fingerprint = file_fingerprint(page1_path)
+    if rows is None:
+        return "rewritten"
+    # The partitions of the old file get the same rows (if they are of another version, the next
+    # load rebuilds them from the file anyway)
+    append_trends_rows(rows, previous, page1_path)
+    return "appended"
+
+
+# -------------------------
+# Verification
+# -------------------------
+
+def compare_tables(left, right):
+    # Returns the names of the pages that differ (exact comparison, same row order)
+    differing = []
+    for name, a, b in zip(("page1", "page2", "page3"), left, right):
+        try:
+            pd.testing.assert_frame_equal(a.reset_index(drop=True), b.reset_index(drop=True),
+                                          check_exact=True, check_dtype=False)
+        except AssertionError:
+            differing.append(name)
+    return differing
+
+
+def verify_new_month(state, page1, last_batch):
+    # A month past the GDP the state has (the case the replay above never meets): refused without
+    # its GDP, and with it (here each country's last value) on the trends animation like the others
+    gdp = state.meta["gdp"]
+    last_gdp = gdp["date"].max()
+    month = last_gdp + pd.DateOffset(months=1)
+    batch = last_batch.assign(date=month, year_aliya=month.year, month_aliya=month.month)
+    after = state.last_month()
+    differences = []
+    if not missing_gdp(state.meta, batch, after):
+        differences.append("new month accepted without GDP")
+
+    state.add_gdp(gdp[gdp["date"] == last_gdp].assign(date=month))
+    if missing_gdp(state.meta, batch, after):
+        differences.append("new month refused with its GDP")
+    state.apply(batch)
+    rows = render_page1_after(state.counts, state.meta, after)
+    page1 = pd.concat([page1, rows], ignore_index=True) if rows is not None else render_page1(state.counts.sort_index(), state.meta)
+
+    timeline, base_filtered = filter_trends(page1, (month.year, month.year), sorted(page1["continent"].unique()))
+    grid = build_trends_grid(base_filtered, timeline, sorted(set(base_filtered["erez_moza"])))
+    shown = set(grid.loc[grid["date"] == month, "erez_moza"]) if not grid.empty else set()
+    expected = set(page1.loc[(page1["date"] == last_gdp) & page1["gdp"].notna(), "erez_moza"])
+    if shown != expected:
+        differences.append(f"new month on the trends animation ({len(shown)} of {len(expected)} countries)")
+    return differences
+
+
+def verify(records, meta, n_months=6):
+    # Full history minus the last n months, then each of those months as its own batch
+    months = sorted(records["date"].unique())
+    split = months[-n_months] if n_months < len(months) else months[0]
+
+    # page1 is built the way append writes it: the rows of each new month added at the end
+    start = time.perf_counter()
+    state = IngestState.from_records(records[records["date"] < split], meta)
+    pages1 = [render_page1(state.counts.sort_index(), meta)]
+    batch_seconds = []
+    for month in months:
+        if month < split:
+            continue
+        t = time.perf_counter()
+        after = state.last_month()
+        state.apply(records[records["date"] == month])
+        rows = render_page1_after(state.counts, meta, after)
+        pages1 = pages1 + [rows] if rows is not None else [render_page1(state.counts.sort_index(), meta)]
+        batch_seconds.append(time.perf_counter() - t)
+    page1 = pd.concat(pages1, ignore_index=True).sort_values(["erez_moza", "date"], kind="stable")
+    _, page2, page3 = state.tables()
+    incremental = (page1, page2, page3)
+    incremental_seconds = time.perf_counter() - start
+
+    t = time.perf_counter()
+    rebuilt = full_rebuild(records, meta)
+    rebuild_seconds = time.perf_counter() - t
+
+    differences = compare_tables(incremental, rebuilt)
+    # The districts sidecar is written from the running yeshuv/machoz counts
+    if not state.machoz.sort_index().equals(yeshuv_machoz_counts(records).sort_index()):
+        differences.append("districts")
+    differences += verify_new_month(state, page1, records[records["date"] == months[-1]])
+    return {
+        "batches": len(batch_seconds),
+        "avg_batch_seconds": round(sum(batch_seconds) / max(len(batch_seconds), 1), 4),
+        "incremental_total_seconds": round(incremental_seconds, 3),
+        "full_rebuild_seconds": round(rebuild_seconds, 3),
+        "differences": differences,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental ingestion of raw olim records")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_init = sub.add_parser("init", help="build the running sums from the full raw file")
+    p_init.add_argument("--raw", default=PATH_RAW_OLIM)
+    p_append = sub.add_parser("append", help="add a batch of new raw records")
+    p_append.add_argument("records", help="csv (or zipped csv) with the raw olim columns")
+    p_append.add_argument("--gdp", help="csv with the monthly GDP (date, erez_moza, gdp) of the new months")
+    p_append.add_argument("--allow-overlap", action="store_true", help="accept months that were already ingested")
+    p_append.add_argument("--dry-run", action="store_true", help="update nothing, only report")
+    p_verify = sub.add_parser("verify", help="compare month-by-month ingestion with a full rebuild")
+    p_verify.add_argument("--raw", default=PATH_RAW_OLIM)
+    p_verify.add_argument("--months", type=int, default=6)
+    for p in (p_init, p_append, p_verify):
+        p.add_argument("--state-dir", default=INGEST_STATE_DIR)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "init":
+            meta = extract_metadata()
+            state = IngestState.from_records(read_raw_olim(args.raw), meta)
+            state.page1_fingerprint = file_fingerprint(PAGE1_PATH)
+            state.save(args.state_dir)
+            print(f"state for {len(state.months)} months written to {args.state_dir}")
+
+        elif args.command == "append":
+            state = IngestState.load(args.state_dir)
+            start = time.perf_counter()
+            records = read_raw_olim(args.records)
+            after = state.last_month()
+            if args.gdp:
+                state.add_gdp(read_gdp(args.gdp))
+            gaps = missing_gdp(state.meta, records, after)
+            if gaps:
+                raise IngestError("no GDP for " + "; ".join(
+                    f"{month} ({len(countries)} countries, e.g. {countries[0]})" for month, countries in gaps.items())
+                    + ": pass it with --gdp (date, erez_moza, gdp)")
+            months = state.apply(records, allow_overlap=args.allow_overlap)
+            page1 = "not written (dry run)"
+            if not args.dry_run:
+                page1 = write_pages(state, after if records["date"].min() > after else None)
+                # The explorer's copy of the records (the raw file itself is not written to)
+                append_olim_records(records, batch=file_fingerprint(args.records))
+                state.save(args.state_dir)
+            print(f"ingested {', '.join(months)} in {time.perf_counter() - start:.3f}s (page1 {page1})")
+
+        elif args.command == "verify":
+            if os.path.exists(os.path.join(args.state_dir, "state.json")):
+                meta = IngestState.load(args.state_dir).meta
+            else:
+                meta = extract_metadata()
+            report = verify(read_raw_olim(args.raw), meta, args.months)
+            print(json.dumps(report, indent=2))
+            sys.exit(1 if report["differences"] else 0)
+    except IngestError as e:
+        print(f"error: {e}")
+        sys.exit(2)
@@ -0,0 +1,65 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# -------------------------
+# Process-wide counters and timings
+# -------------------------
+# Everything here is shared by all Streamlit sessions of the same server process,
+# so the numbers describe the whole server and not a single visitor.
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_sources = {}
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record_timing(name, seconds):
+    with _lock:
+        entry = _timings.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0, "last_s": 0.0})
+        entry["count"] += 1
+        entry["total_s"] += seconds
+        entry["max_s"] = max(entry["max_s"], seconds)
+        entry["last_s"] = seconds
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+
+def register_source(name, stats_fn):
+    # A source is a callable returning a dict (e.g. cache hit/miss stats) that is read on every snapshot
+    with _lock:
+        _sources[name] = stats_fn
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        timings = {k: dict(v) for k, v in _timings.items()}
+        sources = dict(_sources)
+
+    for entry in timings.values():
+        entry["avg_s"] = entry["total_s"] / entry["count"] if entry["count"] else 0.0
+
+    return {
+        "counters": counters,
+        "timings": timings,
+        "sources": {name: fn() for name, fn in sources.items()},
+    }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
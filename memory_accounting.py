@@ -0,0 +1,263 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+# -------------------------
+# Per-session memory accounting (opt-in)
+# -------------------------
+# Two views of the server's memory, for sizing instance limits:
+#
+#   sessions -> the deep size of every session's st.session_state, sampled on each rerun. Keys are
+#               charged to the page they first appeared on, which gives a per-page breakdown.
+#               The sample is taken before the page runs, so it sees the state the previous
+#               rerun left: new keys (and the sample) go to the page that rerun rendered, not to
+#               the one the user may have just navigated to;
+#               the recent samples of each session give its growth over time, and sessions whose
+#               state grew on every one of the last VIZ_MEMORY_LEAK_WINDOW samples by at least
+#               VIZ_MEMORY_LEAK_KB in total are flagged.
+#   process  -> tracemalloc snapshots (at most one per VIZ_MEMORY_SNAPSHOT_S), the traced memory
+#               grouped by the project module (or st.cache_data) that allocated it, and its growth
+#               since the previous snapshot. This is where the cached datasets and figures live.
+#
+# tracemalloc slows allocations down noticeably, so nothing is traced unless VIZ_MEMORY_ACCOUNTING=1.
+# The numbers are reported through instrumentation.snapshot() (the sidebar with VIZ_INSTRUMENTATION=1).
+#
+#   VIZ_MEMORY_ACCOUNTING=1    -> enable
+#   VIZ_MEMORY_TRACE_FRAMES    -> frames kept per traced allocation (default 8; more = better attribution)
+#   VIZ_MEMORY_SNAPSHOT_S      -> minimum seconds between tracemalloc snapshots (default 300)
+#   VIZ_MEMORY_LEAK_WINDOW     -> samples a session must keep growing for to be flagged (default 6)
+#   VIZ_MEMORY_LEAK_KB         -> minimal growth over that window to be flagged (default 64)
+
+MEMORY_ACCOUNTING_ENABLED = os.environ.get("VIZ_MEMORY_ACCOUNTING") == "1"
+TRACE_FRAMES = int(os.environ.get("VIZ_MEMORY_TRACE_FRAMES", "8"))
+SNAPSHOT_INTERVAL_S = float(os.environ.get("VIZ_MEMORY_SNAPSHOT_S", "300"))
+LEAK_WINDOW = int(os.environ.get("VIZ_MEMORY_LEAK_WINDOW", "6"))
+LEAK_MIN_BYTES = int(float(os.environ.get("VIZ_MEMORY_LEAK_KB", "64")) * 1024)
+
+SESSION_HISTORY = 120      # samples kept per session
+SESSION_IDLE_S = 3600      # sessions not seen for this long are forgotten
+PROCESS_HISTORY = 240      # tracemalloc totals kept
+TOP_KEYS = 10
+TOP_OWNERS = 15
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+_CACHE_DATA_DIR = os.path.join("streamlit", "runtime", "caching")
+
+_lock = threading.Lock()
+_sessions = {}  # session id -> {"last_seen", "page", "key_pages", "sizes", "history"}
+_process = {"running": False, "taken_at": 0.0, "owners": {}, "growth": {}, "history": deque(maxlen=PROCESS_HISTORY)}
+_started = False
+
+
+# -------------------------
+# Deep size of a Python object
+# -------------------------
+
+def deep_sizeof(obj, seen=None):
+    # sys.getsizeof only counts the container; this follows what it holds (each object once).
+    # DataFrames / arrays report their buffers, which getsizeof can't see.
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, s), seen) for s in obj.__slots__ if hasattr(obj, s))
+    return size
+
+
+# -------------------------
+# Sessions
+# -------------------------
+
+def _growing(sizes):
+    # Grew on every one of the last LEAK_WINDOW samples, by LEAK_MIN_BYTES at least
+    if len(sizes) <= LEAK_WINDOW:
+        return False
+    window = sizes[-(LEAK_WINDOW + 1):]
+    return all(b > a for a, b in zip(window, window[1:])) and window[-1] - window[0] >= LEAK_MIN_BYTES
+
+
+def record_session(session_id, page, state):
+    # state: the session's key -> value mapping (st.session_state.to_dict()), sampled once per rerun
+    # before the page runs; page: the page this rerun renders
+    if not MEMORY_ACCOUNTING_ENABLED or session_id is None:
+        return
+    start_tracing()
+    now = time.time()
+    sizes = {key: deep_sizeof(value) for key, value in state.items()}
+
+    with _lock:
+        session = _sessions.setdefault(session_id, {"key_pages": {}, "history": deque(maxlen=SESSION_HISTORY)})
+        # The state was left by the previous rerun (on its first rerun, a session has only the
+        # keys this page's sidebar made)
+        owner = session.get("page", page)
+        for key in sizes:
+            session["key_pages"].setdefault(key, owner)
+        session["page"] = page
+        session["last_seen"] = now
+        session["sizes"] = sizes
+        session["history"].append((now, owner, sum(sizes.values())))
+        for sid in [s for s, entry in _sessions.items() if now - entry["last_seen"] > SESSION_IDLE_S]:
+            del _sessions[sid]
+
+    instrumentation.incr("memory.session_samples")
+    _maybe_snapshot(now)
+
+
+def session_report():
+    with _lock:
+        sessions = {sid: (dict(s["key_pages"]), dict(s["sizes"]), list(s["history"])) for sid, s in _sessions.items()}
+
+    pages = {}
+    per_session = []
+    for sid, (key_pages, sizes, history) in sessions.items():
+        for key, size in sizes.items():
+            page = pages.setdefault(key_pages.get(key, "?"), {"bytes": 0, "sessions": set(), "keys": {}})
+            page["bytes"] += size
+            page["sessions"].add(sid)
+            page["keys"][key] = page["keys"].get(key, 0) + size
+
+        totals = [total for _, _, total in history]
+        span_s = history[-1][0] - history[0][0] if len(history) > 1 else 0.0
+        per_session.append({
+            "session": sid[:8], "bytes": totals[-1] if totals else 0, "samples": len(totals),
+            "growth_bytes": totals[-1] - totals[0] if totals else 0,
+            "growth_bytes_per_min": round(60.0 * (totals[-1] - totals[0]) / span_s, 1) if span_s else 0.0,
+            "page": history[-1][1] if history else None,
+            "largest_keys": dict(sorted(sizes.items(), key=lambda kv: -kv[1])[:TOP_KEYS]),
+            "growing": _growing(totals),
+        })
+
+    per_session.sort(key=lambda s: -s["bytes"])
+    return {
+        "sessions": len(per_session),
+        "total_bytes": sum(s["bytes"] for s in per_session),
+        "max_session_bytes": per_session[0]["bytes"] if per_session else 0,
+        "pages": {
+            name: {"bytes": p["bytes"], "sessions": len(p["sessions"]),
+                   "bytes_per_session": p["bytes"] // max(1, len(p["sessions"])),
+                   "largest_keys": dict(sorted(p["keys"].items(), key=lambda kv: -kv[1])[:TOP_KEYS])}
+            for name, p in pages.items()
+        },
+        "growing_sessions": [s for s in per_session if s["growing"]],
+        "largest_sessions": per_session[:TOP_KEYS],
+    }
+
+
+# -------------------------
+# Process (tracemalloc)
+# -------------------------
+
+def start_tracing():
+    global _started
+    if not _started and MEMORY_ACCOUNTING_ENABLED:
+        _started = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+
+
+def _owner(traceback):
+    # The innermost project module on the allocation's stack (or st.cache_data, which keeps its
+    # own pickled copies); "other" for allocations the project didn't ask for
+    cache_data = False
+    for frame in reversed(traceback):
+        filename = frame.filename
+        if filename.startswith(PROJECT_DIR) and "site-packages" not in filename:
+            return os.path.basename(filename)
+        cache_data = cache_data or _CACHE_DATA_DIR in filename
+    return "st.cache_data" if cache_data else "other"
+
+
+def _take_snapshot(now):
+    try:
+        with instrumentation.timed("memory.snapshot"):
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ])
+            owners = {}
+            for stat in snapshot.statistics("traceback"):
+                owner = _owner(stat.traceback)
+                owners[owner] = owners.get(owner, 0) + stat.size
+            del snapshot
+            current, peak = tracemalloc.get_traced_memory()
+
+        with _lock:
+            previous = _process["owners"]
+            _process["growth"] = {k: v - previous.get(k, 0) for k, v in owners.items()} if previous else {}
+            _process["owners"] = owners
+            _process["history"].append((round(now), current))
+    finally:
+        # Also when the snapshot failed (e.g. tracing stopped meanwhile): the next interval retries
+        with _lock:
+            _process["running"] = False
+
+
+def _maybe_snapshot(now, wait=False):
+    # Grouping a snapshot takes seconds on a loaded server: it runs on a background thread
+    # (one at a time) so the rerun that triggered it doesn't wait
+    if not tracemalloc.is_tracing():
+        return
+    with _lock:
+        if _process.get("running") or now - _process["taken_at"] < SNAPSHOT_INTERVAL_S:
+            return
+        _process["taken_at"] = now
+        _process["running"] = True
+    worker = threading.Thread(target=_take_snapshot, args=(now,), name="memory-snapshot", daemon=True)
+    worker.start()
+    if wait:
+        worker.join()
+
+
+def process_report():
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    current, peak = tracemalloc.get_traced_memory()
+    with _lock:
+        owners = sorted(_process["owners"].items(), key=lambda kv: -kv[1])[:TOP_OWNERS]
+        growth = dict(_process["growth"])
+        history = list(_process["history"])
+        taken_at = _process["taken_at"]
+    return {
+        "tracing": True,
+        "traced_bytes": current, "peak_bytes": peak,
+        "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "snapshot_age_s": round(time.time() - taken_at, 1) if taken_at else None,
+        "by_owner": {name: {"bytes": size, "growth_bytes": growth.get(name, 0)} for name, size in owners},
+        "history": history[-20:],
+    }
+
+
+def report():
+    return {"process": process_report(), **session_report()}
+
+
+if MEMORY_ACCOUNTING_ENABLED:
+    # Trace from import time, so the datasets loaded by the first run are attributed too
+    start_tracing()
+    instrumentation.register_source("memory", report)
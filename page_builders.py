@@ -0,0 +1,213 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import instrumentation
+from config import PAGE1_PATH, PAGE2_PATH, PAGE3_PATH, PATH_GEOJSON, PATH_DISTRICTS, PATH_RAW_OLIM
+from data_loading import load_trends_data, load_city_profiles, load_geojson, load_sankey_data
+from disk_cache import file_fingerprint, cached_load
+from districts import load_districts, DISTRICT_MAX_ZOOM
+from figure_cache import get_figure_cache, make_key
+from partitions import trends_manifest, load_trends_range
+from waves import load_waves, waves_in_range, wave_cells
+from figures import (
+    build_continent_color_map, build_trends_grid, build_trends_figure,
+    build_country_base_map, add_country_highlight, build_sankey_figure,
+    build_city_lines_figure, build_city_base_map, apply_city_map_state, build_district_map,
+)
+
+# -------------------------
+# Page builders: dataset -> filter state -> (cached) figure
+# -------------------------
+# Used by app.py and by everything that needs the same figures outside a Streamlit session
+# (warm-up), so both sides produce identical cache keys.
+
+DEFAULT_SPEED_MS = 100
+SPEED_RANGE_MS = (50, 500)  # the animation speed slider's range
+DEFAULT_TOP_COUNTRIES = 25
+DEFAULT_SANKEY_COUNTRIES = 4
+DEFAULT_MAP_VIEW = {"lat": 31.6, "lon": 34.85, "zoom": 7.3}
+
+# Threads building the figures of one page at the same time (VIZ_FIGURE_WORKERS, default 4)
+FIGURE_WORKERS = int(os.environ.get("VIZ_FIGURE_WORKERS", "4"))
+
+_figure_pool = None
+_figure_pool_lock = threading.Lock()
+
+
+# ==============================================================================
+# PAGE 1: IMMIGRATION TRENDS
+# ==============================================================================
+
+def filter_trends(df_merged, year_range, selected_continents):
+    timeline = pd.date_range(
+        start=f"{year_range[0]}-01-01",
+        end=f"{year_range[1]}-12-01",
+        freq="MS"
+    )
+
+    base_filtered = df_merged[
+        (df_merged["date"].isin(timeline)) &
+        (df_merged["continent"].isin(selected_continents))
+    ].copy()
+    return timeline, base_filtered
+
+
+def default_trends_countries(base_filtered, n=DEFAULT_TOP_COUNTRIES):
+    country_stats = base_filtered.groupby("erez_moza")["monthly_count"].sum().sort_values(ascending=False)
+    return set(country_stats.index.tolist()[:n])
+
+
+def default_trends_state(df_merged):
+    year_range = (int(df_merged["date"].min().year), int(df_merged["date"].max().year))
+    all_continents = sorted(df_merged["continent"].unique())
+    _, base_filtered = filter_trends(df_merged, year_range, all_continents)
+    countries = sorted(default_trends_countries(base_filtered))
+    return year_range, all_continents, countries, DEFAULT_SPEED_MS
+
+
+def load_trends_defaults(path=PAGE1_PATH):
+    # default_trends_state of the dataset, computed once per version of the file
+    return cached_load("trends_defaults", [path], lambda: default_trends_state(load_trends_data(path)[0]))
+
+
+def get_trends_figure(year_range, selected_continents, selected_countries, speed_ms, path=PAGE1_PATH, as_json=False,
+                      show_waves=True):
+    # Identical filter states (from any session) share one cached figure
+    key = make_key("trends", file_fingerprint(path), tuple(year_range),
+                   set(selected_continents), set(selected_countries), speed_ms, show_waves)
+
+    def build():
+        # Only the years in range are read (year-partitioned copy of the dataset)
+        df_range = load_trends_range(year_range, path)
+        all_continents = trends_manifest(path)["values"]["continent"]
+        timeline, base_filtered = filter_trends(df_range, year_range, selected_continents)
+        grid = build_trends_grid(base_filtered, timeline, sorted(selected_countries))
+        if grid.empty:
+            return None
+        cells = wave_cells(waves_in_range(load_waves(path), year_range, selected_countries)) if show_waves else None
+        return build_trends_figure(grid, build_continent_color_map(all_continents), all_continents, speed_ms, cells)
+
+    return get_figure_cache().get_or_build(key, build, as_json)
+
+
+def _country_table(path):
+    df_merged, _, hebrew_to_iso3 = load_trends_data(path)
+    countries = df_merged.groupby("erez_moza", as_index=False)["continent"].first()
+    countries["iso3"] = countries["erez_moza"].map(hebrew_to_iso3)
+    return countries.dropna(subset=["iso3"]), sorted(df_merged["continent"].unique())
+
+
+def get_country_base_map(path=PAGE1_PATH):
+    def build():
+        countries, all_continents = _country_table(path)
+        return build_country_base_map(countries, build_continent_color_map(all_continents), all_continents)
+
+    return get_figure_cache().get_or_build(make_key("country_map_base", file_fingerprint(path)), build)
+
+
+def get_country_map(selected_continents, selected_countries, path=PAGE1_PATH):
+    # Only the continents and the selection change this map (not the speed or the years)
+    key = make_key("country_map", file_fingerprint(path), set(selected_continents), set(selected_countries))
+
+    def build():
+        countries, all_continents = _country_table(path)
+        selected = countries[countries["erez_moza"].isin(selected_countries)]
+        return add_country_highlight(get_country_base_map(path), selected,
+                                     build_continent_color_map(all_continents), all_continents,
+                                     set(selected_continents))
+
+    return get_figure_cache().get_or_build(key, build)
+
+
+# ==============================================================================
+# PAGE 2: CITY PROFILES
+# ==============================================================================
+
+def get_city_lines_figure(current_selection, path=PAGE2_PATH, as_json=False):
+    # The draw order only depends on which cities are selected, not on the order they were picked in
+    key = make_key("city_lines", file_fingerprint(path), set(current_selection))
+    return get_figure_cache().get_or_build(
+        key, lambda: build_city_lines_figure(load_city_profiles(path), list(current_selection)), as_json
+    )
+
+
+def get_city_base_map(path=PAGE2_PATH, geojson_path=PATH_GEOJSON):
+    key = make_key("city_map_base", file_fingerprint(path, geojson_path))
+    return get_figure_cache().get_or_build(
+        key, lambda: build_city_base_map(load_city_profiles(path), load_geojson(geojson_path))
+    )
+
+
+def get_city_map(current_selection, map_view, path=PAGE2_PATH, geojson_path=PATH_GEOJSON, as_json=False):
+    key = make_key("city_map", file_fingerprint(path, geojson_path), set(current_selection), map_view)
+
+    def build():
+        return apply_city_map_state(get_city_base_map(path, geojson_path), load_city_profiles(path),
+                                    list(current_selection), map_view)
+
+    return get_figure_cache().get_or_build(key, build, as_json)
+
+
+def is_district_view(map_view):
+    return map_view["zoom"] < DISTRICT_MAX_ZOOM
+
+
+def get_district_map(map_view, path=PATH_DISTRICTS, as_json=False):
+    # The sidecar's own sources are in the key: a stale sidecar is rebuilt from them (districts.py)
+    key = make_key("district_map", file_fingerprint(path, PAGE2_PATH, PATH_GEOJSON, PATH_RAW_OLIM), map_view)
+
+    def build():
+        df_district, districts_geojson, _ = load_districts(path)
+        return build_district_map(df_district, districts_geojson, map_view)
+
+    return get_figure_cache().get_or_build(key, build, as_json)
+
+
+def get_page2_map(current_selection, map_view, as_json=False):
+    # Districts when zoomed out, yeshuvim (with the selection) otherwise
+    if is_district_view(map_view):
+        return get_district_map(map_view, as_json=as_json)
+    return get_city_map(current_selection, map_view, as_json=as_json)
+
+
+def get_figure_pool():
+    # Shared by all sessions; the builders are pure and the caches they use are thread-safe
+    global _figure_pool
+    with _figure_pool_lock:
+        if _figure_pool is None:
+            _figure_pool = ThreadPoolExecutor(max_workers=FIGURE_WORKERS, thread_name_prefix="figures")
+        return _figure_pool
+
+
+def submit_figures(builders):
+    # builders: name -> zero-argument callable. Returns name -> Future, submitted in the given order
+    # (so the first one starts first when the pool is busy). Each runs in a copy of the caller's
+    # context, which carries the dataset version the script run is pinned to (hot_reload.py).
+    pool = get_figure_pool()
+
+    def run(name, fn):
+        with instrumentation.timed(f"figures.{name}"):
+            return fn()
+
+    return {name: pool.submit(contextvars.copy_context().run, run, name, fn) for name, fn in builders.items()}
+
+
+# ==============================================================================
+# PAGE 3: PROFESSIONAL FLOW (SANKEY)
+# ==============================================================================
+
+def default_sankey_countries(df_sankey, n=DEFAULT_SANKEY_COUNTRIES):
+    country_totals = df_sankey.groupby('erez_moza')['count'].sum()
+    return country_totals.nlargest(n).index.tolist()
+
+
+def get_sankey_figure(selected_countries, path=PAGE3_PATH, as_json=False):
+    # Country order matters here since it decides the colors
+    key = make_key("sankey", file_fingerprint(path), tuple(selected_countries))
+    return get_figure_cache().get_or_build(
+        key, lambda: build_sankey_figure(load_sankey_data(path), list(selected_countries)), as_json
+    )
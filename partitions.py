@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+import instrumentation
+from config import PAGE1_PATH, PAGE1_PARTITIONS, PATH_RAW_OLIM, OLIM_PARTITIONS
+from data_loading import read_raw_olim
+from disk_cache import file_fingerprint, check_pinned
+
+# -------------------------
+# Year-partitioned copies of the time-series datasets
+# -------------------------
+# <root>/year=2015.<fingerprint>.parquet, year=2016.<fingerprint>.parquet, ... plus <root>/_manifest.json:
+#
+#   {"source": ..., "source_fingerprint": ..., "columns": [...], "values": {"continent": [...]},
+#    "partitions": [{"year": 2015, "file": "year=2015.<fingerprint>.parquet", "rows": ..., "bytes": ...,
+#                    "min": {"date": "2015-01-01", ...}, "max": {...}}, ...]}
+#
+# Loaders read the manifest first and open only the partitions whose min/max overlap the
+# requested years, so a narrow range reads (and holds) a fraction of the history. The copies
+# are rebuilt when the source file's content hash changes; the file names carry that hash and
+# the previous version's files are kept, so a reader still on the old manifest never opens a
+# partition of the new one (see hot_reload.py).
+#
+# ingest.py adds a month without a rebuild (append_partitioned): only the partitions of the
+# batch's years are rewritten, under a new "version" (part of their file names), and the
+# manifest lists the batches added on top of the source file. Caches of data read from the
+# partitions key on manifest["version"], which changes with every batch (the source file's
+# hash doesn't, for the raw records the batches are not written back to).
+
+MANIFEST_NAME = "_manifest.json"  # leading "_": Parquet readers skip it when scanning the folder
+
+_build_lock = threading.Lock()
+_manifests = {}  # (root, source fingerprint) -> (manifest, manifest file stamp), latest two per root
+
+
+def _stat(value):
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    return value.item() if hasattr(value, "item") else value
+
+
+def _write_partition(part, root, year, version):
+    numeric = [c for c in part.columns
+               if pd.api.types.is_numeric_dtype(part[c]) or pd.api.types.is_datetime64_any_dtype(part[c])]
+    name = f"year={int(year)}.{version}.parquet"
+    path = os.path.join(root, name)
+    tmp = f"{path}.tmp"
+    part.reset_index(drop=True).to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return {
+        "year": int(year), "file": name, "rows": int(len(part)), "bytes": os.path.getsize(path),
+        "min": {c: _stat(part[c].min()) for c in numeric},
+        "max": {c: _stat(part[c].max()) for c in numeric},
+    }
+
+
+def _publish_manifest(root, manifest, previous):
+    # Older versions' partitions go (the previous version's stay until the next write)
+    kept = {p["file"] for p in manifest["partitions"]} | {p["file"] for p in (previous or {}).get("partitions", [])}
+    for name in os.listdir(root):
+        if name.startswith("year=") and name.endswith(".parquet") and name not in kept:
+            os.remove(os.path.join(root, name))
+
+    tmp = os.path.join(root, MANIFEST_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(root, MANIFEST_NAME))
+    return manifest
+
+
+def write_partitioned(df, root, years, source, source_fingerprint, distinct_columns=()):
+    # years: a Series (aligned with df) with the partition year of every row
+    os.makedirs(root, exist_ok=True)
+    previous = read_manifest(root)
+    partitions = [_write_partition(part, root, year, source_fingerprint)
+                  for year, part in df.groupby(years.astype(int), sort=True)]
+    manifest = {
+        "source": source, "source_fingerprint": source_fingerprint, "version": source_fingerprint,
+        "columns": list(df.columns),
+        "values": {c: sorted(df[c].dropna().unique().tolist()) for c in distinct_columns},
+        "partitions": partitions, "appended": [],
+    }
+    return _publish_manifest(root, manifest, previous)
+
+
+def append_partitioned(df, root, years, batch, source_fingerprint=None):
+    # Adds the rows of a batch to the partitions of their years. batch: an id of the batch's
+    # content; source_fingerprint: the source file's new hash when the batch was written to it
+    # too (page1_final.csv), None when it wasn't (the raw records).
+    with _build_lock:
+        previous = read_manifest(root)
+        if previous is None:
+            raise FileNotFoundError(f"no partitions in {root} to append to")
+        if any(a["batch"] == batch for a in previous.get("appended", [])):
+            # Already there (an append retried after a later step failed)
+            return previous
+        version = hashlib.sha256(f"{manifest_version(previous)}+{batch}".encode("utf-8")).hexdigest()[:16]
+        partitions = {p["year"]: p for p in previous["partitions"]}
+        for year, rows in df.groupby(years.astype(int), sort=True):
+            rows = rows[previous["columns"]]
+            old = partitions.get(int(year))
+            part = pd.concat([pd.read_parquet(os.path.join(root, old["file"])), rows], ignore_index=True) \
+                if old is not None else rows
+            partitions[int(year)] = _write_partition(part, root, year, version)
+
+        values = {c: sorted(set(v) | set(df[c].dropna().unique().tolist())) for c, v in previous["values"].items()}
+        manifest = dict(previous, version=version, values=values,
+                        partitions=[partitions[y] for y in sorted(partitions)],
+                        appended=previous.get("appended", []) + [{"batch": batch, "rows": int(len(df))}])
+        if source_fingerprint is not None:
+            manifest["source_fingerprint"] = source_fingerprint
+        return _publish_manifest(root, manifest, previous)
+
+
+def manifest_version(manifest):
+    # Manifests written before the batches existed carry only the source hash
+    return manifest.get("version", manifest["source_fingerprint"])
+
+
+def _manifest_stamp(root):
+    try:
+        stat = os.stat(os.path.join(root, MANIFEST_NAME))
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def read_manifest(root):
+    path = os.path.join(root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def ensure_partitioned(source, root, load_fn, year_of, distinct_columns=()):
+    # Returns the manifest, (re)building the partitions if the source changed since the last build
+    fingerprint = file_fingerprint(source)
+    entry = _manifests.get((root, fingerprint))
+    if entry is not None:
+        manifest, stamp = entry
+        if _manifest_stamp(root) == stamp:
+            return manifest
+
+    with _build_lock:
+        stamp = _manifest_stamp(root)
+        manifest = read_manifest(root)
+        if manifest is not None and manifest["source_fingerprint"] != fingerprint and entry is not None:
+            # The files moved on since this (pinned) version was read; its partitions are kept
+            return entry[0]
+        if manifest is None or manifest["source_fingerprint"] != fingerprint:
+            check_pinned([source])
+            with instrumentation.timed(f"partitions.build.{os.path.basename(root)}"):
+                df = load_fn()
+                check_pinned([source])
+                manifest = write_partitioned(df, root, year_of(df), source, fingerprint, distinct_columns)
+            stamp = _manifest_stamp(root)
+        for old in [k for k in _manifests if k[0] == root and k[1] != fingerprint][:-1]:
+            del _manifests[old]
+        _manifests[(root, fingerprint)] = (manifest, stamp)
+    return manifest
+
+
+def overlapping_partitions(manifest, year_range):
+    return [p for p in manifest["partitions"] if year_range[0] <= p["year"] <= year_range[1]]
+
+
+def partition_paths(root, manifest, year_range):
+    return [os.path.join(root, p["file"]) for p in overlapping_partitions(manifest, year_range)]
+
+
+def load_year_range(root, manifest, year_range, columns=None):
+    parts = overlapping_partitions(manifest, year_range)
+    instrumentation.incr("partitions.read", len(parts))
+    instrumentation.incr("partitions.skipped", len(manifest["partitions"]) - len(parts))
+    instrumentation.incr("partitions.bytes_read", sum(p["bytes"] for p in parts))
+    if not parts:
+        return pd.DataFrame(columns=columns or manifest["columns"])
+    frames = [pd.read_parquet(os.path.join(root, p["file"]), columns=columns) for p in parts]
+    return pd.concat(frames, ignore_index=True)
+
+
+def manifest_years(manifest):
+    years = [p["year"] for p in manifest["partitions"]]
+    return min(years), max(years)
+
+
+# -------------------------
+# The partitioned datasets
+# -------------------------
+
+def trends_manifest(path=PAGE1_PATH, root=PAGE1_PARTITIONS):
+    return ensure_partitioned(
+        path, root, lambda: pd.read_csv(path, parse_dates=["date"]),
+        year_of=lambda df: df["date"].dt.year, distinct_columns=("continent",),
+    )
+
+
+def load_trends_range(year_range, path=PAGE1_PATH, root=PAGE1_PARTITIONS):
+    # The rows of page1_final.csv whose date falls in year_range (the years filter_trends keeps)
+    return load_year_range(root, trends_manifest(path, root), year_range)
+
+
+def olim_manifest(raw_path=PATH_RAW_OLIM, root=OLIM_PARTITIONS):
+    # The raw file plus the batches ingest.py appended since (manifest["appended"])
+    return ensure_partitioned(
+        raw_path, root, lambda: read_raw_olim(raw_path).drop(columns=["date"]),
+        year_of=lambda df: df["year_aliya"],
+    )
+
+
+def olim_version(raw_path=PATH_RAW_OLIM, root=OLIM_PARTITIONS):
+    return manifest_version(olim_manifest(raw_path, root))
+
+
+def append_olim_records(records, batch, raw_path=PATH_RAW_OLIM, root=OLIM_PARTITIONS):
+    olim_manifest(raw_path, root)  # built from the raw file first if it never was
+    df = records.drop(columns=["date"], errors="ignore")
+    return append_partitioned(df, root, df["year_aliya"], batch)
+
+
+def append_trends_rows(rows, previous_fingerprint, page1_path=PAGE1_PATH, root=PAGE1_PARTITIONS):
+    # rows: what ingest.py appended to page1_final.csv (already written); previous_fingerprint: the
+    # file's hash before. Partitions of another version are left alone: the next load rebuilds them.
+    manifest = read_manifest(root)
+    if manifest is None or manifest["source_fingerprint"] != previous_fingerprint:
+        return None
+    fingerprint = file_fingerprint(page1_path)
+    return append_partitioned(rows, root, rows["date"].dt.year, fingerprint, source_fingerprint=fingerprint)
+
+
+if __name__ == "__main__":
+    for manifest in (trends_manifest(), olim_manifest()):
+        print(manifest["source"])
+        for p in manifest["partitions"]:
+            print(f"  {p['file']}: {p['rows']:,} rows, {p['bytes'] / 1024:.0f} KB")
@@ -0,0 +1,34 @@
+import plotly.io as pio
+
+import instrumentation
+
+# -------------------------
+# Figure (de)serialization
+# -------------------------
+# plotly >= 6 writes numeric NumPy arrays as base64 typed arrays ({"dtype": "f8", "bdata": ...}),
+# which plotly.js >= 2.28 (bundled with the Streamlit versions we support) decodes natively.
+# That only happens for arrays that are still NumPy when serialized, so builders should keep
+# x/y/size/customdata numeric and format numbers in the hovertemplate (d3-format) instead of
+# precomputing strings.
+#
+# orjson is used when installed; st.plotly_chart goes through plotly.io as well, so setting the
+# default engine here speeds up Streamlit's own serialization too.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_ENGINE = "orjson" if orjson is not None else "json"
+pio.json.config.default_engine = JSON_ENGINE
+
+
+def figure_to_json(fig, name="figure"):
+    with instrumentation.timed(f"serialize.{name}"):
+        payload = pio.to_json(fig, validate=False, engine=JSON_ENGINE)
+    instrumentation.incr(f"serialize.{name}.bytes", len(payload))
+    return payload
+
+
+def figure_from_json(payload):
+    return pio.from_json(payload, skip_invalid=True, engine=JSON_ENGINE)
@@ -0,0 +1,37 @@
+import logging
+import os
+import sys
+
+import api_server
+import hot_reload
+import warmup
+
+# -------------------------
+# Launcher: warm-up from process start, then the Streamlit server in the same process
+# -------------------------
+# `streamlit run app.py` only executes app.py when the first session connects, so a warm-up
+# started from the script waits for a visitor - and a load balancer waiting for readiness before
+# sending one waits forever. This starts the warm-up (and the hot reload watcher when enabled)
+# right away, serves the readiness check at http://VIZ_API_HOST:VIZ_API_PORT/ready (200 once the
+# warm-up is done, 503 before; the whole API when VIZ_API=1), and then runs Streamlit here, so
+# the sessions use the caches the warm-up filled.
+#
+#   python serve.py [streamlit run options, e.g. --server.port 8501 --server.headless true]
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def main(streamlit_args):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    warmup.start_background_warmup()
+    api_server.start_background_server(readiness_only=not api_server.API_ENABLED)
+    if hot_reload.HOT_RELOAD_ENABLED:
+        hot_reload.start_background_watcher()
+
+    from streamlit.web import cli as stcli
+    sys.argv = ["streamlit", "run", APP_PATH] + list(streamlit_args)
+    return stcli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from config import PAGE1_PATH, PAGE2_PATH, PATH_SUMMARY
+from disk_cache import file_fingerprint
+
+# -------------------------
+# Home page summary sidecar
+# -------------------------
+# A few headline numbers (totals, top countries, top yeshuvim, olim per year) computed once when
+# the datasets are built (ingest.py writes it next to them, or `python summary.py`) and read by
+# the home page as a small JSON file. "dataset_checksum" is the content hash of the page files it
+# was computed from: when it doesn't match the current files the sidecar is stale, and the home
+# page recomputes the numbers (from the aggregated page files, not the raw records) instead.
+
+SUMMARY_VERSION = 1
+SUMMARY_TOP_N = 5
+
+logger = logging.getLogger(__name__)
+
+
+def dataset_checksum(page1_path=PAGE1_PATH, page2_path=PAGE2_PATH):
+    return file_fingerprint(page1_path, page2_path)
+
+
+def build_summary(page1_path=PAGE1_PATH, page2_path=PAGE2_PATH, top_n=SUMMARY_TOP_N, tables=None):
+    # tables: (page1, page2) frames with the files' contents, when the caller has them already
+    # (page1 only needs date / erez_moza / monthly_count, e.g. ingest.py's monthly counts)
+    if tables is None:
+        page1 = pd.read_csv(page1_path, usecols=["date", "erez_moza", "monthly_count"], parse_dates=["date"])
+        page2 = pd.read_csv(page2_path, usecols=["hebrew_name", "total_olim"])
+    else:
+        page1, page2 = tables
+    # page2 has one row per (yeshuv, map polygon): a yeshuv's total repeats on each of its rows
+    page2 = page2.drop_duplicates(subset=["hebrew_name"])
+
+    by_country = page1.groupby("erez_moza")["monthly_count"].sum().sort_values(ascending=False, kind="stable")
+    by_year = page1.groupby(page1["date"].dt.year)["monthly_count"].sum()
+    by_yeshuv = page2.set_index("hebrew_name")["total_olim"].sort_values(ascending=False, kind="stable")
+
+    return {
+        "version": SUMMARY_VERSION,
+        "dataset_checksum": dataset_checksum(page1_path, page2_path),
+        "total_olim": int(page1["monthly_count"].sum()),
+        "years": [int(by_year.index.min()), int(by_year.index.max())],
+        "per_year": {str(year): int(n) for year, n in by_year.items()},
+        "top_countries": [{"name": name, "olim": int(n)} for name, n in by_country.head(top_n).items()],
+        "top_yeshuvim": [{"name": name, "olim": int(n)} for name, n in by_yeshuv.head(top_n).items()],
+    }
+
+
+def write_summary(path=PATH_SUMMARY, page1_path=PAGE1_PATH, page2_path=PAGE2_PATH, tables=None):
+    summary = build_summary(page1_path, page2_path, tables=tables)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return summary
+
+
+def read_summary(path=PATH_SUMMARY):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        summary = json.load(f)
+    return summary if summary.get("version") == SUMMARY_VERSION else None
+
+
+def load_summary(path=PATH_SUMMARY, page1_path=PAGE1_PATH, page2_path=PAGE2_PATH):
+    # Returns (summary, fresh). A missing or stale sidecar is replaced by a live computation.
+    summary = read_summary(path)
+    if summary is not None and summary["dataset_checksum"] == dataset_checksum(page1_path, page2_path):
+        return summary, True
+    logger.warning("Summary sidecar %s is %s; computing it from the page files",
+                   path, "missing" if summary is None else "stale")
+    return build_summary(page1_path, page2_path), False
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        _, fresh = load_summary()
+        print("up to date" if fresh else "stale or missing: run `python summary.py`")
+        sys.exit(0 if fresh else 1)
+    print(json.dumps(write_summary(), ensure_ascii=False, indent=2))
@@ -0,0 +1,199 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from config import PATH_GEOJSON, PAGE1_PATH, PAGE2_PATH, PAGE3_PATH, PATH_DISTRICTS
+from data_loading import load_trends_data, load_city_profiles, load_sankey_data, load_geojson
+from districts import load_districts
+from partitions import trends_manifest
+from client_trends import publish_trends_payload
+from country_selection import load_country_index
+from city_brush import publish_city_payload
+from country_similarity import load_similarity_index
+from waves import load_waves
+from page_builders import (
+    default_trends_state, get_trends_figure, get_country_map, default_sankey_countries, get_sankey_figure,
+    get_city_lines_figure, get_city_map, DEFAULT_MAP_VIEW,
+)
+
+# -------------------------
+# Cache warm-up
+# -------------------------
+# Runs every task on a thread pool: the caches it fills (data_loading, figure cache, disk cache)
+# live in this process, which a process pool could not share. Stages run in order because the
+# figures need the datasets; the tasks inside a stage run in parallel.
+#
+#   VIZ_WARMUP=1                -> start the warm-up in the background on the first script run
+#                                  (`streamlit run app.py`; `python serve.py` starts it at process
+#                                  start instead and answers readiness checks at /ready)
+#   VIZ_WARMUP_WORKERS          -> pool size (default 4)
+#   VIZ_WARMUP_READY_FILE=path  -> written (with the timing report) once the warm-up is done,
+#                                  for load balancer readiness checks
+#
+# `python warmup.py` runs it in the foreground, e.g. to fill a shared VIZ_DISK_CACHE before a deploy.
+
+WARMUP_ENABLED = os.environ.get("VIZ_WARMUP") == "1"
+WARMUP_WORKERS = int(os.environ.get("VIZ_WARMUP_WORKERS", "4"))
+WARMUP_READY_FILE = os.environ.get("VIZ_WARMUP_READY_FILE", "")
+
+STAGE_DATA = 0
+STAGE_FIGURES = 1
+
+logger = logging.getLogger(__name__)
+
+_tasks = []  # (stage, name, fn)
+_report = []
+_report_lock = threading.Lock()
+_ready = threading.Event()
+_started = False
+_started_lock = threading.Lock()
+
+
+def warmup_task(name, stage):
+    def register(fn):
+        _tasks.append((stage, name, fn))
+        return fn
+    return register
+
+
+# --- Stage 0: datasets and indexes ---
+
+@warmup_task("page1_data", STAGE_DATA)
+def _warm_trends_data():
+    load_trends_data(PAGE1_PATH)
+
+
+@warmup_task("page1_indexes", STAGE_DATA)
+def _warm_trends_indexes():
+    trends_manifest(PAGE1_PATH)
+    load_country_index(PAGE1_PATH)
+    load_waves(PAGE1_PATH)
+    publish_trends_payload(PAGE1_PATH)
+
+
+@warmup_task("page2_profiles", STAGE_DATA)
+def _warm_city_profiles():
+    load_city_profiles(PAGE2_PATH)
+
+
+@warmup_task("page2_brush_payload", STAGE_DATA)
+def _warm_city_payload():
+    publish_city_payload(PAGE2_PATH)
+
+
+@warmup_task("page2_geojson", STAGE_DATA)
+def _warm_geojson():
+    load_geojson(PATH_GEOJSON)
+
+
+@warmup_task("page2_districts", STAGE_DATA)
+def _warm_districts():
+    load_districts(PATH_DISTRICTS)
+
+
+@warmup_task("page3_data", STAGE_DATA)
+def _warm_sankey_data():
+    load_sankey_data(PAGE3_PATH)
+    load_similarity_index(PAGE3_PATH)
+
+
+# --- Stage 1: default-state figures ---
+
+@warmup_task("page1_default_figure", STAGE_FIGURES)
+def _warm_trends_figure():
+    df_merged = load_trends_data(PAGE1_PATH)[0]
+    year_range, continents, countries, speed_ms = default_trends_state(df_merged)
+    get_trends_figure(year_range, continents, countries, speed_ms, PAGE1_PATH)
+    get_country_map(continents, countries, PAGE1_PATH)
+
+
+@warmup_task("page2_default_figures", STAGE_FIGURES)
+def _warm_city_figures():
+    get_city_map([], DEFAULT_MAP_VIEW, PAGE2_PATH, PATH_GEOJSON)
+    get_city_lines_figure([], PAGE2_PATH)
+
+
+@warmup_task("page3_default_figure", STAGE_FIGURES)
+def _warm_sankey_figure():
+    get_sankey_figure(default_sankey_countries(load_sankey_data(PAGE3_PATH)), PAGE3_PATH)
+
+
+def _run_task(stage, name, fn, label, report):
+    start = time.perf_counter()
+    error = None
+    try:
+        fn()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        logger.exception("%s task %s failed", label, name)
+    seconds = time.perf_counter() - start
+
+    instrumentation.record_timing(f"{label}.{name}", seconds)
+    entry = {"task": name, "stage": stage, "seconds": round(seconds, 4), "ok": error is None, "error": error}
+    with _report_lock:
+        report.append(entry)
+    logger.info("%s task %s finished in %.3fs%s", label, name, seconds, "" if error is None else f" ({error})")
+    return entry
+
+
+def run_tasks(max_workers=WARMUP_WORKERS, label="warmup", report=None):
+    # Every task, stage by stage. hot_reload.py also uses it to build a dataset version before
+    # it goes live: each task runs in a copy of the caller's context, so the version the caller
+    # pinned applies to the pool threads too.
+    report = [] if report is None else report
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=label) as pool:
+        for stage in sorted({t[0] for t in _tasks}):
+            futures = [pool.submit(contextvars.copy_context().run, _run_task, s, name, fn, label, report)
+                       for s, name, fn in _tasks if s == stage]
+            for future in futures:
+                future.result()
+    return report
+
+
+def run_warmup(max_workers=WARMUP_WORKERS):
+    start = time.perf_counter()
+    run_tasks(max_workers, report=_report)
+    total = time.perf_counter() - start
+
+    # Readiness means "warm-up finished"; failed tasks simply fall back to the cold path on first use
+    _ready.set()
+    report = get_report()
+    report["total_seconds"] = round(total, 4)
+    if WARMUP_READY_FILE:
+        with open(WARMUP_READY_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def start_background_warmup():
+    # Idempotent: only the first call (the first script run of this process) starts the warm-up
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    instrumentation.register_source("warmup", get_report)
+    threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def get_report():
+    with _report_lock:
+        tasks = list(_report)
+    return {"ready": _ready.is_set(), "tasks": tasks}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    result = run_warmup()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if all(t["ok"] for t in result["tasks"]) else 1)
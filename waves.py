@@ -0,0 +1,278 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import PAGE1_PATH
+from data_loading import load_trends_data
+from disk_cache import cached_load
+
+# -------------------------
+# Page 1: immigration waves
+# -------------------------
+# Every country's monthly series is compared with its own recent past, all countries at once:
+# page1_final.csv becomes one country × month matrix and every step below is a whole-matrix
+# operation (cumulative sums for the rolling windows, one flat array for the runs).
+#
+#   1. Baseline of each month: mean and standard deviation of the BASELINE_MONTHS before it
+#      (at least MIN_BASELINE_MONTHS of them, otherwise no baseline and nothing is detected).
+#      z = (count - mean) / noise, where the noise is at least the Poisson noise sqrt(mean) and
+#      at least 1 olim (so a country going from 0 to 2 olim isn't a wave).
+#   2. The months with z >= Z_ENTER are left out and the baselines computed again: a wave that
+#      lasts several months would otherwise become its own baseline and fade out after a month.
+#   3. A wave is a run of consecutive months with z >= Z_EXIT against the cleaned baseline that
+#      reaches Z_ENTER at least once and brings at least MIN_WAVE_OLIM olim above the baseline.
+#
+# Computed once per version of the file (cached_load). The page shows the waves on the animation
+# and as a table. `python waves.py` prints the largest waves; `python waves.py --bench [n]`
+# times the detector against a per-country loop on a synthetic matrix of n series.
+
+BASELINE_MONTHS = 12
+MIN_BASELINE_MONTHS = 6
+Z_ENTER = 3.0
+Z_EXIT = 2.0
+MIN_WAVE_OLIM = 50
+BENCH_SERIES = 5000
+BENCH_MONTHS = 120
+
+WAVE_COLUMNS = ["erez_moza", "continent", "start", "end", "months", "peak", "peak_count",
+                "baseline", "excess", "peak_z"]
+
+
+def monthly_matrix(df_merged):
+    # -> (countries, months as "YYYY-MM", counts [n_countries, n_months]); missing rows count 0
+    counts = df_merged.pivot_table(index="erez_moza", columns="date", values="monthly_count",
+                                   aggfunc="sum", fill_value=0)
+    full = pd.date_range(counts.columns.min(), counts.columns.max(), freq="MS")
+    counts = counts.reindex(columns=full, fill_value=0).sort_index()
+    return counts.index.tolist(), full.strftime("%Y-%m").tolist(), counts.to_numpy(float)
+
+
+def rolling_baseline(counts, use=None, window=BASELINE_MONTHS, min_months=MIN_BASELINE_MONTHS):
+    # Mean / std of the previous `window` months of every cell (only the months where `use` is
+    # True); NaN where fewer than min_months of them are left
+    weights = np.ones_like(counts) if use is None else use.astype(float)
+    pad = np.zeros((len(counts), 1))
+    n = np.hstack([pad, np.cumsum(weights, axis=1)])
+    s = np.hstack([pad, np.cumsum(counts * weights, axis=1)])
+    q = np.hstack([pad, np.cumsum(counts ** 2 * weights, axis=1)])
+
+    months = np.arange(counts.shape[1])
+    lo = np.maximum(months - window, 0)
+    n, s, q = n[:, months] - n[:, lo], s[:, months] - s[:, lo], q[:, months] - q[:, lo]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = s / n
+        var = np.maximum(q / n - mean ** 2, 0)
+    mean[n < min_months] = np.nan
+    return mean, var
+
+
+def z_scores(counts, mean, var):
+    noise = np.sqrt(np.maximum(var, np.maximum(mean, 1.0)))
+    return (counts - mean) / noise
+
+
+def detect_waves(counts, z_enter=Z_ENTER, z_exit=Z_EXIT, min_olim=MIN_WAVE_OLIM):
+    # counts: [n_series, n_months]. -> dict of arrays, one entry per wave:
+    # series, start, end (inclusive), peak (month of the highest count), peak_count, baseline
+    # (cleaned baseline at the peak), excess (olim above the baseline over the wave), peak_z
+    n_series, n_months = counts.shape
+    mean, var = rolling_baseline(counts)
+    with np.errstate(invalid="ignore"):
+        spikes = z_scores(counts, mean, var) >= z_enter
+    mean, var = rolling_baseline(counts, use=~spikes)
+    z = z_scores(counts, mean, var)
+    with np.errstate(invalid="ignore"):
+        elevated = z >= z_exit
+
+    # One flat array with a False month after every series, so runs never cross two series
+    stride = n_months + 1
+    flat = np.zeros((n_series, stride), dtype=bool)
+    flat[:, :n_months] = elevated
+    flat = flat.ravel()
+    edges = np.diff(flat.astype(np.int8), prepend=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)  # exclusive
+    if not len(starts):
+        return {k: np.array([], dtype=float) for k in
+                ("series", "start", "end", "peak", "peak_count", "baseline", "excess", "peak_z")}
+
+    def padded(values, fill):
+        out = np.full((n_series, stride), fill, dtype=float)
+        out[:, :n_months] = values
+        return np.where(flat, out.ravel(), fill)
+
+    excess = np.concatenate([[0.0], np.cumsum(padded(counts - mean, 0.0))])
+    run_excess = excess[ends] - excess[starts]
+    # Between two runs everything is -inf, so each reduceat segment only sees its own run
+    run_z = np.maximum.reduceat(padded(z, -np.inf), starts)
+    flat_counts = padded(counts, -np.inf)
+    run_peak_count = np.maximum.reduceat(flat_counts, starts)
+
+    run_of = np.cumsum(edges == 1) - 1
+    at_peak = flat & (flat_counts == run_peak_count[run_of])
+    _, first = np.unique(run_of[at_peak], return_index=True)
+    peak = np.flatnonzero(at_peak)[first]
+
+    keep = (run_z >= z_enter) & (run_excess >= min_olim)
+    starts, ends, peak = starts[keep], ends[keep], peak[keep]
+    return {
+        "series": starts // stride,
+        "start": starts % stride,
+        "end": ends % stride - 1,
+        "peak": peak % stride,
+        "peak_count": run_peak_count[keep],
+        "baseline": mean.ravel()[(peak // stride) * n_months + peak % stride],
+        "excess": run_excess[keep],
+        "peak_z": run_z[keep],
+    }
+
+
+def detect_waves_loop(counts, z_enter=Z_ENTER, z_exit=Z_EXIT, min_olim=MIN_WAVE_OLIM):
+    # The same detector one series and one month at a time (reference for the benchmark)
+    def baseline(series, use):
+        stats = []
+        for t in range(len(series)):
+            past = [series[i] for i in range(max(t - BASELINE_MONTHS, 0), t) if use[i]]
+            if len(past) < MIN_BASELINE_MONTHS:
+                stats.append(None)
+                continue
+            mean = sum(past) / len(past)
+            var = max(sum(x * x for x in past) / len(past) - mean ** 2, 0)
+            stats.append((mean, max(var, mean, 1.0) ** 0.5))
+        return stats
+
+    def z_of(x, stat):
+        return None if stat is None else (x - stat[0]) / stat[1]
+
+    waves = {k: [] for k in ("series", "start", "end", "peak", "peak_count", "baseline", "excess", "peak_z")}
+    for s, series in enumerate(counts.tolist()):
+        first = baseline(series, [True] * len(series))
+        use = [not (z is not None and z >= z_enter) for z in (z_of(x, st) for x, st in zip(series, first))]
+        stats = baseline(series, use)
+        t = 0
+        while t < len(series):
+            z = z_of(series[t], stats[t])
+            if z is None or z < z_exit:
+                t += 1
+                continue
+            start = t
+            while t < len(series) and stats[t] is not None and z_of(series[t], stats[t]) >= z_exit:
+                t += 1
+            run = range(start, t)
+            excess = sum(series[i] - stats[i][0] for i in run)
+            peak_z = max(z_of(series[i], stats[i]) for i in run)
+            if peak_z < z_enter or excess < min_olim:
+                continue
+            peak = max(run, key=lambda i: (series[i], -i))
+            for key, value in (("series", s), ("start", start), ("end", t - 1), ("peak", peak),
+                               ("peak_count", series[peak]), ("baseline", stats[peak][0]),
+                               ("excess", excess), ("peak_z", peak_z)):
+                waves[key].append(value)
+    return {k: np.array(v, dtype=float) for k, v in waves.items()}
+
+
+def build_wave_table(df_merged):
+    # One row per wave, largest excess first
+    countries, months, counts = monthly_matrix(df_merged)
+    waves = detect_waves(counts)
+    continent = df_merged.groupby("erez_moza")["continent"].first()
+    series = waves["series"].astype(int)
+    table = pd.DataFrame({
+        "erez_moza": [countries[i] for i in series],
+        "continent": [continent.get(countries[i]) for i in series],
+        "start": [months[i] for i in waves["start"].astype(int)],
+        "end": [months[i] for i in waves["end"].astype(int)],
+        "months": (waves["end"] - waves["start"] + 1).astype(int),
+        "peak": [months[i] for i in waves["peak"].astype(int)],
+        "peak_count": waves["peak_count"].astype(int),
+        "baseline": waves["baseline"].round(1),
+        "excess": waves["excess"].round().astype(int),
+        "peak_z": waves["peak_z"].round(1),
+    }, columns=WAVE_COLUMNS)
+    return table.sort_values(["excess", "erez_moza"], ascending=[False, True], kind="stable").reset_index(drop=True)
+
+
+def load_waves(path=PAGE1_PATH):
+    return cached_load("trend_waves", [path], lambda: build_wave_table(load_trends_data(path)[0]))
+
+
+def waves_in_range(waves, year_range, countries=None):
+    # The waves overlapping the year range (of the given countries)
+    mask = (waves["end"] >= f"{year_range[0]}-01") & (waves["start"] <= f"{year_range[1]}-12")
+    if countries is not None:
+        mask &= waves["erez_moza"].isin(countries)
+    return waves[mask]
+
+
+def wave_cells(waves):
+    # (erez_moza, month_str) of every month inside a wave - what the animation marks
+    rows = []
+    for country, start, end in waves[["erez_moza", "start", "end"]].itertuples(index=False):
+        for month in pd.period_range(start, end, freq="M").strftime("%Y-%m"):
+            rows.append((country, month))
+    return pd.DataFrame(rows, columns=["erez_moza", "month_str"])
+
+
+# -------------------------
+# Benchmark on a synthetic matrix
+# -------------------------
+
+def synthetic_matrix(n_series, n_months=BENCH_MONTHS, seed=0):
+    # Poisson series with log-normal rates and a few injected waves (rate × 3..10 for 1..6 months)
+    rng = np.random.default_rng(seed)
+    rate = np.exp(rng.normal(2.5, 1.5, size=(n_series, 1))) * np.ones((1, n_months))
+    injected = []
+    for s in np.flatnonzero(rng.random(n_series) < 0.3):
+        start = int(rng.integers(MIN_BASELINE_MONTHS + BASELINE_MONTHS, n_months - 6))
+        length = int(rng.integers(1, 7))
+        rate[s, start:start + length] *= rng.uniform(3, 10)
+        injected.append((s, start, start + length - 1))
+    return rng.poisson(rate).astype(float), injected
+
+
+def bench(n_series=BENCH_SERIES, loop_series=None):
+    counts, injected = synthetic_matrix(n_series)
+    start = time.perf_counter()
+    waves = detect_waves(counts)
+    batched = time.perf_counter() - start
+
+    # The loop is slow: time it on a slice and scale up
+    loop_series = min(n_series, loop_series or n_series)
+    start = time.perf_counter()
+    reference = detect_waves_loop(counts[:loop_series])
+    loop = (time.perf_counter() - start) * n_series / loop_series
+
+    in_slice = waves["series"] < loop_series
+    same = all(np.allclose(waves[k][in_slice], reference[k]) for k in reference) \
+        if in_slice.sum() == len(reference["series"]) else False
+
+    found = set(zip(waves["series"].astype(int).tolist(), waves["start"].astype(int).tolist(),
+                    waves["end"].astype(int).tolist()))
+    by_series = {}
+    for s, a, b in found:
+        by_series.setdefault(s, []).append((a, b))
+    hits = sum(any(a <= e and b >= st for a, b in by_series.get(s, [])) for s, st, e in injected)
+    return {
+        "series": n_series, "months": counts.shape[1], "waves": len(waves["series"]),
+        "batched_seconds": round(batched, 4), "loop_seconds": round(loop, 3),
+        "loop_measured_on": loop_series, "speedup": round(loop / batched, 1) if batched else None,
+        "same_waves_as_loop": bool(same),
+        "injected_waves_found": f"{hits}/{len(injected)}",
+    }
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        sizes = [int(a) for a in sys.argv[1:] if a.isdigit()] or [BENCH_SERIES]
+        ok = True
+        for n in sizes:
+            report = bench(n, loop_series=1000)
+            ok &= report["same_waves_as_loop"]
+            print(", ".join(f"{k}={v}" for k, v in report.items()))
+        sys.exit(0 if ok else 1)
+
+    waves = load_waves()
+    print(f"{len(waves)} waves")
+    print(waves.head(int(sys.argv[1]) if len(sys.argv) > 1 else 20).to_string(index=False))